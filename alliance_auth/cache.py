@@ -0,0 +1,72 @@
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache(object):
+    """
+    Bounded, thread-safe, in-process LRU cache with per-entry expiry.
+    Stored values are shared between all callers so must never be mutated.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return None
+            # re-insert to mark as most recently used
+            self._data[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def get_many(self, keys):
+        results = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                results[key] = value
+        return results
+
+    def set(self, key, value, timeout=None):
+        if self.max_size <= 0:
+            return
+        expires = time.time() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def set_many(self, data, timeout=None):
+        for key, value in data.items():
+            self.set(key, value, timeout=timeout)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
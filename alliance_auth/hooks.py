@@ -38,11 +38,16 @@ from django.apps import apps
 from django.utils.module_loading import module_has_submodule
 
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
 _hooks = {}  # Dict of Name: Fn's of registered hooks
 
+_hook_instances = {}  # Dict of Name: instances created by the registered hook functions
+
+_hook_instances_lock = threading.Lock()
+
 _all_hooks_registered = False  # If all hooks have been searched for and registered yet
 
 
@@ -71,6 +76,8 @@ def register(name, fn=None):
 
         logger.debug('Registering hook %s for function %s' % (name, fn))
         _hooks[name].append(func)
+        # instances are created again with the new hook included
+        _hook_instances.pop(name, None)
 
     if fn is None:
         # Behave like a decorator
@@ -125,3 +132,19 @@ def get_hooks(name):
     register_all_hooks()
     return _hooks.get(name, [])
 
+
+
+def get_hook_instances(name):
+    """
+    Get the objects returned by all the hook functions for the given hook name. The functions
+    are only called once per process, so the returned objects must not hold per request state.
+    :param name: str name of the hook to get the objects for
+    :return: list of hook objects
+    """
+    instances = _hook_instances.get(name)
+    if instances is None:
+        with _hook_instances_lock:
+            instances = _hook_instances.get(name)
+            if instances is None:
+                instances = _hook_instances[name] = [fn() for fn in get_hooks(name)]
+    return instances
@@ -0,0 +1,21 @@
+from __future__ import unicode_literals
+
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+
+
+def get_page(model_list, page_num, per_page):
+    """
+    Get a page of a list, falling back to the first or last page for invalid page numbers
+    :param model_list: list or queryset to paginate
+    :param page_num: requested page number, usually straight from the query string
+    :param per_page: number of items on each page
+    :return: django.core.paginator.Page
+    """
+    p = Paginator(model_list, per_page)
+    try:
+        page = p.page(page_num)
+    except PageNotAnInteger:
+        page = p.page(1)
+    except EmptyPage:
+        page = p.page(p.num_pages)
+    return page
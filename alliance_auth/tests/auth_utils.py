@@ -65,7 +65,7 @@ class AuthUtils:
         pre_save.connect(pre_save_auth_state, sender=AuthServicesInfo)
 
     @classmethod
-    def add_main_character(cls, user, name, character_id, corp_id='', corp_name='', corp_ticker='', alliance_id='',
+    def add_main_character(cls, user, name, character_id, corp_id=0, corp_name='', corp_ticker='', alliance_id=None,
                            alliance_name=''):
         EveCharacter.objects.create(
             character_id=character_id,
@@ -0,0 +1,8 @@
+from __future__ import unicode_literals
+
+# for tests which need a working cache, as the test settings use a dummy cache
+LOCMEM_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
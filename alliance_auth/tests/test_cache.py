@@ -0,0 +1,41 @@
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+from django.test import TestCase
+
+from alliance_auth.cache import LocalCache
+
+
+class LocalCacheTestCase(TestCase):
+    def test_lru_eviction(self):
+        lru = LocalCache(2, 60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')  # b is now least recently used
+        lru.set('c', 3)
+
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(3, lru.get('c'))
+        self.assertEqual({'size': 2, 'hits': 3, 'misses': 1, 'evictions': 1}, lru.stats())
+
+    @mock.patch('alliance_auth.cache.time')
+    def test_expiry(self, time):
+        time.time.return_value = 1000
+        lru = LocalCache(10, 60)
+        lru.set('a', 1)
+
+        time.time.return_value = 1061
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(0, lru.stats()['size'])
+
+    def test_disabled(self):
+        lru = LocalCache(0, 60)
+        lru.set('a', 1)
+        self.assertIsNone(lru.get('a'))
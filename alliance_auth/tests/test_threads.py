@@ -0,0 +1,64 @@
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+import threading
+import time
+from multiprocessing import TimeoutError
+
+from django.test import TestCase
+
+from alliance_auth.threads import thread_map
+
+
+@mock.patch('alliance_auth.threads.connection')
+class ThreadMapTestCase(TestCase):
+    def test_threaded_in_order(self, connection):
+        connection.in_atomic_block = False
+        threads = set()
+
+        def square(n):
+            threads.add(threading.current_thread())
+            time.sleep(0.01)
+            return n * n
+
+        self.assertEqual(thread_map(square, range(6), 3), [0, 1, 4, 9, 16, 25])
+        self.assertNotIn(threading.current_thread(), threads)
+        # worker threads close their own connections
+        self.assertEqual(connection.close.call_count, 6)
+
+    def test_serial_in_transaction(self, connection):
+        connection.in_atomic_block = True
+        threads = set()
+
+        def call(n):
+            threads.add(threading.current_thread())
+            return n
+
+        self.assertEqual(thread_map(call, [1, 2], 2), [1, 2])
+        self.assertEqual(threads, {threading.current_thread()})
+        self.assertFalse(connection.close.called)
+
+        # unless the calls don't touch the database
+        threads.clear()
+        self.assertEqual(thread_map(call, [1, 2], 2, uses_db=False), [1, 2])
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_timeout(self, connection):
+        connection.in_atomic_block = False
+
+        def call(n):
+            time.sleep(n)
+            return n
+
+        start = time.time()
+        results = thread_map(call, [1, 0], 2, timeout=0.1, on_timeout=lambda n, e: e)
+
+        self.assertLess(time.time() - start, 1)
+        self.assertIsInstance(results[0], TimeoutError)
+        self.assertEqual(results[1], 0)
@@ -0,0 +1,58 @@
+from __future__ import unicode_literals
+
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from django.db import connection
+
+
+def thread_map(func, items, workers, uses_db=True, timeout=None, on_timeout=None):
+    """
+    Call func for each item using a bounded pool of worker threads, each closing its own database
+    connection when done. Calls are made in this thread when there is only one item or worker, or when
+    func uses the database from inside a transaction whose changes worker threads couldn't see.
+    :param func: callable taking a single item
+    :param items: iterable of items
+    :param workers: maximum number of worker threads
+    :param uses_db: whether func uses the database
+    :param timeout: optional seconds all threaded calls are given to complete, from when they are started
+    :param on_timeout: callable taking an item and the TimeoutError, giving the result of a call which didn't
+    complete in time. Required with timeout.
+    :return: list of results in item order
+    """
+    items = list(items)
+    if len(items) <= 1 or workers <= 1 or (uses_db and connection.in_atomic_block):
+        # worker threads couldn't see changes not yet committed by this connection
+        return [func(item) for item in items]
+
+    def _call(item):
+        try:
+            return func(item)
+        finally:
+            # each thread opens its own connection
+            connection.close()
+
+    pool = ThreadPool(min(workers, len(items)))
+    if timeout is None:
+        try:
+            return pool.map(_call, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    pending = [(item, pool.apply_async(_call, (item,))) for item in items]
+    pool.close()
+    deadline = time.time() + timeout
+    results = []
+    timed_out = False
+    for item, result in pending:
+        try:
+            results.append(result.get(max(0, deadline - time.time())))
+        except TimeoutError as e:
+            results.append(on_timeout(item, e))
+            timed_out = True
+    if not timed_out:
+        # calls which timed out are left to finish in their threads
+        pool.join()
+    return results
@@ -21,7 +21,7 @@ from alliance_auth import NAME
 
 admin.site.site_header = NAME
 
-from alliance_auth.hooks import get_hooks
+from alliance_auth.hooks import get_hook_instances
 
 # Functional/Untranslated URL's
 urlpatterns = [
@@ -214,7 +214,6 @@ urlpatterns += i18n_patterns(
 )
 
 # Append hooked service urls
-services = get_hooks('services_hook')
-for svc in services:
-    urlpatterns += svc().urlpatterns
+for svc in get_hook_instances('services_hook'):
+    urlpatterns += svc.urlpatterns
 
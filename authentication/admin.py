@@ -6,8 +6,7 @@ from django.contrib.auth.models import User
 from django.utils.text import slugify
 
 from authentication.models import AuthServicesInfo
-from eveonline.models import EveCharacter
-from alliance_auth.hooks import get_hooks
+from alliance_auth.hooks import get_hook_instances
 from services.hooks import ServicesHook
 
 
@@ -16,12 +15,7 @@ class AuthServicesInfoManager(admin.ModelAdmin):
 
     @staticmethod
     def main_character(obj):
-        if obj.main_char_id:
-            try:
-                return EveCharacter.objects.get(character_id=obj.main_char_id)
-            except EveCharacter.DoesNotExist:
-                pass
-        return None
+        return obj.main_char
 
     @staticmethod
     def has_delete_permission(request, obj=None):
@@ -33,9 +27,10 @@ class AuthServicesInfoManager(admin.ModelAdmin):
 
     search_fields = [
         'user__username',
-        'main_char_id',
+        'main_char__character_name',
     ]
     list_display = ('user', 'main_character')
+    list_select_related = ('user', 'main_char')
 
 
 def make_service_hooks_update_groups_action(service):
@@ -75,8 +70,7 @@ class UserAdmin(BaseUserAdmin):
     def get_actions(self, request):
         actions = super(BaseUserAdmin, self).get_actions(request)
 
-        for hook in get_hooks('services_hook'):
-            svc = hook()
+        for svc in get_hook_instances('services_hook'):
             # Check update_groups is redefined/overloaded
             if svc.update_groups.__module__ != ServicesHook.update_groups.__module__:
                 action = make_service_hooks_update_groups_action(svc)
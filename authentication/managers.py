@@ -20,6 +20,7 @@ class AuthServicesInfoManager:
             authserviceinfo = AuthServicesInfo.objects.get(user=user)
             authserviceinfo.main_char_id = char_id
             authserviceinfo.save(update_fields=['main_char_id'])
+            UserState.clear_auth_info(user)
             logger.info("Updated user %s main character to id %s" % (user, char_id))
         else:
             logger.error("Failed to update user %s main character id to %s: user does not exist." % (user, char_id))
@@ -38,6 +39,8 @@ class UserState:
     def __init__(self):
         pass
 
+    AUTH_INFO_CACHE = '_auth_info_cache'
+
     MEMBER_STATE = MEMBER_STATE
     BLUE_STATE = BLUE_STATE
     NONE_STATE = NONE_STATE
@@ -58,18 +61,41 @@ class UserState:
     def none_state(cls, user):
         return cls.state_required(user, [cls.NONE_STATE])
 
+    @classmethod
+    def get_auth_info(cls, user):
+        """
+        Get the users AuthServicesInfo with their main character, loaded once
+        and then kept on the User instance for the rest of the request
+        :param user: django.contrib.auth.models.User
+        :return: AuthServicesInfo or None for anonymous users
+        """
+        if not user.is_authenticated:
+            return None
+        if not hasattr(user, cls.AUTH_INFO_CACHE):
+            auth = AuthServicesInfo.objects.select_related('main_char').get(user=user)
+            auth.user = user
+            setattr(user, cls.AUTH_INFO_CACHE, auth)
+        return getattr(user, cls.AUTH_INFO_CACHE)
+
+    @classmethod
+    def clear_auth_info(cls, user):
+        """
+        Forget the AuthServicesInfo kept on the User instance after changing it elsewhere
+        :param user: django.contrib.auth.models.User
+        """
+        if hasattr(user, cls.AUTH_INFO_CACHE):
+            delattr(user, cls.AUTH_INFO_CACHE)
+
     @classmethod
     def get_membership_state(cls, request):
         if request.user.is_authenticated:
-            auth = AuthServicesInfo.objects.get(user=request.user)
-            return {'STATE': auth.state}
+            return {'STATE': cls.get_auth_info(request.user).state}
         return {'STATE': cls.NONE_STATE}
 
-    @staticmethod
-    def state_required(user, states):
+    @classmethod
+    def state_required(cls, user, states):
         if user.is_superuser and settings.SUPERUSER_STATE_BYPASS:
             return True
         if user.is_authenticated:
-            auth = AuthServicesInfo.objects.get(user=user)
-            return auth.state in states
+            return cls.get_auth_info(user).state in states
         return False
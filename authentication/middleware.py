@@ -0,0 +1,16 @@
+from __future__ import unicode_literals
+from django.utils.functional import SimpleLazyObject
+from authentication.managers import UserState
+
+
+class AuthInfoMiddleware(object):
+    """
+    Provides the requesting users AuthServicesInfo as request.auth_info. It is loaded
+    on first use and shared with the state checks of decorators and context processors.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.auth_info = SimpleLazyObject(lambda: UserState.get_auth_info(request.user))
+        return self.get_response(request)
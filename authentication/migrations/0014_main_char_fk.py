@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 5000
+
+
+def clear_invalid_main_chars(apps, schema_editor):
+    # blank and dangling main character IDs would violate the foreign key
+    AuthServicesInfo = apps.get_model('authentication', 'AuthServicesInfo')
+    EveCharacter = apps.get_model('eveonline', 'EveCharacter')
+
+    character_ids = set(str(id) for id in EveCharacter.objects.values_list('character_id', flat=True).iterator())
+    invalid = [pk for pk, main_char_id in AuthServicesInfo.objects.exclude(main_char_id=None).values_list(
+        'pk', 'main_char_id').iterator() if main_char_id not in character_ids]
+    for i in range(0, len(invalid), BATCH_SIZE):
+        AuthServicesInfo.objects.filter(pk__in=invalid[i:i + BATCH_SIZE]).update(main_char_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eveonline', '0010_integer_eve_ids'),
+        ('authentication', '0013_service_modules'),
+    ]
+
+    # the altered tables are rewritten and locked until this completes, see docs/maintenance/upgrading.md
+    operations = [
+        migrations.AlterField(
+            model_name='authservicesinfo',
+            name='main_char_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(clear_invalid_main_chars, migrations.RunPython.noop),
+        # keep the existing column, main_char_id becomes the foreign key's attribute. Only the model state is
+        # renamed, the database just has its column type and constraint altered once.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AlterField(
+                    model_name='authservicesinfo',
+                    name='main_char_id',
+                    field=models.ForeignKey(blank=True, db_column='main_char_id', null=True,
+                                            on_delete=django.db.models.deletion.SET_NULL, related_name='+',
+                                            to='eveonline.EveCharacter', to_field='character_id'),
+                ),
+            ],
+            state_operations=[
+                migrations.RenameField(
+                    model_name='authservicesinfo',
+                    old_name='main_char_id',
+                    new_name='main_char',
+                ),
+                migrations.AlterField(
+                    model_name='authservicesinfo',
+                    name='main_char',
+                    field=models.ForeignKey(blank=True, db_column='main_char_id', null=True,
+                                            on_delete=django.db.models.deletion.SET_NULL, related_name='+',
+                                            to='eveonline.EveCharacter', to_field='character_id'),
+                ),
+            ],
+        ),
+    ]
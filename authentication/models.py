@@ -16,7 +16,8 @@ class AuthServicesInfo(models.Model):
         (MEMBER_STATE, 'Member'),
     )
 
-    main_char_id = models.CharField(max_length=64, blank=True, default="")
+    main_char = models.ForeignKey('eveonline.EveCharacter', to_field='character_id', db_column='main_char_id',
+                                  blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
     user = models.OneToOneField(User)
     state = models.CharField(blank=True, null=True, choices=STATE_CHOICES, default=NONE_STATE, max_length=10)
 
@@ -1,10 +1,12 @@
 from __future__ import unicode_literals
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from authentication.models import AuthServicesInfo
 from authentication.states import MEMBER_STATE, BLUE_STATE
 from authentication.tasks import make_member, make_blue, disable_member
+from eveonline.models import EveCharacter
+from notifications import notify
 from services.tasks import validate_services
 import logging
 
@@ -32,3 +34,14 @@ def post_save_user(sender, instance, created, *args, **kwargs):
     if created:
         AuthServicesInfo.objects.get_or_create(user=instance)
 
+
+
+@receiver(pre_delete, sender=EveCharacter)
+def pre_delete_main_character(sender, instance, *args, **kwargs):
+    # the foreign key clears the main character, so tell its owner why
+    for auth in AuthServicesInfo.objects.filter(main_char_id=instance.character_id).select_related('user'):
+        logger.info("User %s main character %s deleted. Clearing main character." % (auth.user, instance))
+        notify(auth.user, "Main Character Reset",
+               message="Your specified main character no longer has a model.\nThis could be the result of "
+                       "an invalid API.\nYour main character ID has been reset.",
+               level="warn")
@@ -1,9 +1,12 @@
 from __future__ import unicode_literals
 from services.tasks import validate_services
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, User
+from django.db.models import Q
+from celery import task
 from authentication.models import AuthServicesInfo
+from authentication.managers import UserState
 from authentication.states import MEMBER_STATE, BLUE_STATE, NONE_STATE
-from eveonline.models import EveCharacter, EveCorporationInfo
+from eveonline.models import EveCorporationInfo
 from notifications import notify
 from django.conf import settings
 import logging
@@ -11,12 +14,88 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# users processed per batch by set_states
+STATE_BATCH_SIZE = int(getattr(settings, 'AUTHENTICATION_STATE_BATCH_SIZE', 500))
+
+CORP_GROUP_PREFIX = 'Corp_'
+ALLIANCE_GROUP_PREFIX = 'Alliance_'
+
+
 def generate_corp_group_name(corpname):
-    return 'Corp_' + corpname.replace(' ', '_')
+    return CORP_GROUP_PREFIX + corpname.replace(' ', '_')
 
 
 def generate_alliance_group_name(alliancename):
-    return 'Alliance_' + alliancename.replace(' ', '_')
+    return ALLIANCE_GROUP_PREFIX + alliancename.replace(' ', '_')
+
+
+class MembershipIndex(object):
+    """
+    In memory index of the corp and alliance IDs which grant member or blue state
+    """
+    def __init__(self, corp_ids=None):
+        """
+        :param corp_ids: only index the standings of these corps, defaults to all corps
+        """
+        self.member_corp_ids = set(int(id) for id in settings.STR_CORP_IDS)
+        self.member_alliance_ids = set(int(id) for id in settings.STR_ALLIANCE_IDS)
+        corps = EveCorporationInfo.objects.all()
+        if corp_ids is not None:
+            corps = corps.filter(corporation_id__in=corp_ids)
+        self.corp_standings = dict(corps.values_list('corporation_id', 'is_blue'))
+
+    def state(self, char):
+        """
+        Determine the state a character grants its owner
+        :param char: EveCharacter or None
+        :return: state
+        """
+        if char is None:
+            return NONE_STATE
+        corp_id = int(char.corporation_id)
+        alliance_id = int(char.alliance_id) if char.alliance_id else None
+        if corp_id in self.member_corp_ids:
+            logger.debug("Character %s in member corp id %s" % (char, corp_id))
+            return MEMBER_STATE
+        elif alliance_id in self.member_alliance_ids:
+            logger.debug("Character %s in member alliance id %s" % (char, alliance_id))
+            return MEMBER_STATE
+        elif corp_id not in self.corp_standings:
+            logger.debug("No corp model for character %s corp id %s. Unable to check standings. Non-member." % (
+                char, corp_id))
+            return NONE_STATE
+        elif self.corp_standings[corp_id]:
+            logger.debug("Character %s member of blue corp id %s" % (char, corp_id))
+            return BLUE_STATE
+        else:
+            logger.debug("Character %s member of non-blue corp id %s. Non-member." % (char, corp_id))
+            return NONE_STATE
+
+
+def corp_group_name(auth):
+    """
+    Name of the corp group a user should be in for their current state
+    :param auth: AuthServicesInfo
+    :return: str or None
+    """
+    char = auth.main_char
+    if char and ((auth.state == BLUE_STATE and settings.BLUE_CORP_GROUPS) or
+                 (auth.state == MEMBER_STATE and settings.MEMBER_CORP_GROUPS)):
+        return generate_corp_group_name(char.corporation_name)
+    return None
+
+
+def alliance_group_name(auth):
+    """
+    Name of the alliance group a user should be in for their current state
+    :param auth: AuthServicesInfo
+    :return: str or None
+    """
+    char = auth.main_char
+    if char and char.alliance_name and ((auth.state == BLUE_STATE and settings.BLUE_ALLIANCE_GROUPS) or
+                                        (auth.state == MEMBER_STATE and settings.MEMBER_ALLIANCE_GROUPS)):
+        return generate_alliance_group_name(char.alliance_name)
+    return None
 
 
 def disable_member(user):
@@ -30,139 +109,143 @@ def disable_member(user):
     validate_services(user, None)
 
 
+def _swap_default_group(auth, remove_name, add_name):
+    remove_group, c = Group.objects.get_or_create(name=remove_name)
+    add_group, c = Group.objects.get_or_create(name=add_name)
+    groups = set(auth.user.groups.filter(pk__in=[remove_group.pk, add_group.pk]))
+    if remove_group in groups:
+        logger.info("Removing user %s from group %s" % (auth.user, remove_group))
+        auth.user.groups.remove(remove_group)
+    if add_group not in groups:
+        logger.info("Adding user %s to group %s" % (auth.user, add_group))
+        auth.user.groups.add(add_group)
+
+
 def make_member(auth):
     logger.debug("Ensuring user %s has member permissions and groups." % auth.user)
-    # ensure member is not blue right now
-    blue_group, c = Group.objects.get_or_create(name=settings.DEFAULT_BLUE_GROUP)
-    if blue_group in auth.user.groups.all():
-        logger.info("Removing user %s blue group" % auth.user)
-        auth.user.groups.remove(blue_group)
-    # make member
-    member_group, c = Group.objects.get_or_create(name=settings.DEFAULT_AUTH_GROUP)
-    if member_group not in auth.user.groups.all():
-        logger.info("Adding user %s to member group" % auth.user)
-        auth.user.groups.add(member_group)
+    _swap_default_group(auth, settings.DEFAULT_BLUE_GROUP, settings.DEFAULT_AUTH_GROUP)
     assign_corp_group(auth)
     assign_alliance_group(auth)
 
 
 def make_blue(auth):
     logger.debug("Ensuring user %s has blue permissions and groups." % auth.user)
-    # ensure user is not a member
-    member_group, c = Group.objects.get_or_create(name=settings.DEFAULT_AUTH_GROUP)
-    if member_group in auth.user.groups.all():
-        logger.info("Removing user %s member group" % auth.user)
-        auth.user.groups.remove(member_group)
-    # make blue
-    blue_group, c = Group.objects.get_or_create(name=settings.DEFAULT_BLUE_GROUP)
-    if blue_group not in auth.user.groups.all():
-        logger.info("Adding user %s to blue group" % auth.user)
-        auth.user.groups.add(blue_group)
+    _swap_default_group(auth, settings.DEFAULT_AUTH_GROUP, settings.DEFAULT_BLUE_GROUP)
     assign_corp_group(auth)
     assign_alliance_group(auth)
 
 
 def determine_membership_by_character(char):
-    if str(char.corporation_id) in settings.STR_CORP_IDS:
-        logger.debug("Character %s in member corp id %s" % (char, char.corporation_id))
-        return MEMBER_STATE
-    elif str(char.alliance_id) in settings.STR_ALLIANCE_IDS:
-        logger.debug("Character %s in member alliance id %s" % (char, char.alliance_id))
-        return MEMBER_STATE
-    elif not EveCorporationInfo.objects.filter(corporation_id=char.corporation_id).exists():
-        logger.debug("No corp model for character %s corp id %s. Unable to check standings. Non-member." % (
-            char, char.corporation_id))
-        return NONE_STATE
-    else:
-        corp = EveCorporationInfo.objects.get(corporation_id=char.corporation_id)
-        if corp.is_blue:
-            logger.debug("Character %s member of blue corp %s" % (char, corp))
-            return BLUE_STATE
-        else:
-            logger.debug("Character %s member of non-blue corp %s. Non-member." % (char, corp))
-            return NONE_STATE
+    return MembershipIndex(corp_ids=[char.corporation_id]).state(char)
 
 
 def determine_membership_by_user(user):
     logger.debug("Determining membership of user %s" % user)
-    auth = AuthServicesInfo.objects.get(user=user)
-    if auth.main_char_id:
-        if EveCharacter.objects.filter(character_id=auth.main_char_id).exists():
-            char = EveCharacter.objects.get(character_id=auth.main_char_id)
-            return determine_membership_by_character(char)
-        else:
-            logger.debug("Character model matching user %s main character id %s does not exist. Non-member." % (
-                user, auth.main_char_id))
-            return NONE_STATE
+    auth = AuthServicesInfo.objects.select_related('main_char').get(user=user)
+    if auth.main_char:
+        return determine_membership_by_character(auth.main_char)
     else:
         logger.debug("User %s has no main character set. Non-member." % user)
         return NONE_STATE
 
 
 def set_state(user):
-    if user.is_active:
-        state = determine_membership_by_user(user)
+    set_states([user])
+    UserState.clear_auth_info(user)
+
+
+def set_states(users):
+    """
+    Update the membership state and corp/alliance groups of many users at once
+    :param users: iterable of django.contrib.auth.models.User or a User queryset
+    :return: dict of user pk to state
+    """
+    index = MembershipIndex()
+    if hasattr(users, 'values_list'):
+        user_ids = list(users.values_list('pk', flat=True))
+        instances = {}
     else:
-        state = NONE_STATE
-    logger.debug("Assigning user %s to state %s" % (user, state))
-    auth = AuthServicesInfo.objects.get(user=user)
-    if auth.state != state:
-        auth.state = state
-        auth.save()
-        notify(user, "Membership State Change", message="You membership state has been changed to %s" % state)
-    assign_corp_group(auth)
-    assign_alliance_group(auth)
+        # keep the given instances, which may have unsaved changes such as is_active during pre_save
+        instances = dict((user.pk, user) for user in users)
+        user_ids = list(instances)
+    states = {}
+    for i in range(0, len(user_ids), STATE_BATCH_SIZE):
+        states.update(_set_states(user_ids[i:i + STATE_BATCH_SIZE], index, instances))
+    return states
+
+
+def _set_states(user_ids, index, instances):
+    auths = list(AuthServicesInfo.objects.filter(user_id__in=user_ids).select_related('user', 'main_char'))
+    for auth in auths:
+        if auth.user_id in instances:
+            auth.user = instances[auth.user_id]
+    for auth in auths:
+        state = index.state(auth.main_char) if auth.user.is_active else NONE_STATE
+        logger.debug("Assigning user %s to state %s" % (auth.user, state))
+        if auth.state != state:
+            # changing state swaps the default groups through the pre_save signal
+            auth.state = state
+            auth.save()
+            notify(auth.user, "Membership State Change", message="You membership state has been changed to %s" % state)
+
+    # reconcile corp and alliance groups as set differences against a single snapshot
+    desired = dict((auth.user_id, set(name for name in (corp_group_name(auth), alliance_group_name(auth)) if name))
+                   for auth in auths)
+    current = dict((user_id, set()) for user_id in desired)
+    for user_id, name in User.groups.through.objects.filter(user_id__in=user_ids).filter(
+            Q(group__name__startswith=CORP_GROUP_PREFIX) | Q(group__name__startswith=ALLIANCE_GROUP_PREFIX)
+    ).values_list('user_id', 'group__name'):
+        # LIKE is case insensitive on some backends
+        if name.startswith((CORP_GROUP_PREFIX, ALLIANCE_GROUP_PREFIX)):
+            current[user_id].add(name)
+    names = set().union(*desired.values()) if desired else set()
+    groups = dict((g.name, g) for g in Group.objects.filter(name__in=names | set().union(*current.values())))
+    for auth in auths:
+        add = desired[auth.user_id] - current[auth.user_id]
+        remove = current[auth.user_id] - desired[auth.user_id]
+        for name in add - set(groups):
+            groups[name], c = Group.objects.get_or_create(name=name)
+        if add:
+            logger.info("Adding user %s to groups %s" % (auth.user, ', '.join(sorted(add))))
+            auth.user.groups.add(*[groups[name] for name in add])
+        if remove:
+            logger.info("Removing user %s from old groups %s" % (auth.user, ', '.join(sorted(remove))))
+            auth.user.groups.remove(*[groups[name] for name in remove])
+    return dict((auth.user_id, auth.state) for auth in auths)
+
+
+@task
+def update_all_states():
+    """
+    Re-evaluate the membership state of every user
+    """
+    states = set_states(User.objects.all())
+    logger.info("Updated membership state of %s users" % len(states))
+
+
+def _assign_prefixed_group(auth, prefix, name):
+    """
+    Ensure the only group the user has with the given prefix is the named one
+    :param auth: AuthServicesInfo
+    :param prefix: group name prefix
+    :param name: name of the group to assign, or None to remove all
+    """
+    group = None
+    if name:
+        group, c = Group.objects.get_or_create(name=name)
+    current = set(g for g in auth.user.groups.filter(name__startswith=prefix) if g.name.startswith(prefix))
+    if group and group not in current:
+        logger.info("Adding user %s to group %s" % (auth.user, group))
+        auth.user.groups.add(group)
+    old = [g for g in current if g != group]
+    if old:
+        logger.info("Removing user %s from old groups %s" % (auth.user, ', '.join(str(g) for g in old)))
+        auth.user.groups.remove(*old)
 
 
 def assign_corp_group(auth):
-    corp_group = None
-    if auth.main_char_id:
-        if EveCharacter.objects.filter(character_id=auth.main_char_id).exists():
-            char = EveCharacter.objects.get(character_id=auth.main_char_id)
-            corpname = generate_corp_group_name(char.corporation_name)
-            if auth.state == BLUE_STATE and settings.BLUE_CORP_GROUPS:
-                logger.debug("Validating blue user %s has corp group assigned." % auth.user)
-                corp_group, c = Group.objects.get_or_create(name=corpname)
-            elif auth.state == MEMBER_STATE and settings.MEMBER_CORP_GROUPS:
-                logger.debug("Validating member %s has corp group assigned." % auth.user)
-                corp_group, c = Group.objects.get_or_create(name=corpname)
-            else:
-                logger.debug("Ensuring %s has no corp groups assigned." % auth.user)
-    if corp_group:
-        if corp_group not in auth.user.groups.all():
-            logger.info("Adding user %s to corp group %s" % (auth.user, corp_group))
-            auth.user.groups.add(corp_group)
-    for g in auth.user.groups.all():
-        if str.startswith(str(g.name), "Corp_"):
-            if g != corp_group:
-                logger.info("Removing user %s from old corpgroup %s" % (auth.user, g))
-                auth.user.groups.remove(g)
+    _assign_prefixed_group(auth, CORP_GROUP_PREFIX, corp_group_name(auth))
 
 
 def assign_alliance_group(auth):
-    alliance_group = None
-    if auth.main_char_id:
-        if EveCharacter.objects.filter(character_id=auth.main_char_id).exists():
-            char = EveCharacter.objects.get(character_id=auth.main_char_id)
-            if char.alliance_name:
-                alliancename = generate_alliance_group_name(char.alliance_name)
-                if auth.state == BLUE_STATE and settings.BLUE_ALLIANCE_GROUPS:
-                    logger.debug("Validating blue user %s has alliance group assigned." % auth.user)
-                    alliance_group, c = Group.objects.get_or_create(name=alliancename)
-                elif auth.state == MEMBER_STATE and settings.MEMBER_ALLIANCE_GROUPS:
-                    logger.debug("Validating member %s has alliance group assigned." % auth.user)
-                    alliance_group, c = Group.objects.get_or_create(name=alliancename)
-                else:
-                    logger.debug("Ensuring %s has no alliance groups assigned." % auth.user)
-            else:
-                logger.debug("User %s main character %s not in an alliance. Ensuring no alliance group assigned." % (
-                    auth.user, char))
-    if alliance_group:
-        if alliance_group not in auth.user.groups.all():
-            logger.info("Adding user %s to alliance group %s" % (auth.user, alliance_group))
-            auth.user.groups.add(alliance_group)
-    for g in auth.user.groups.all():
-        if str.startswith(str(g.name), "Alliance_"):
-            if g != alliance_group:
-                logger.info("Removing user %s from old alliance group %s" % (auth.user, g))
-                auth.user.groups.remove(g)
+    _assign_prefixed_group(auth, ALLIANCE_GROUP_PREFIX, alliance_group_name(auth))
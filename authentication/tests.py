@@ -1 +1,167 @@
-# Create your tests here.
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from alliance_auth.tests.auth_utils import AuthUtils
+
+from eveonline.models import EveCharacter, EveCorporationInfo
+from notifications.models import Notification
+
+from .context_processors import membership_state
+from .managers import UserState
+from .middleware import AuthInfoMiddleware
+from .models import AuthServicesInfo
+from .states import MEMBER_STATE, BLUE_STATE, NONE_STATE
+from .tasks import set_state, set_states, determine_membership_by_user
+
+
+@override_settings(STR_CORP_IDS=['1'], STR_ALLIANCE_IDS=['3'], MEMBER_CORP_GROUPS=True, MEMBER_ALLIANCE_GROUPS=True,
+                   BLUE_CORP_GROUPS=False, BLUE_ALLIANCE_GROUPS=False)
+class SetStateTestCase(TestCase):
+    def setUp(self):
+        EveCorporationInfo.objects.create(corporation_id=2, corporation_name='Blue Corp', corporation_ticker='BLUE',
+                                          member_count=1, is_blue=True)
+        EveCorporationInfo.objects.create(corporation_id=4, corporation_name='Neutral Corp',
+                                          corporation_ticker='NEUT', member_count=1, is_blue=False)
+
+    def make_user(self, username, character_id, corp_id, alliance_id=None, alliance_name=''):
+        user = AuthUtils.create_user(username)
+        AuthUtils.add_main_character(user, username, character_id, corp_id=corp_id, corp_name='Corp %s' % corp_id,
+                                     alliance_id=alliance_id, alliance_name=alliance_name)
+        return User.objects.get(pk=user.pk)
+
+    def group_names(self, user):
+        return set(user.groups.values_list('name', flat=True))
+
+    def test_determine_membership_by_user(self):
+        member = self.make_user('member', 11, 1)
+        alliance_member = self.make_user('alliance_member', 12, 5, alliance_id=3, alliance_name='Member Alliance')
+        blue = self.make_user('blue', 13, 2)
+        neutral = self.make_user('neutral', 14, 4)
+        unknown = self.make_user('unknown', 15, 6)
+        no_main = AuthUtils.create_user('no_main')
+
+        self.assertEqual(determine_membership_by_user(member), MEMBER_STATE)
+        self.assertEqual(determine_membership_by_user(alliance_member), MEMBER_STATE)
+        self.assertEqual(determine_membership_by_user(blue), BLUE_STATE)
+        self.assertEqual(determine_membership_by_user(neutral), NONE_STATE)
+        self.assertEqual(determine_membership_by_user(unknown), NONE_STATE)
+        self.assertEqual(determine_membership_by_user(no_main), NONE_STATE)
+
+    def test_set_state(self):
+        user = self.make_user('member', 11, 1, alliance_id=3, alliance_name='Member Alliance')
+        user.groups.add(Group.objects.create(name='Corp_Old_Corp'), Group.objects.create(name='Unmanaged'))
+
+        set_state(user)
+
+        self.assertEqual(AuthServicesInfo.objects.get(user=user).state, MEMBER_STATE)
+        self.assertEqual(self.group_names(user), {'Member', 'Corp_Corp_1', 'Alliance_Member_Alliance', 'Unmanaged'})
+
+    def test_set_state_inactive(self):
+        user = self.make_user('member', 11, 1)
+        set_state(user)
+        user.is_active = False
+        AuthUtils.disconnect_signals()
+        user.save()
+        AuthUtils.connect_signals()
+
+        set_state(user)
+
+        self.assertEqual(AuthServicesInfo.objects.get(user=user).state, NONE_STATE)
+        self.assertEqual(self.group_names(user), set())
+
+    def test_reactivated_user_regains_state(self):
+        user = self.make_user('member', 11, 1)
+        set_state(user)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.group_names(user), set())
+
+        # the pre_save signal sets the state before the reactivation is saved
+        user.is_active = True
+        user.save()
+
+        self.assertEqual(AuthServicesInfo.objects.get(user=user).state, MEMBER_STATE)
+        self.assertIn('Corp_Corp_1', self.group_names(user))
+
+    def test_set_states(self):
+        member = self.make_user('member', 11, 1)
+        blue = self.make_user('blue', 13, 2)
+        neutral = self.make_user('neutral', 14, 4)
+
+        states = set_states(User.objects.all())
+
+        self.assertEqual(states, {member.pk: MEMBER_STATE, blue.pk: BLUE_STATE, neutral.pk: NONE_STATE})
+        self.assertEqual(self.group_names(member), {'Member', 'Corp_Corp_1'})
+        self.assertEqual(self.group_names(blue), {'Blue'})
+        self.assertEqual(self.group_names(neutral), set())
+
+    def test_set_states_queries_independent_of_users(self):
+        for i in range(3):
+            self.make_user('member%s' % i, 10 + i, 1)
+        set_states(User.objects.all())
+        with CaptureQueriesContext(connection) as few:
+            set_states(User.objects.all())
+
+        for i in range(3, 12):
+            self.make_user('member%s' % i, 10 + i, 1)
+        set_states(User.objects.all())
+        with CaptureQueriesContext(connection) as many:
+            set_states(User.objects.all())
+
+        self.assertEqual(len(few), len(many))
+        self.assertLessEqual(len(many), 5)
+
+
+class MainCharacterTestCase(TestCase):
+    def test_deleted_main_character_notified(self):
+        user = AuthUtils.create_user('member')
+        AuthUtils.add_main_character(user, 'Main Character', 11, corp_id=1)
+
+        EveCharacter.objects.filter(character_id=11).delete()
+
+        self.assertIsNone(AuthServicesInfo.objects.get(user=user).main_char_id)
+        self.assertTrue(Notification.objects.filter(user=user, title='Main Character Reset').exists())
+
+
+class AuthInfoMiddlewareTestCase(TestCase):
+    def setUp(self):
+        user = AuthUtils.create_member('member')
+        AuthUtils.add_main_character(user, 'Main Character', 11, corp_id=1)
+        self.user = User.objects.get(pk=user.pk)
+        self.middleware = AuthInfoMiddleware(lambda request: request)
+
+    def make_request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return self.middleware(request)
+
+    def test_auth_info_loaded_once(self):
+        with self.assertNumQueries(0):
+            request = self.make_request(self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(request.auth_info.main_char.character_name, 'Main Character')
+            self.assertEqual(membership_state(request), {'STATE': MEMBER_STATE})
+            self.assertTrue(UserState.member_state(self.user))
+            self.assertTrue(UserState.member_or_blue_state(self.user))
+            self.assertFalse(UserState.blue_state(self.user))
+            self.assertEqual(request.auth_info.user, self.user)
+
+    def test_auth_info_anonymous(self):
+        request = self.make_request(AnonymousUser())
+
+        with self.assertNumQueries(0):
+            self.assertFalse(request.auth_info)
+            self.assertEqual(membership_state(request), {'STATE': NONE_STATE})
+
+    def test_clear_auth_info(self):
+        self.assertEqual(UserState.get_auth_info(self.user).state, MEMBER_STATE)
+        AuthServicesInfo.objects.filter(user=self.user).update(state=BLUE_STATE)
+
+        UserState.clear_auth_info(self.user)
+
+        self.assertEqual(UserState.get_auth_info(self.user).state, BLUE_STATE)
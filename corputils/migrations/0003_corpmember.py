@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:46
+from __future__ import unicode_literals
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def members_to_table(apps, schema_editor):
+    CorpStats = apps.get_model('corputils', 'CorpStats')
+    CorpMember = apps.get_model('corputils', 'CorpMember')
+    for cs in CorpStats.objects.all():
+        members = json.loads(cs._members or '{}')
+        CorpMember.objects.bulk_create([CorpMember(corpstats=cs, character_id=int(id), character_name=name)
+                                        for id, name in members.items()], batch_size=500)
+
+
+def members_to_json(apps, schema_editor):
+    CorpStats = apps.get_model('corputils', 'CorpStats')
+    CorpMember = apps.get_model('corputils', 'CorpMember')
+    for cs in CorpStats.objects.all():
+        members = CorpMember.objects.filter(corpstats=cs).values_list('character_id', 'character_name')
+        cs._members = json.dumps(dict(members))
+        cs.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corputils', '0002_migrate_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpMember',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('character_id', models.BigIntegerField(db_index=True)),
+                ('character_name', models.CharField(db_index=True, max_length=254)),
+                ('corpstats', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='corputils.CorpStats')),
+            ],
+            options={
+                'ordering': ['character_name'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='corpmember',
+            unique_together=set([('corpstats', 'character_id')]),
+        ),
+        migrations.RunPython(members_to_table, members_to_json),
+        migrations.RemoveField(
+            model_name='corpstats',
+            name='_members',
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:49
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corputils', '0003_corpmember'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='corpstats',
+            name='last_update_duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='corpstats',
+            name='members_joined',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='corpstats',
+            name='members_left',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
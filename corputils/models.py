@@ -1,4 +1,6 @@
 from __future__ import unicode_literals
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.encoding import python_2_unicode_compatible
 from django.db import models
 from eveonline.models import EveCorporationInfo, EveCharacter, EveApiKeyPair
@@ -6,21 +8,65 @@ from esi.models import Token
 from esi.errors import TokenError
 from notifications import notify
 from authentication.models import AuthServicesInfo
+from authentication.managers import UserState
 from bravado.exception import HTTPForbidden
 from corputils.managers import CorpStatsManager
-from operator import attrgetter
-import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# character names never change without a paid transfer, so they can be kept for a long time and shared between corps
+CHARACTER_NAME_CACHE_TIMEOUT = int(getattr(settings, 'CORPSTATS_NAME_CACHE_TIMEOUT', 60 * 60 * 24))
+CHARACTER_NAME_CACHE_KEY = 'CORPSTATS_CHARACTER_NAME_%s'
+
+# requesting too many ids per call results in a HTTP400
+# the swagger spec doesn't have a maxItems count
+# manual testing says we can do over 350, but let's not risk it
+NAMES_CHUNK_SIZE = 255
+
+
+def get_character_names(client, character_ids):
+    """
+    Resolve character names, checking the cache and known characters before asking ESI
+    :param client: ESI client
+    :param character_ids: iterable of character IDs
+    :return: dict of character ID to name, omitting IDs ESI could not resolve
+    """
+    character_ids = set(int(id) for id in character_ids)
+    if not character_ids:
+        return {}
+    cached = cache.get_many([CHARACTER_NAME_CACHE_KEY % id for id in character_ids])
+    names = dict((id, cached[CHARACTER_NAME_CACHE_KEY % id]) for id in character_ids
+                 if CHARACTER_NAME_CACHE_KEY % id in cached)
+
+    missing = character_ids - set(names)
+    if missing:
+        names.update(CorpMember.objects.filter(character_id__in=missing).values_list('character_id', 'character_name'))
+        missing -= set(names)
+    if missing:
+        names.update(EveCharacter.objects.filter(character_id__in=missing).values_list('character_id',
+                                                                                       'character_name'))
+        missing -= set(names)
+
+    missing = sorted(missing)
+    for i in range(0, len(missing), NAMES_CHUNK_SIZE):
+        for m in client.Character.get_characters_names(character_ids=missing[i:i + NAMES_CHUNK_SIZE]).result():
+            names[int(m['character_id'])] = m['character_name']
+
+    cache.set_many(dict((CHARACTER_NAME_CACHE_KEY % id, name) for id, name in names.items()),
+                   CHARACTER_NAME_CACHE_TIMEOUT)
+    return names
+
 
 @python_2_unicode_compatible
 class CorpStats(models.Model):
     token = models.ForeignKey(Token, on_delete=models.CASCADE)
     corp = models.OneToOneField(EveCorporationInfo)
     last_update = models.DateTimeField(auto_now=True)
-    _members = models.TextField(default='{}')
+    members_joined = models.PositiveIntegerField(default=0)
+    members_left = models.PositiveIntegerField(default=0)
+    last_update_duration = models.FloatField(null=True, blank=True)
 
     class Meta:
         permissions = (
@@ -40,25 +86,25 @@ class CorpStats(models.Model):
         return "%s for %s" % (self.__class__.__name__, self.corp)
 
     def update(self):
+        """
+        Fetch the corp's members from ESI, only resolving names of members who have joined since the last update
+        """
+        start = time.time()
         try:
             c = self.token.get_esi_client()
             assert c.Character.get_characters_character_id(character_id=self.token.character_id).result()[
                        'corporation_id'] == int(self.corp.corporation_id)
             members = c.Corporation.get_corporations_corporation_id_members(
                 corporation_id=self.corp.corporation_id).result()
-            member_ids = [m['character_id'] for m in members]
-
-            # requesting too many ids per call results in a HTTP400
-            # the swagger spec doesn't have a maxItems count
-            # manual testing says we can do over 350, but let's not risk it
-            member_id_chunks = [member_ids[i:i + 255] for i in range(0, len(member_ids), 255)]
-            member_name_chunks = [c.Character.get_characters_names(character_ids=id_chunk).result() for id_chunk in
-                                  member_id_chunks]
-            member_list = {}
-            for name_chunk in member_name_chunks:
-                member_list.update({m['character_id']: m['character_name'] for m in name_chunk})
-
-            self.members = member_list
+            member_ids = set(int(m['character_id']) for m in members)
+
+            member_list = dict((id, name) for id, name in self.members.items() if id in member_ids)
+            member_list.update(get_character_names(c, member_ids - set(member_list)))
+
+            joined, left = self.update_members(member_list)
+            self.members_joined = len(joined)
+            self.members_left = len(left)
+            self.last_update_duration = time.time() - start
             self.save()
         except TokenError as e:
             logger.warning("%s failed to update: %s" % (self, e))
@@ -82,67 +128,99 @@ class CorpStats(models.Model):
 
     @property
     def members(self):
-        return json.loads(self._members)
-
-    @members.setter
-    def members(self, dict):
-        self._members = json.dumps(dict)
+        return dict(self.corpmember_set.values_list('character_id', 'character_name'))
 
     @property
     def member_ids(self):
-        return [id for id, name in self.members.items()]
+        return list(self.corpmember_set.values_list('character_id', flat=True))
 
     @property
     def member_names(self):
-        return [name for id, name in self.members.items()]
+        return list(self.corpmember_set.values_list('character_name', flat=True))
+
+    def update_members(self, members):
+        """
+        Bring the stored members in line with the corp's current members
+        :param members: dict of character ID to character name
+        :return: tuple of sets of joined and left character IDs
+        """
+        members = dict((int(id), name) for id, name in members.items())
+        current = self.members
+        joined = set(members) - set(current)
+        left = set(current) - set(members)
+        if left:
+            self.corpmember_set.filter(character_id__in=left).delete()
+        for id in set(members) & set(current):
+            if members[id] != current[id]:
+                self.corpmember_set.filter(character_id=id).update(character_name=members[id])
+        CorpMember.objects.bulk_create([CorpMember(corpstats=self, character_id=id, character_name=members[id])
+                                        for id in joined])
+        return joined, left
 
     def show_apis(self, user):
-        auth = AuthServicesInfo.objects.get(user=user)
-        if auth.main_char_id:
-            try:
-                char = EveCharacter.objects.get(character_id=auth.main_char_id)
-                if char.corporation_id == self.corp.corporation_id and user.has_perm('corputils.corp_apis'):
-                    return True
-                if self.corp.alliance and char.alliance_id == self.corp.alliance.alliance_id and user.has_perm(
-                        'corputils.alliance_apis'):
-                    return True
-                if user.has_perm('corputils.blue_apis') and self.corp.is_blue:
-                    return True
-            except EveCharacter.DoesNotExist:
-                pass
-        return user.is_superuser
+        if user.is_superuser:
+            return True
+        char = UserState.get_auth_info(user).main_char
+        if char:
+            if char.corporation_id == self.corp.corporation_id and user.has_perm('corputils.corp_apis'):
+                return True
+            if self.corp.alliance and char.alliance_id == self.corp.alliance.alliance_id and user.has_perm(
+                    'corputils.alliance_apis'):
+                return True
+            if user.has_perm('corputils.blue_apis') and self.corp.is_blue:
+                return True
+        return False
 
     def entered_apis(self):
-        return EveCharacter.objects.filter(character_id__in=self.member_ids).exclude(api_id__isnull=True).count()
+        return EveCharacter.objects.filter(character_id__in=self.corpmember_set.values('character_id')).exclude(
+            api_id__isnull=True).count()
 
     def member_count(self):
-        return len(self.members)
+        return self.corpmember_set.count()
 
     @python_2_unicode_compatible
     class MemberObject(object):
-        def __init__(self, character_id, character_name, show_apis=False):
+        def __init__(self, character_id, character_name, character=None, api=None, show_apis=False):
+            """
+            :param character: the members EveCharacter, with its user, AuthServicesInfo and main character
+            selected, or None if unregistered
+            :param api: EveApiKeyPair of the character or None
+            """
             self.character_id = character_id
             self.character_name = character_name
+            self.main = None
+            self.api = None
+            self.registered = False
+            if character is None or character.user is None:
+                return
             try:
-                char = EveCharacter.objects.get(character_id=character_id)
-                auth = AuthServicesInfo.objects.get(user=char.user)
-                try:
-                    self.main = EveCharacter.objects.get(character_id=auth.main_char_id)
-                except EveCharacter.DoesNotExist:
-                    self.main = None
-                api = EveApiKeyPair.objects.get(api_id=char.api_id)
+                self.main = character.user.authservicesinfo.main_char
+            except AuthServicesInfo.DoesNotExist:
+                return
+            if api is not None:
                 self.registered = True
                 if show_apis:
                     self.api = api
-                else:
-                    self.api = None
-            except (EveCharacter.DoesNotExist, AuthServicesInfo.DoesNotExist):
-                self.main = None
-                self.api = None
-                self.registered = False
-            except EveApiKeyPair.DoesNotExist:
-                self.api = None
-                self.registered = False
+
+        @classmethod
+        def from_members(cls, members, show_apis=lambda member: False):
+            """
+            Build MemberObjects with a fixed number of queries
+            :param members: iterable of CorpMember
+            :param show_apis: function returning whether API keys may be shown for a CorpMember
+            :return: list of MemberObject
+            """
+            members = list(members)
+            chars = dict((c.character_id, c) for c in EveCharacter.objects.filter(
+                character_id__in=[m.character_id for m in members]).select_related('user__authservicesinfo__main_char'))
+            apis = dict((a.api_id, a) for a in EveApiKeyPair.objects.filter(
+                api_id__in=set(c.api_id for c in chars.values())))
+            objs = []
+            for m in members:
+                char = chars.get(m.character_id)
+                objs.append(cls(m.character_id, m.character_name, character=char,
+                                api=apis.get(char.api_id) if char else None, show_apis=show_apis(m)))
+            return objs
 
         def __str__(self):
             return self.character_name
@@ -150,10 +228,16 @@ class CorpStats(models.Model):
         def portrait_url(self, size=32):
             return "https://image.eveonline.com/Character/%s_%s.jpg" % (self.character_id, size)
 
-    def get_member_objects(self, user):
+    def get_member_objects(self, user, members=None):
+        """
+        :param user: User viewing the members
+        :param members: CorpMembers to build, defaults to all ordered by name
+        :return: list of MemberObject
+        """
         show_apis = self.show_apis(user)
-        return sorted([CorpStats.MemberObject(id, name, show_apis=show_apis) for id, name in self.members.items()],
-                      key=attrgetter('character_name'))
+        if members is None:
+            members = self.corpmember_set.all()
+        return CorpStats.MemberObject.from_members(members, show_apis=lambda member: show_apis)
 
     def can_update(self, user):
         return user.is_superuser or user == self.token.user
@@ -162,12 +246,14 @@ class CorpStats(models.Model):
     class ViewModel(object):
         def __init__(self, corpstats, user):
             self.corp = corpstats.corp
-            self.members = corpstats.get_member_objects(user)
             self.can_update = corpstats.can_update(user)
-            self.total_members = len(self.members)
+            self.total_members = corpstats.member_count()
             self.registered_members = corpstats.entered_apis()
             self.show_apis = corpstats.show_apis(user)
             self.last_updated = corpstats.last_update
+            self.members_joined = corpstats.members_joined
+            self.members_left = corpstats.members_left
+            self.last_update_duration = corpstats.last_update_duration
 
         def __str__(self):
             return str(self.corp)
@@ -183,3 +269,17 @@ class CorpStats(models.Model):
 
     def get_view_model(self, user):
         return CorpStats.ViewModel(self, user)
+
+
+@python_2_unicode_compatible
+class CorpMember(models.Model):
+    corpstats = models.ForeignKey(CorpStats, on_delete=models.CASCADE)
+    character_id = models.BigIntegerField(db_index=True)
+    character_name = models.CharField(max_length=254, db_index=True)
+
+    class Meta:
+        unique_together = (('corpstats', 'character_id'),)
+        ordering = ['character_name']
+
+    def __str__(self):
+        return self.character_name
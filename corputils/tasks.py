@@ -1,15 +1,58 @@
+from __future__ import unicode_literals
+
+import logging
+
+from bravado.exception import HTTPError
+from django.conf import settings
+
+from alliance_auth.threads import thread_map
 from corputils.models import CorpStats
 from celery.task import task, periodic_task
 from celery.task.schedules import crontab
 
+logger = logging.getLogger(__name__)
+
+# optional setting for how many corps are refreshed at once by update_all_corpstats
+REFRESH_WORKERS = int(getattr(settings, 'CORPSTATS_REFRESH_WORKERS', 5))
+
+
+def refresh_corpstats(pk):
+    """
+    Update a single CorpStats, logging rather than raising ESI errors
+    :param pk: CorpStats primary key
+    :return: bool whether the update completed
+    """
+    try:
+        cs = CorpStats.objects.select_related('token', 'corp').get(pk=pk)
+    except CorpStats.DoesNotExist:
+        return False
+    try:
+        cs.update()
+    except HTTPError as e:
+        logger.error("%s failed to update: %s" % (cs, e))
+        return False
+    if cs.pk:
+        logger.info("Updated %s in %ss: %s joined, %s left" % (cs, cs.last_update_duration, cs.members_joined,
+                                                              cs.members_left))
+    return bool(cs.pk)
+
+
+def _safe_refresh(pk):
+    # one broken corp shouldn't stop the others updating
+    try:
+        return refresh_corpstats(pk)
+    except Exception:
+        logger.exception("Unexpected error updating CorpStats %s" % pk)
+        return False
+
 
 @task
 def update_corpstats(pk):
-    cs = CorpStats.objects.get(pk=pk)
-    cs.update()
+    refresh_corpstats(pk)
 
 
 @periodic_task(run_every=crontab(minute=0, hour="*/6"))
 def update_all_corpstats():
-    for cs in CorpStats.objects.all():
-        update_corpstats.delay(cs.pk)
+    pks = list(CorpStats.objects.values_list('pk', flat=True))
+    results = thread_map(_safe_refresh, pks, REFRESH_WORKERS)
+    logger.info("Updated %s of %s CorpStats" % (results.count(True), len(pks)))
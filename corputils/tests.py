@@ -0,0 +1,188 @@
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.urlresolvers import reverse
+
+from alliance_auth.tests.auth_utils import AuthUtils
+from alliance_auth.tests.cache_utils import LOCMEM_CACHE
+
+from esi.models import Token
+from eveonline.models import EveCorporationInfo, EveCharacter, EveApiKeyPair
+
+from .models import CorpStats
+from .tasks import update_all_corpstats
+
+
+class CorpStatsTestCase(TestCase):
+    def setUp(self):
+        self.user = AuthUtils.create_member('member')
+        AuthUtils.add_main_character(self.user, 'Main', 10, corp_id=1, corp_name='Test Corp')
+        EveApiKeyPair.objects.create(api_id='1234', api_key='abcd', user=self.user)
+        self.corp = EveCorporationInfo.objects.create(corporation_id=1, corporation_name='Test Corp',
+                                                      corporation_ticker='TEST', member_count=3)
+        token = Token.objects.create(character_id=10, character_name='Main', character_owner_hash='hash',
+                                     access_token='token', user=self.user)
+        self.corpstats = CorpStats.objects.create(token=token, corp=self.corp)
+        self.corpstats.update_members({10: 'Main', 11: 'Alt', 12: 'Stranger'})
+
+    def test_update_members(self):
+        joined, left = self.corpstats.update_members({'10': 'Main', 11: 'Renamed Alt', 13: 'Recruit'})
+
+        self.assertEqual(joined, {13})
+        self.assertEqual(left, {12})
+        self.assertEqual(self.corpstats.members, {10: 'Main', 11: 'Renamed Alt', 13: 'Recruit'})
+        self.assertEqual(self.corpstats.member_names, ['Main', 'Recruit', 'Renamed Alt'])
+
+    def esi_client(self, member_ids, names):
+        c = mock.Mock()
+        c.Character.get_characters_character_id.return_value.result.return_value = {'corporation_id': 1}
+        c.Corporation.get_corporations_corporation_id_members.return_value.result.return_value = [
+            {'character_id': id} for id in member_ids]
+        c.Character.get_characters_names.return_value.result.return_value = [
+            {'character_id': id, 'character_name': name} for id, name in names.items()]
+        return c
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_update_only_resolves_new_members(self):
+        cache.clear()
+        c = self.esi_client([10, 11, 13], {13: 'Recruit'})
+
+        with mock.patch.object(Token, 'get_esi_client', return_value=c):
+            self.corpstats.update()
+
+        c.Character.get_characters_names.assert_called_once_with(character_ids=[13])
+        self.assertEqual(self.corpstats.members, {10: 'Main', 11: 'Alt', 13: 'Recruit'})
+        corpstats = CorpStats.objects.get(pk=self.corpstats.pk)
+        self.assertEqual(corpstats.members_joined, 1)
+        self.assertEqual(corpstats.members_left, 1)
+        self.assertIsNotNone(corpstats.last_update_duration)
+
+        # names already seen by another corp, or cached, are not requested again
+        other = EveCorporationInfo.objects.create(corporation_id=2, corporation_name='Other Corp',
+                                                  corporation_ticker='OTHER', member_count=2)
+        other_stats = CorpStats.objects.create(token=self.corpstats.token, corp=other)
+        c = self.esi_client([12, 13], {12: 'Stranger'})
+        c.Character.get_characters_character_id.return_value.result.return_value = {'corporation_id': 2}
+        self.corpstats.corpmember_set.all().delete()
+
+        with mock.patch.object(Token, 'get_esi_client', return_value=c):
+            other_stats.update()
+
+        c.Character.get_characters_names.assert_called_once_with(character_ids=[12])
+        self.assertEqual(other_stats.members, {12: 'Stranger', 13: 'Recruit'})
+
+    @mock.patch('corputils.tasks.CorpStats.update')
+    def test_update_all_corpstats(self, update):
+        other = EveCorporationInfo.objects.create(corporation_id=2, corporation_name='Other Corp',
+                                                  corporation_ticker='OTHER', member_count=2)
+        CorpStats.objects.create(token=self.corpstats.token, corp=other)
+
+        update_all_corpstats()
+
+        self.assertEqual(update.call_count, 2)
+
+    def test_member_counts(self):
+        EveCharacter.objects.create(character_id=11, character_name='Alt', corporation_id=1,
+                                    corporation_name='Test Corp', corporation_ticker='TEST', api_id='1234',
+                                    user=self.user)
+
+        self.assertEqual(self.corpstats.member_count(), 3)
+        self.assertEqual(self.corpstats.entered_apis(), 2)
+
+    def test_get_member_objects(self):
+        EveCharacter.objects.create(character_id=11, character_name='Alt', corporation_id=1,
+                                    corporation_name='Test Corp', corporation_ticker='TEST', api_id='1234',
+                                    user=self.user)
+        superuser = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+        with self.assertNumQueries(3):
+            members = self.corpstats.get_member_objects(superuser)
+
+        self.assertEqual([m.character_name for m in members], ['Alt', 'Main', 'Stranger'])
+        alt, main, stranger = members
+        self.assertTrue(alt.registered)
+        self.assertEqual(alt.main.character_name, 'Main')
+        self.assertEqual(alt.api.api_id, '1234')
+        self.assertTrue(main.registered)
+        self.assertFalse(stranger.registered)
+        self.assertIsNone(stranger.main)
+        self.assertIsNone(stranger.api)
+
+    def test_get_member_objects_hides_apis(self):
+        members = self.corpstats.get_member_objects(self.user)
+
+        main = [m for m in members if m.character_id == 10][0]
+        self.assertTrue(main.registered)
+        self.assertIsNone(main.api)
+
+    @mock.patch('corputils.views.update_corpstats')
+    def test_update_view_queues_task(self, update_corpstats):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+
+        response = self.client.get(reverse('corputils:update', kwargs={'corp_id': 1}))
+
+        update_corpstats.delay.assert_called_once_with(self.corpstats.pk)
+        self.assertRedirects(response, reverse('corputils:view_corp', kwargs={'corp_id': 1}),
+                             fetch_redirect_response=False)
+
+    @override_settings(API_KEY_AUDIT_URL='')
+    def test_views(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+
+        response = self.client.get(reverse('corputils:view_corp', kwargs={'corp_id': 1}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m.character_name for m in response.context['members']], ['Alt', 'Main', 'Stranger'])
+        self.assertEqual(response.context['corpstats'].total_members, 3)
+
+        response = self.client.get(reverse('corputils:search'), {'search_string': 'a'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(cs, m.character_name) for cs, m in response.context['results']],
+                         [(self.corpstats, 'Alt'), (self.corpstats, 'Main'), (self.corpstats, 'Stranger')])
+
+
+class CorpMemberMigrationTestCase(TransactionTestCase):
+    migrate_from = ('corputils', '0002_migrate_permissions')
+    migrate_to = ('corputils', '0003_corpmember')
+
+    def migrate(self, *targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(list(targets))
+        return executor.loader.project_state(list(targets)).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(*executor.loader.graph.leaf_nodes('corputils'))
+
+    def test_members_moved_between_json_and_rows(self):
+        apps = self.migrate(self.migrate_from)
+        user = apps.get_model('auth', 'User').objects.create(username='member')
+        corp = apps.get_model('eveonline', 'EveCorporationInfo').objects.create(
+            corporation_id=1, corporation_name='Test Corp', corporation_ticker='TEST', member_count=2)
+        token = apps.get_model('esi', 'Token').objects.create(character_id=10, character_name='Main',
+                                                              character_owner_hash='hash', access_token='token',
+                                                              user=user)
+        apps.get_model('corputils', 'CorpStats').objects.create(token=token, corp=corp,
+                                                                _members=json.dumps({'10': 'Main', '11': 'Alt'}))
+
+        apps = self.migrate(self.migrate_to)
+        members = apps.get_model('corputils', 'CorpMember').objects.values_list('character_id', 'character_name')
+        self.assertEqual(set(members), {(10, 'Main'), (11, 'Alt')})
+
+        apps = self.migrate(self.migrate_from)
+        corpstats = apps.get_model('corputils', 'CorpStats').objects.get()
+        self.assertEqual(json.loads(corpstats._members), {'10': 'Main', '11': 'Alt'})
@@ -5,27 +5,16 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
 from django.db import IntegrityError
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.conf import settings
+from alliance_auth.pagination import get_page
 from eveonline.models import EveCharacter, EveCorporationInfo
-from corputils.models import CorpStats
+from corputils.models import CorpStats, CorpMember
+from corputils.tasks import update_corpstats
 from esi.decorators import token_required
-from bravado.exception import HTTPError
 
 MEMBERS_PER_PAGE = int(getattr(settings, 'CORPSTATS_MEMBERS_PER_PAGE', 20))
 
 
-def get_page(model_list, page_num):
-    p = Paginator(model_list, MEMBERS_PER_PAGE)
-    try:
-        members = p.page(page_num)
-    except PageNotAnInteger:
-        members = p.page(1)
-    except EmptyPage:
-        members = p.page(p.num_pages)
-    return members
-
-
 def access_corpstats_test(user):
     return user.has_perm('corputils.view_corp_corpstats') or user.has_perm(
         'corputils.view_alliance_corpstats') or user.has_perm('corputils.view_blue_corpstats')
@@ -83,11 +72,12 @@ def corpstats_view(request, corp_id=None):
         'available': available,
     }
 
-    # paginate
+    # paginate in the database, only building member objects for the requested page
     members = []
     if corpstats:
         page = request.GET.get('page', 1)
-        members = get_page(corpstats.get_member_objects(request.user), page)
+        members = get_page(corpstats.corpmember_set.all(), page, MEMBERS_PER_PAGE)
+        members.object_list = corpstats.get_member_objects(request.user, members=members.object_list)
 
     if corpstats:
         context.update({
@@ -104,14 +94,13 @@ def corpstats_update(request, corp_id):
     corp = get_object_or_404(EveCorporationInfo, corporation_id=corp_id)
     corpstats = get_object_or_404(CorpStats, corp=corp)
     if corpstats.can_update(request.user):
-        try:
-            corpstats.update()
-        except HTTPError as e:
-            messages.error(request, str(e))
+        # large corps take a while to fetch, so don't hold up the request
+        update_corpstats.delay(corpstats.pk)
     else:
         raise PermissionDenied(
             'You do not have permission to update member data for the selected corporation statistics module.')
-    if corpstats.pk:
+    if CorpStats.objects.filter(pk=corpstats.pk).exists():
+        messages.info(request, 'Corporation statistics update queued. Members will be refreshed shortly.')
         return redirect('corputils:view_corp', corp_id=corp.corporation_id)
     else:
         return redirect('corputils:view')
@@ -120,19 +109,19 @@ def corpstats_update(request, corp_id):
 @login_required
 @user_passes_test(access_corpstats_test)
 def corpstats_search(request):
-    results = []
     search_string = request.GET.get('search_string', None)
     if search_string:
-        has_similar = CorpStats.objects.filter(_members__icontains=search_string).visible_to(request.user)
-        for corpstats in has_similar:
-            similar = [(member_id, corpstats.members[member_id]) for member_id in corpstats.members if
-                       search_string.lower() in corpstats.members[member_id].lower()]
-            for s in similar:
-                results.append(
-                    (corpstats, CorpStats.MemberObject(s[0], s[1], show_apis=corpstats.show_apis(request.user))))
+        similar = CorpMember.objects.filter(character_name__icontains=search_string).filter(
+            corpstats__in=CorpStats.objects.visible_to(request.user)).select_related(
+            'corpstats__corp__alliance').order_by('character_name', 'pk')
         page = request.GET.get('page', 1)
-        results = sorted(results, key=lambda x: x[1].character_name)
-        results_page = get_page(results, page)
+        results_page = get_page(similar, page, MEMBERS_PER_PAGE)
+        members = list(results_page.object_list)
+        show_apis = dict((member.corpstats_id, member.corpstats) for member in members)
+        show_apis = dict((pk, corpstats.show_apis(request.user)) for pk, corpstats in show_apis.items())
+        member_objects = CorpStats.MemberObject.from_members(
+            members, show_apis=lambda member: show_apis[member.corpstats_id])
+        results_page.object_list = [(member.corpstats, obj) for member, obj in zip(members, member_objects)]
         context = {
             'available': CorpStats.objects.visible_to(request.user),
             'results': results_page,
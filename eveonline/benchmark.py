@@ -0,0 +1,70 @@
+"""
+Benchmark for the EVE identity lookups behind the corp stats pages
+
+Seeds a synthetic alliance into the configured database inside a transaction,
+times the queries and rolls everything back afterwards.
+
+    python manage.py shell -c "from eveonline.benchmark import run; run()"
+"""
+from __future__ import print_function, unicode_literals
+
+import sys
+import timeit
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from authentication.models import AuthServicesInfo
+from eveonline.models import EveCharacter, EveCorporationInfo, EveAllianceInfo
+
+ALLIANCE_ID = 99000000
+CORP_ID_BASE = 98000000
+CHARACTER_ID_BASE = 90000000
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed(corps, characters):
+    alliance = EveAllianceInfo.objects.create(alliance_id=ALLIANCE_ID, alliance_name='Benchmark Alliance',
+                                              alliance_ticker='BENCH', executor_corp_id=CORP_ID_BASE)
+    EveCorporationInfo.objects.bulk_create([
+        EveCorporationInfo(corporation_id=CORP_ID_BASE + i, corporation_name='Benchmark Corp %d' % i,
+                           corporation_ticker='B%d' % i, member_count=characters // corps, alliance=alliance)
+        for i in range(corps)])
+    User.objects.bulk_create([User(username='benchmark_%d' % i) for i in range(characters)])
+    users = list(User.objects.filter(username__startswith='benchmark_').order_by('pk'))
+    EveCharacter.objects.bulk_create([
+        EveCharacter(character_id=CHARACTER_ID_BASE + i, character_name='Benchmark %d' % i,
+                     corporation_id=CORP_ID_BASE + i % corps, corporation_name='Benchmark Corp %d' % (i % corps),
+                     corporation_ticker='B%d' % (i % corps), alliance_id=ALLIANCE_ID,
+                     alliance_name='Benchmark Alliance', user=user, api_id=str(i))
+        for i, user in enumerate(users)])
+    for i, user in enumerate(users):
+        AuthServicesInfo.objects.update_or_create(user=user, defaults={'main_char_id': CHARACTER_ID_BASE + i})
+
+
+def corpstats_members(member_ids):
+    # Member lookups as done by corputils.models.CorpStats.MemberObject and entered_apis
+    mains = []
+    for character_id in member_ids:
+        char = EveCharacter.objects.get(character_id=character_id)
+        auth = AuthServicesInfo.objects.get(user=char.user_id)
+        mains.append(EveCharacter.objects.get(character_id=auth.main_char_id))
+    EveCharacter.objects.filter(character_id__in=member_ids).exclude(api_id__isnull=True).count()
+    return mains
+
+
+def run(corps=50, characters=5000, iterations=5, out=sys.stdout):
+    try:
+        with transaction.atomic():
+            seed(corps, characters)
+            member_ids = [CHARACTER_ID_BASE + i for i in range(0, characters, corps)][:100]
+
+            elapsed = timeit.timeit(lambda: corpstats_members(member_ids), number=iterations)
+            print('%-20s %5d members    %8.2fms' % ('corpstats members', len(member_ids),
+                                                   elapsed * 1000 / iterations), file=out)
+            raise Rollback
+    except Rollback:
+        pass
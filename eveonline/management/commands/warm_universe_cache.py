@@ -0,0 +1,40 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from eveonline import universe
+
+# ESI inventory category holding ship types
+SHIP_CATEGORY_ID = 6
+
+
+class Command(BaseCommand):
+    help = 'Load universe names into the long lived cache so FAT clicks and type lookups do not wait on ESI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--systems', action='store_true', help='Warm every solar system name.')
+        parser.add_argument('--ships', action='store_true', help='Warm every ship type name.')
+        for category in sorted(universe.CATEGORIES):
+            parser.add_argument('--%s' % category, dest='%s_ids' % category, type=int, nargs='+', default=[],
+                                metavar='ID', help='Warm the names of these %s IDs.' % category)
+
+    def handle(self, *args, **options):
+        client = universe.esi_client_factory()
+        ids = dict((category, list(options['%s_ids' % category])) for category in universe.CATEGORIES)
+        if options['systems']:
+            ids['system'] += client.Universe.get_universe_systems().result()
+        if options['ships']:
+            groups = client.Universe.get_universe_categories_category_id(
+                category_id=SHIP_CATEGORY_ID).result()['groups']
+            for group_id in groups:
+                ids['type'] += client.Universe.get_universe_groups_group_id(group_id=group_id).result()['types']
+
+        for category in sorted(ids):
+            if ids[category]:
+                fetched = universe.warm(category, ids[category], client=client)
+                self.stdout.write('Fetched %s of %s %s names.' % (fetched, len(set(ids[category])), category))
+
+        for category, stats in sorted(universe.cache_stats().items()):
+            self.stdout.write('%s: %s hits, %s misses, hit rate %s' % (
+                category, stats['hits'], stats['misses'],
+                '-' if stats['hit_rate'] is None else '%.1f%%' % (stats['hit_rate'] * 100)))
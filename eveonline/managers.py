@@ -4,7 +4,8 @@ from eveonline.models import EveApiKeyPair
 from eveonline.models import EveAllianceInfo
 from eveonline.models import EveCorporationInfo
 from authentication.models import AuthServicesInfo
-from eveonline.providers import eve_adapter_factory, EveXmlProvider
+from eveonline.providers import eve_adapter_factory, EveXmlProvider, ItemType
+from eveonline import universe
 from services.managers.eve_api_manager import EveApiManager
 import logging
 
@@ -24,9 +25,30 @@ class EveManager(object):
     def get_character(cls, character_id):
         return cls.get_adapter().get_character(character_id)
 
+    @classmethod
+    def get_characters(cls, character_ids):
+        return cls.get_adapter().get_characters(character_ids)
+
+    @classmethod
+    def get_resolved_character(cls, character_id):
+        return cls.resolve_characters([cls.get_character(character_id)])[0]
+
+    @classmethod
+    def get_resolved_characters(cls, character_ids):
+        """
+        Get characters with their corp and alliance already populated
+        :param character_ids: iterable of character IDs
+        :return: list of Character objects
+        """
+        return cls.resolve_characters(cls.get_characters(character_ids))
+
+    @classmethod
+    def resolve_characters(cls, characters):
+        return cls.get_adapter().resolve_characters(characters)
+
     @staticmethod
     def create_character(id, user, api_id):
-        return EveManager.create_character_obj(EveManager.get_character(id), user, api_id)
+        return EveManager.create_character_obj(EveManager.get_resolved_character(id), user, api_id)
 
     @staticmethod
     def create_character_obj(character, user, api_id):
@@ -44,7 +66,7 @@ class EveManager(object):
 
     @staticmethod
     def update_character(id):
-        return EveManager.update_character_obj(EveManager.get_character(id))
+        return EveManager.update_character_obj(EveManager.get_resolved_character(id))
 
     @staticmethod
     def update_character_obj(char):
@@ -74,6 +96,10 @@ class EveManager(object):
     def get_alliance(cls, alliance_id):
         return cls.get_adapter().get_alliance(alliance_id)
 
+    @classmethod
+    def get_alliances(cls, alliance_ids):
+        return cls.get_adapter().get_alliances(alliance_ids)
+
     @staticmethod
     def create_alliance(id, is_blue=False):
         return EveManager.create_alliance_obj(EveManager.get_alliance(id), is_blue=is_blue)
@@ -103,9 +129,11 @@ class EveManager(object):
     def populate_alliance(id):
         alliance_model = EveAllianceInfo.objects.get(alliance_id=id)
         alliance = EveManager.get_alliance(id)
-        for corp_id in alliance.corp_ids:
-            if not EveCorporationInfo.objects.filter(corporation_id=corp_id).exists():
-               EveManager.create_corporation(corp_id, is_blue=alliance_model.is_blue)
+        existing = set(EveCorporationInfo.objects.filter(corporation_id__in=alliance.corp_ids).values_list(
+            'corporation_id', flat=True))
+        missing = [corp_id for corp_id in alliance.corp_ids if int(corp_id) not in existing]
+        for corp in EveManager.get_corporations(missing):
+            EveManager.create_corporation_obj(corp, is_blue=alliance_model.is_blue)
         EveCorporationInfo.objects.filter(corporation_id__in=alliance.corp_ids).update(alliance=alliance_model)
         EveCorporationInfo.objects.filter(alliance=alliance_model).exclude(corporation_id__in=alliance.corp_ids).update(alliance=None)
 
@@ -113,6 +141,10 @@ class EveManager(object):
     def get_corporation(cls, corp_id):
         return cls.get_adapter().get_corp(corp_id)
 
+    @classmethod
+    def get_corporations(cls, corp_ids):
+        return cls.get_adapter().get_corps(corp_ids)
+
     @staticmethod
     def create_corporation(id, is_blue=False):
         return EveManager.create_corporation_obj(EveManager.get_corporation(id), is_blue=is_blue)
@@ -149,13 +181,15 @@ class EveManager(object):
 
     @classmethod
     def get_itemtype(cls, type_id):
-        return cls.get_adapter().get_itemtype(type_id)
+        # type names are served from the long lived universe cache
+        return ItemType(cls.get_adapter(), type_id, universe.get_type_name(type_id))
 
     @staticmethod
     def get_characters_from_api(api):
         char_result = EveApiManager.get_characters_from_api(api.api_id, api.api_key).result
         provider = EveXmlProvider(adapter=EveManager.get_adapter())
-        return [provider._build_character(result) for id, result in char_result.items()]
+        return EveManager.resolve_characters(
+            [provider._build_character(result) for id, result in char_result.items()])
 
     @staticmethod
     def get_api_key_pairs(user):
@@ -249,8 +283,7 @@ class EveManager(object):
         :param user: django.contrib.auth.models.User
         :return: EveCharacter
         """
-        authserviceinfo = AuthServicesInfo.objects.get(user=user)
-        return EveManager.get_character_by_id(authserviceinfo.main_char_id)
+        return AuthServicesInfo.objects.select_related('main_char').get(user=user).main_char
 
     @staticmethod
     def get_characters_by_api_id(api_id):
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eveonline', '0007_unique_id_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eveapikeypair',
+            name='last_refresh',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eveapikeypair',
+            name='last_refresh_status',
+            field=models.CharField(blank=True, choices=[('success', 'Success'), ('error', 'Error')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='eveapikeypair',
+            name='last_validated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
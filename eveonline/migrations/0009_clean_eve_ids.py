@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Max, Min
+
+BATCH_SIZE = 5000
+
+
+def batched(queryset):
+    """
+    Split a queryset into primary key ranges so each UPDATE only locks a slice of a large table
+    """
+    bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        yield queryset.filter(pk__gte=start, pk__lt=start + BATCH_SIZE)
+
+
+# ID columns 0010 converts to integers which can't be NULL, so bad values have to be fixed by hand
+REQUIRED_IDS = (
+    ('EveCharacter', 'character_id'),
+    ('EveCharacter', 'corporation_id'),
+    ('EveCorporationInfo', 'corporation_id'),
+    ('EveAllianceInfo', 'alliance_id'),
+)
+
+
+def check_required_ids(apps, schema_editor):
+    # fail before changing anything rather than part way through altering the columns
+    problems = []
+    for model_name, field in REQUIRED_IDS:
+        model = apps.get_model('eveonline', model_name)
+        invalid = model.objects.exclude(**{field + '__regex': r'^[0-9]+$'})
+        count = invalid.count()
+        if count:
+            examples = ', '.join(repr(value) for value in invalid.values_list(field, flat=True)[:5])
+            problems.append('%s %s.%s (e.g. %s)' % (count, model_name, field, examples))
+    if problems:
+        raise ValueError('Cannot convert EVE IDs to integers, correct or delete the rows with non-numeric values: %s'
+                         % '; '.join(problems))
+
+
+def clear_blank_alliance_ids(apps, schema_editor):
+    # characters without an alliance were stored with an empty string, which can't be cast to an integer
+    EveCharacter = apps.get_model('eveonline', 'EveCharacter')
+    for batch in batched(EveCharacter.objects.all()):
+        batch.exclude(alliance_id__regex=r'^[0-9]+$').exclude(alliance_id=None).update(alliance_id=None)
+
+
+class Migration(migrations.Migration):
+    # each batch commits on its own rather than holding locks for the whole table
+    atomic = False
+
+    dependencies = [
+        ('eveonline', '0008_eveapikeypair_refresh_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_required_ids, migrations.RunPython.noop),
+        migrations.RunPython(clear_blank_alliance_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eveonline', '0009_clean_eve_ids'),
+    ]
+
+    # the altered tables are rewritten and locked until this completes, see docs/maintenance/upgrading.md
+    operations = [
+        migrations.AlterField(
+            model_name='eveallianceinfo',
+            name='alliance_id',
+            field=models.BigIntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='evecharacter',
+            name='alliance_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='evecharacter',
+            name='character_id',
+            field=models.BigIntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='evecharacter',
+            name='corporation_id',
+            field=models.BigIntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='evecorporationinfo',
+            name='corporation_id',
+            field=models.BigIntegerField(unique=True),
+        ),
+    ]
@@ -6,12 +6,12 @@ from django.contrib.auth.models import User
 
 @python_2_unicode_compatible
 class EveCharacter(models.Model):
-    character_id = models.CharField(max_length=254, unique=True)
+    character_id = models.BigIntegerField(unique=True)
     character_name = models.CharField(max_length=254, unique=True)
-    corporation_id = models.CharField(max_length=254)
+    corporation_id = models.BigIntegerField(db_index=True)
     corporation_name = models.CharField(max_length=254)
     corporation_ticker = models.CharField(max_length=254)
-    alliance_id = models.CharField(max_length=254, blank=True, null=True, default='')
+    alliance_id = models.BigIntegerField(blank=True, null=True, db_index=True)
     alliance_name = models.CharField(max_length=254, blank=True, null=True, default='')
     api_id = models.CharField(max_length=254)
     user = models.ForeignKey(User, blank=True, null=True)
@@ -22,10 +22,21 @@ class EveCharacter(models.Model):
 
 @python_2_unicode_compatible
 class EveApiKeyPair(models.Model):
+    REFRESH_SUCCESS = 'success'
+    REFRESH_ERROR = 'error'
+
+    REFRESH_STATUS_CHOICES = (
+        (REFRESH_SUCCESS, 'Success'),
+        (REFRESH_ERROR, 'Error'),
+    )
+
     api_id = models.CharField(max_length=254, unique=True)
     api_key = models.CharField(max_length=254)
     user = models.ForeignKey(User, blank=True, null=True)
     sso_verified = models.BooleanField(default=False)
+    last_refresh = models.DateTimeField(blank=True, null=True)
+    last_refresh_status = models.CharField(max_length=10, blank=True, default='', choices=REFRESH_STATUS_CHOICES)
+    last_validated = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
         return self.api_id
@@ -33,7 +44,7 @@ class EveApiKeyPair(models.Model):
 
 @python_2_unicode_compatible
 class EveAllianceInfo(models.Model):
-    alliance_id = models.CharField(max_length=254, unique=True)
+    alliance_id = models.BigIntegerField(unique=True)
     alliance_name = models.CharField(max_length=254, unique=True)
     alliance_ticker = models.CharField(max_length=254)
     executor_corp_id = models.CharField(max_length=254)
@@ -45,7 +56,7 @@ class EveAllianceInfo(models.Model):
 
 @python_2_unicode_compatible
 class EveCorporationInfo(models.Model):
-    corporation_id = models.CharField(max_length=254, unique=True)
+    corporation_id = models.BigIntegerField(unique=True)
     corporation_name = models.CharField(max_length=254, unique=True)
     corporation_ticker = models.CharField(max_length=254)
     member_count = models.IntegerField()
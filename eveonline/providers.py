@@ -2,16 +2,39 @@ from django.utils.encoding import python_2_unicode_compatible
 from esi.clients import esi_client_factory
 from django.conf import settings
 from django.core.cache import cache
+from alliance_auth.cache import LocalCache
+from alliance_auth.threads import thread_map
 import json
 from bravado.exception import HTTPNotFound, HTTPUnprocessableEntity
 import evelink
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 # optional setting to control cached object lifespan
 OBJ_CACHE_DURATION = int(getattr(settings, 'EVEONLINE_OBJ_CACHE_DURATION', 300))
 
+# optional settings to control the in-process cache sitting in front of the shared cache
+LOCAL_CACHE_SIZE = int(getattr(settings, 'EVEONLINE_LOCAL_CACHE_SIZE', 1000))
+LOCAL_CACHE_DURATION = int(getattr(settings, 'EVEONLINE_LOCAL_CACHE_DURATION', 60))
+
+# optional setting to control how long IDs which do not exist are remembered
+NOT_FOUND_CACHE_DURATION = int(getattr(settings, 'EVEONLINE_NOT_FOUND_CACHE_DURATION', 60))
+
+# optional setting to control how long an expired object may be served while another worker refreshes it
+STALE_CACHE_DURATION = int(getattr(settings, 'EVEONLINE_STALE_CACHE_DURATION', 300))
+
+# optional settings to control the lock held while refreshing an object, and how long others wait on it
+REFRESH_LOCK_TIMEOUT = int(getattr(settings, 'EVEONLINE_REFRESH_LOCK_TIMEOUT', 30))
+REFRESH_LOCK_WAIT = float(getattr(settings, 'EVEONLINE_REFRESH_LOCK_WAIT', 5))
+
+# optional setting to bound the number of concurrent upstream requests made by bulk fetches
+BULK_FETCH_WORKERS = int(getattr(settings, 'EVEONLINE_BULK_FETCH_WORKERS', 10))
+
+# maximum number of IDs the XML API accepts in a single call
+XML_MAX_IDS = 250
+
 
 @python_2_unicode_compatible
 class ObjectNotFound(Exception):
@@ -199,6 +222,73 @@ class ItemType(Entity):
         )
 
 
+local_cache = LocalCache(LOCAL_CACHE_SIZE, min(LOCAL_CACHE_DURATION, OBJ_CACHE_DURATION))
+
+
+def _snapshot(data):
+    """
+    Make an immutable copy of serialized object data for sharing through the local cache.
+    Collections of IDs are stored as tuples.
+    :param data: dict from Entity.serialize
+    :return: dict
+    """
+    return dict((k, tuple(v) if isinstance(v, (list, dict)) else v) for k, v in data.items())
+
+
+def _unique(ids):
+    """
+    De-duplicate IDs, preserving order
+    :param ids: iterable of IDs
+    :return: list of IDs
+    """
+    seen = set()
+    unique_ids = []
+    for id in ids:
+        if str(id) not in seen:
+            seen.add(str(id))
+            unique_ids.append(id)
+    return unique_ids
+
+
+# transport and HTTP errors from ESI and the XML API, which only fail the affected ID in a bulk fetch
+FETCH_ERRORS = (IOError, evelink.api.APIError)
+
+
+class BulkResult(list):
+    """
+    Objects returned by a bulk fetch, along with the IDs which could not be fetched
+    for reasons other than the object not existing.
+    """
+    def __init__(self, objs=(), failed=()):
+        super(BulkResult, self).__init__(objs)
+        self.failed = list(failed)
+
+
+def _fetch_many(fetch, ids):
+    """
+    Call fetch for each ID using a bounded pool of worker threads
+    :param fetch: callable taking a single ID, may raise ObjectNotFound
+    :param ids: iterable of IDs
+    :return: BulkResult of fetched results in ID order, omitting IDs which were not found or failed
+    """
+    ids = _unique(ids)
+    failed = []
+
+    def _fetch(id):
+        try:
+            return fetch(id)
+        except ObjectNotFound as e:
+            logger.debug('Bulk fetch skipping missing object: %s' % e)
+            return None
+        except FETCH_ERRORS as e:
+            logger.warning('Bulk fetch failed to fetch ID %s: %s' % (id, e))
+            failed.append(id)
+            return None
+
+    results = thread_map(_fetch, ids, BULK_FETCH_WORKERS, uses_db=False)
+    return BulkResult([result for result in results if result is not None], failed)
+
+
 class EveProvider(object):
     def get_alliance(self, alliance_id):
         """
@@ -224,6 +314,43 @@ class EveProvider(object):
         """
         raise NotImplemented()
 
+    def get_alliances(self, alliance_ids):
+        """
+        :return: a list of Alliance objects for the given IDs, omitting those not found
+        """
+        return _fetch_many(self.get_alliance, alliance_ids)
+
+    def get_corps(self, corp_ids):
+        """
+        :return: a list of Corporation objects for the given IDs, omitting those not found
+        """
+        return _fetch_many(self.get_corp, corp_ids)
+
+    def get_characters(self, character_ids):
+        """
+        :return: a list of Character objects for the given IDs, omitting those not found
+        """
+        return _fetch_many(self.get_character, character_ids)
+
+    def resolve_characters(self, characters):
+        """
+        Populate the corp and alliance of each character using one bulk lookup for each,
+        sharing the resulting objects between all characters in the batch
+        :param characters: list of Character objects
+        :return: the same list of Character objects
+        """
+        corps = dict((int(char._corp.id), char._corp) for char in characters if char._corp)
+        corps.update((int(corp.id), corp) for corp in self.get_corps(
+            char.corp_id for char in characters if int(char.corp_id) not in corps))
+        alliance_ids = [corp.alliance_id for corp in corps.values() if corp.alliance_id and not corp._alliance]
+        alliances = dict((int(alliance.id), alliance) for alliance in self.get_alliances(alliance_ids))
+        for corp in corps.values():
+            if corp.alliance_id and not corp._alliance:
+                corp._alliance = alliances.get(int(corp.alliance_id))
+        for char in characters:
+            char._corp = corps.get(int(char.corp_id))
+        return characters
+
 
 @python_2_unicode_compatible
 class EveSwaggerProvider(EveProvider):
@@ -269,18 +396,46 @@ class EveSwaggerProvider(EveProvider):
     def get_character(self, character_id):
         try:
             data = self.client.Character.get_characters_character_id(character_id=character_id).result()
-            alliance_id = self.adapter.get_corp(data['corporation_id']).alliance_id
+            corp = self.adapter.get_corp(data['corporation_id'])
             model = Character(
                 self.adapter,
                 character_id,
                 data['name'],
                 data['corporation_id'],
-                alliance_id,
+                corp.alliance_id,
             )
+            # keep the corp we had to look up anyway so character.corp doesn't fetch it again
+            model._corp = corp
             return model
         except (HTTPNotFound, HTTPUnprocessableEntity):
             raise ObjectNotFound(character_id, 'character')
 
+    def get_characters(self, character_ids):
+        def fetch(character_id):
+            try:
+                return character_id, self.client.Character.get_characters_character_id(
+                    character_id=character_id).result()
+            except (HTTPNotFound, HTTPUnprocessableEntity):
+                raise ObjectNotFound(character_id, 'character')
+
+        results = _fetch_many(fetch, character_ids)
+        # resolve alliances through one bulk corp lookup instead of one per character
+        corps = dict((int(corp.id), corp) for corp in self.adapter.get_corps(
+            data['corporation_id'] for character_id, data in results))
+        models = []
+        for character_id, data in results:
+            corp = corps.get(int(data['corporation_id']))
+            model = Character(
+                self.adapter,
+                character_id,
+                data['name'],
+                data['corporation_id'],
+                corp.alliance_id if corp else None,
+            )
+            model._corp = corp
+            models.append(model)
+        return BulkResult(models, results.failed)
+
     def get_itemtype(self, type_id):
         try:
             data = self.client.Universe.get_universe_types_type_id(type_id=type_id).result()
@@ -318,6 +473,26 @@ class EveXmlProvider(EveProvider):
         )
         return model
 
+    def get_alliances(self, alliance_ids):
+        api = evelink.eve.EVE(api=self.api)
+        alliances = api.alliances().result
+        models = []
+        for id in _unique(alliance_ids):
+            try:
+                results = alliances[int(id)]
+            except KeyError:
+                logger.debug('Bulk fetch skipping missing object: %s' % ObjectNotFound(id, 'alliance'))
+                continue
+            models.append(Alliance(
+                self.adapter,
+                id,
+                results['name'],
+                results['ticker'],
+                results['member_corps'],
+                results['executor_id'],
+            ))
+        return models
+
     def get_corp(self, id):
         api = evelink.corp.Corp(api=self.api)
         try:
@@ -356,6 +531,38 @@ class EveXmlProvider(EveProvider):
             raise e
         return self._build_character(charinfo)
 
+    def get_characters(self, character_ids):
+        api = evelink.eve.EVE(api=self.api)
+        character_ids = _unique(character_ids)
+        models = BulkResult()
+        for i in range(0, len(character_ids), XML_MAX_IDS):
+            chunk = character_ids[i:i + XML_MAX_IDS]
+            try:
+                affiliations = api.affiliations_for_characters([int(id) for id in chunk]).result
+            except FETCH_ERRORS as e:
+                if isinstance(e, evelink.api.APIError) and int(e.code) == 105:
+                    # one bad ID fails the whole call, fall back to fetching individually
+                    results = EveProvider.get_characters(self, chunk)
+                    models += results
+                    models.failed += results.failed
+                else:
+                    logger.warning('Bulk fetch failed to fetch %s characters: %s' % (len(chunk), e))
+                    models.failed += chunk
+                continue
+            for id in chunk:
+                result = affiliations.get(int(id))
+                if not result or not result['corp']['id']:
+                    logger.debug('Bulk fetch skipping missing object: %s' % ObjectNotFound(id, 'character'))
+                    continue
+                models.append(Character(
+                    self.adapter,
+                    result['id'],
+                    result['name'],
+                    result['corp']['id'],
+                    result['alliance']['id'] if 'alliance' in result else None,
+                ))
+        return models
+
     def get_itemtype(self, type_id):
         api = evelink.eve.EVE(api=self.api)
         try:
@@ -389,56 +596,200 @@ class EveAdapter(EveProvider):
                                                                             str(self.itemtype_provider))
 
     @staticmethod
-    def _get_from_cache(obj_class, id):
-        data = cache.get('%s__%s' % (obj_class.__name__.lower(), id))
-        if data:
-            obj = obj_class.from_dict(json.loads(data))
-            logger.debug('Got from cache: %s' % obj.__repr__())
-            return obj
-        else:
-            return None
+    def _cache_key(obj_class, id):
+        return '%s__%s' % (obj_class.__name__.lower(), id)
 
     @staticmethod
-    def _cache(obj):
-        logger.debug('Caching: %s ' % obj.__repr__())
-        cache.set('%s__%s' % (obj.__class__.__name__.lower(), obj.id), json.dumps(obj.serialize()),
-                  int(OBJ_CACHE_DURATION))
+    def _lock_key(key):
+        return '%s__lock' % key
 
-    def get_character(self, id):
-        obj = self._get_from_cache(Character, id)
-        if obj:
-            obj.provider = self
-        else:
-            obj = self._get_character(id)
-            self._cache(obj)
+    @staticmethod
+    def _get_entries(keys):
+        """
+        Get cache entries from the local then shared cache
+        :param keys: list of cache keys
+        :return: dict of key: (expires, data) where data is None for objects known not to exist
+        """
+        entries = local_cache.get_many(keys)
+        remote_keys = [key for key in keys if key not in entries]
+        if remote_keys:
+            for key, value in cache.get_many(remote_keys).items():
+                try:
+                    value = json.loads(value)
+                    entry = (value['expires'], _snapshot(value['data']) if value['data'] is not None else None)
+                except (ValueError, KeyError, TypeError):
+                    # written by an older version, treat as a miss
+                    continue
+                entries[key] = entry
+                EveAdapter._set_local(key, entry)
+        return entries
+
+    @staticmethod
+    def _set_local(key, entry):
+        remaining = entry[0] - time.time()
+        if remaining > 0:
+            local_cache.set(key, entry, timeout=min(local_cache.timeout, remaining))
+
+    @staticmethod
+    def _set_entries(data, timeout, stale_timeout=0):
+        """
+        Write entries to both cache tiers
+        :param data: dict of key: serialized object data, or None for objects which do not exist
+        :param timeout: seconds until the entries should be refreshed
+        :param stale_timeout: further seconds the shared cache keeps the entries to serve while refreshing
+        """
+        if not data:
+            return
+        expires = time.time() + timeout
+        cache.set_many(dict((key, json.dumps({'expires': expires, 'data': d})) for key, d in data.items()),
+                       int(timeout + stale_timeout))
+        for key, d in data.items():
+            EveAdapter._set_local(key, (expires, _snapshot(d) if d is not None else None))
+
+    @staticmethod
+    def _cache(objs):
+        logger.debug('Caching: %s' % ', '.join(obj.__repr__() for obj in objs))
+        data = dict((EveAdapter._cache_key(obj.__class__, obj.id), obj.serialize()) for obj in objs)
+        EveAdapter._set_entries(data, OBJ_CACHE_DURATION, stale_timeout=STALE_CACHE_DURATION)
+
+    @staticmethod
+    def _cache_not_found(keys):
+        logger.debug('Caching not found: %s' % ', '.join(keys))
+        EveAdapter._set_entries(dict((key, None) for key in keys), NOT_FOUND_CACHE_DURATION)
+
+    @staticmethod
+    def cache_stats():
+        """
+        :return: dict of hit, miss and eviction counters for the in-process cache
+        """
+        return local_cache.stats()
+
+    def _build(self, obj_class, id, entry):
+        if entry[1] is None:
+            raise ObjectNotFound(id, obj_class.__name__.lower())
+        obj = obj_class.from_dict(entry[1])
+        obj.provider = self
+        logger.debug('Got from cache: %s' % obj.__repr__())
         return obj
 
-    def get_corp(self, id):
-        obj = self._get_from_cache(Corporation, id)
-        if obj:
-            obj.provider = self
-        else:
-            obj = self._get_corp(id)
-            self._cache(obj)
+    def _wait_for_refresh(self, key):
+        """
+        Wait for another worker holding the refresh lock to populate the cache
+        :return: the fresh entry, or None if the lock was released or timed out without one
+        """
+        deadline = time.time() + REFRESH_LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(0.1)
+            entry = self._get_entries([key]).get(key)
+            if entry and entry[0] > time.time():
+                return entry
+            if not cache.get(self._lock_key(key)):
+                break
+        return None
+
+    def _get(self, obj_class, id, fetch):
+        """
+        Get an object from the cache, allowing only one worker at a time to refresh it
+        :param obj_class: Entity subclass being retrieved
+        :param id: object ID
+        :param fetch: provider method accepting a single ID
+        :return: obj_class instance
+        """
+        key = self._cache_key(obj_class, id)
+        entry = self._get_entries([key]).get(key)
+        if entry and entry[0] > time.time():
+            return self._build(obj_class, id, entry)
+        have_lock = cache.add(self._lock_key(key), 1, REFRESH_LOCK_TIMEOUT)
+        if not have_lock:
+            if entry:
+                logger.debug('Serving stale %s while another worker refreshes it' % key)
+                return self._build(obj_class, id, entry)
+            entry = self._wait_for_refresh(key)
+            if entry:
+                return self._build(obj_class, id, entry)
+            logger.debug('Gave up waiting for another worker to refresh %s' % key)
+        try:
+            try:
+                obj = fetch(id)
+            except ObjectNotFound:
+                self._cache_not_found([key])
+                raise
+            # cached before the lock is released so waiters find the fresh entry
+            self._cache([obj])
+        finally:
+            if have_lock:
+                cache.delete(self._lock_key(key))
         return obj
 
+    def _get_many(self, obj_class, ids, fetch):
+        """
+        Get objects from the local then shared cache in a single lookup each,
+        fetching all misses with one bulk call. Expired objects another worker
+        is already refreshing are served stale rather than fetched again.
+        :param obj_class: Entity subclass being retrieved
+        :param ids: iterable of IDs
+        :param fetch: bulk provider method accepting a list of IDs
+        :return: BulkResult of objects in ID order, omitting those not found or which failed to fetch
+        """
+        ids = _unique(ids)
+        keys = [self._cache_key(obj_class, id) for id in ids]
+        failed = []
+        entries = self._get_entries(keys)
+        logger.debug('Got %s of %s %s entries from cache' % (len(entries), len(keys), obj_class.__name__))
+        now = time.time()
+        objs = {}
+        refresh = []
+        locked = []
+        for id, key in zip(ids, keys):
+            entry = entries.get(key)
+            if entry and entry[0] > now:
+                if entry[1] is not None:
+                    objs[key] = self._build(obj_class, id, entry)
+                continue
+            if cache.add(self._lock_key(key), 1, REFRESH_LOCK_TIMEOUT):
+                locked.append(key)
+            elif entry and entry[1] is not None:
+                objs[key] = self._build(obj_class, id, entry)
+                continue
+            refresh.append(id)
+        if refresh:
+            try:
+                results = fetch(refresh)
+                failed = getattr(results, 'failed', [])
+                fetched = dict((self._cache_key(obj_class, obj.id), obj) for obj in results)
+                if fetched:
+                    self._cache(fetched.values())
+                # failed IDs may well exist, so are fetched again next time
+                failed_keys = set(self._cache_key(obj_class, id) for id in failed)
+                not_found = [key for key in (self._cache_key(obj_class, id) for id in refresh)
+                             if key not in fetched and key not in failed_keys]
+                if not_found:
+                    self._cache_not_found(not_found)
+                objs.update(fetched)
+            finally:
+                cache.delete_many([self._lock_key(key) for key in locked])
+        return BulkResult([objs[key] for key in keys if key in objs], failed)
+
+    def get_character(self, id):
+        return self._get(Character, id, self._get_character)
+
+    def get_corp(self, id):
+        return self._get(Corporation, id, self._get_corp)
+
     def get_alliance(self, id):
-        obj = self._get_from_cache(Alliance, id)
-        if obj:
-            obj.provider = self
-        else:
-            obj = self._get_alliance(id)
-            self._cache(obj)
-        return obj
+        return self._get(Alliance, id, self._get_alliance)
 
     def get_itemtype(self, type_id):
-        obj = self._get_from_cache(ItemType, type_id)
-        if obj:
-            obj.provider = self
-        else:
-            obj = self._get_itemtype(type_id)
-            self._cache(obj)
-        return obj
+        return self._get(ItemType, type_id, self._get_itemtype)
+
+    def get_characters(self, ids):
+        return self._get_many(Character, ids, self._get_characters)
+
+    def get_corps(self, ids):
+        return self._get_many(Corporation, ids, self._get_corps)
+
+    def get_alliances(self, ids):
+        return self._get_many(Alliance, ids, self._get_alliances)
 
     def _get_character(self, id):
         return self.char_provider.get_character(id)
@@ -452,6 +803,15 @@ class EveAdapter(EveProvider):
     def _get_itemtype(self, type_id):
         return self.itemtype_provider.get_itemtype(type_id)
 
+    def _get_characters(self, ids):
+        return self.char_provider.get_characters(ids)
+
+    def _get_corps(self, ids):
+        return self.corp_provider.get_corps(ids)
+
+    def _get_alliances(self, ids):
+        return self.alliance_provider.get_alliances(ids)
+
 
 CHARACTER_PROVIDER = getattr(settings, 'EVEONLINE_CHARACTER_PROVIDER', '') or 'esi'
 CORP_PROVIDER = getattr(settings, 'EVEONLINE_CORP_PROVIDER', '') or 'esi'
@@ -2,27 +2,40 @@ from __future__ import unicode_literals
 from django.conf import settings
 from celery.task import periodic_task
 from django.contrib.auth.models import User
+from django.db.models import Max, Min, Q
+from django.utils import timezone
 from notifications import notify
 from celery import task
 from celery.task.schedules import crontab
-from authentication.models import AuthServicesInfo
 from eveonline.managers import EveManager
 from eveonline.models import EveApiKeyPair
 from services.managers.eve_api_manager import EveApiManager
 from eveonline.models import EveCharacter
 from eveonline.models import EveCorporationInfo
 from eveonline.models import EveAllianceInfo
-from authentication.tasks import set_state
+from authentication.tasks import set_state, update_all_states
+from datetime import timedelta
 import logging
 import evelink
+import math
+import time
 
 logger = logging.getLogger(__name__)
 
+# seconds between scheduled runs of run_api_refresh, must match its crontab
+API_REFRESH_PERIOD = 15 * 60
+
+# optional settings for how often every API key should be refreshed, and how long
+# to wait before retrying a key which failed to refresh (in seconds)
+API_REFRESH_INTERVAL = int(getattr(settings, 'EVEONLINE_API_REFRESH_INTERVAL', 3 * 60 * 60))
+API_REFRESH_RETRY = int(getattr(settings, 'EVEONLINE_API_REFRESH_RETRY', 60 * 60))
+
 
 @task
 def refresh_api(api):
     logger.debug('Running update on api key %s' % api.api_id)
     still_valid = True
+    status = EveApiKeyPair.REFRESH_ERROR
     try:
         EveApiManager.validate_api(api.api_id, api.api_key, api.user)
         # Update characters
@@ -35,9 +48,10 @@ def refresh_api(api):
                 EveManager.create_character_obj(c, api.user, api.api_id)
         current_chars = EveCharacter.objects.filter(api_id=api.api_id)
         for c in current_chars:
-            if not int(c.character_id) in [c.id for c in characters]:
+            if not c.character_id in [c.id for c in characters]:
                 logger.info("Character %s no longer found on API ID %s" % (c, api.api_id))
                 c.delete()
+        status = EveApiKeyPair.REFRESH_SUCCESS
     except evelink.api.APIError as e:
         logger.warning('Received unexpected APIError (%s) while updating API %s' % (e.code, api.api_id))
     except EveApiManager.ApiInvalidError:
@@ -61,7 +75,13 @@ def refresh_api(api):
     except EveApiManager.ApiServerUnreachableError as e:
         logger.warn("Error updating API %s\n%s" % (api.api_id, str(e)))
     finally:
-        if not still_valid:
+        if still_valid:
+            now = timezone.now()
+            update = {'last_refresh': now, 'last_refresh_status': status}
+            if status == EveApiKeyPair.REFRESH_SUCCESS:
+                update['last_validated'] = now
+            EveApiKeyPair.objects.filter(pk=api.pk).update(**update)
+        else:
             EveManager.delete_characters_by_api_id(api.api_id, api.user.id)
             EveManager.delete_api_key_pair(api.api_id, api.user.id)
             notify(api.user, "API Key Deleted",
@@ -75,28 +95,34 @@ def refresh_user_apis(user):
     apis = EveApiKeyPair.objects.filter(user=user)
     for x in apis:
         refresh_api(x)
-    # Check our main character
-    auth = AuthServicesInfo.objects.get(user=user)
-    if auth.main_char_id:
-        if EveCharacter.objects.filter(character_id=auth.main_char_id).exists() is False:
-            logger.info(
-                "User %s main character id %s missing model. Clearning main character." % (user, auth.main_char_id))
-            auth.main_char_id = ''
-            auth.save()
-            notify(user, "Main Character Reset",
-                   message="Your specified main character no longer has a model.\nThis could be the result of "
-                           "an invalid API.\nYour main character ID has been reset.",
-                   level="warn")
+    # deleted main characters are cleared by authentication.signals.pre_delete_main_character
     set_state(user)
 
 
-@periodic_task(run_every=crontab(minute=0, hour="*/3"))
+@periodic_task(run_every=crontab(minute="*/15"))
 def run_api_refresh():
+    """
+    Refresh a slice of users' API keys each run so that every key is refreshed once
+    per API_REFRESH_INTERVAL, starting with those validated longest ago.
+    """
     if not EveApiManager.check_if_api_server_online():
         logger.warn("Aborted scheduled API key refresh: API server unreachable")
         return
 
-    for u in User.objects.all():
+    users = User.objects.filter(eveapikeypair__isnull=False).annotate(
+        oldest_validation=Min('eveapikeypair__last_validated'), latest_refresh=Max('eveapikeypair__last_refresh'))
+    batch_size = int(math.ceil(users.count() * API_REFRESH_PERIOD / float(API_REFRESH_INTERVAL)))
+    # don't let keys which keep failing crowd out the rest
+    users = users.filter(Q(latest_refresh__isnull=True) |
+                         Q(latest_refresh__lt=timezone.now() - timedelta(seconds=API_REFRESH_RETRY)))
+
+    # never validated first, then oldest validation first
+    due = list(users.filter(oldest_validation__isnull=True)[:batch_size])
+    if len(due) < batch_size:
+        due += list(users.filter(oldest_validation__isnull=False).order_by('oldest_validation')[:batch_size - len(due)])
+
+    logger.info("Scheduling API refresh for %s users" % len(due))
+    for u in due:
         refresh_user_apis.delay(u)
 
 
@@ -110,115 +136,177 @@ def update_alliance(id):
     EveManager.populate_alliance(id)
 
 
-@periodic_task(run_every=crontab(minute=0, hour="*/2"))
-def run_corp_update():
-    if not EveApiManager.check_if_api_server_online():
-        logger.warn("Aborted updating corp and alliance models: API server unreachable")
-        return
-
-    # generate member corps
-    for corp_id in settings.STR_CORP_IDS:
-        if EveCorporationInfo.objects.filter(corporation_id=corp_id).exists():
-            update_corp(corp_id)
-        else:
-            EveManager.create_corporation(corp_id)
+def _diff(current, desired):
+    """
+    Compare local rows against their desired state
+    :param current: dict of column: value for the local row
+    :param desired: dict of column: value wanted
+    :return: dict of only the columns whose values differ
+    """
+    return dict((column, value) for column, value in desired.items() if current[column] != value)
 
-    # generate member alliances
-    for alliance_id in settings.STR_ALLIANCE_IDS:
-        if EveAllianceInfo.objects.filter(alliance_id=alliance_id).exists():
-            logger.debug("Updating existing owner alliance model with id %s" % alliance_id)
-            update_alliance(alliance_id)
-        else:
-            EveManager.create_alliance(alliance_id)
-            EveManager.populate_alliance(alliance_id)
 
-    # update existing corp models
-    for corp in EveCorporationInfo.objects.all():
-        update_corp.delay(corp.corporation_id)
+def _apply_changes(model, changes):
+    """
+    Write changed columns, grouping rows with identical changes into a single UPDATE
+    :param model: model class
+    :param changes: dict of pk: dict of column: new value
+    """
+    groups = {}
+    for pk, columns in changes.items():
+        groups.setdefault(tuple(sorted(columns.items())), []).append(pk)
+    for columns, pks in groups.items():
+        model.objects.filter(pk__in=pks).update(**dict(columns))
 
-    # update existing alliance models
-    for alliance in EveAllianceInfo.objects.all():
-        update_alliance.delay(alliance.alliance_id)
 
+def _get_standings():
+    """
+    :return: dict of int ID: standing at the configured level, or None if standings could not be retrieved
+    """
     try:
-        # create standings
         standings = EveApiManager.get_corp_standings()
         if standings:
             standings = standings[settings.STANDING_LEVEL]
-            for standing in standings:
-                if float(standings[standing]['standing']) >= settings.BLUE_STANDING:
-                    logger.debug("Standing %s meets threshold" % standing)
-                    if EveApiManager.check_if_id_is_alliance(standing):
-                        logger.debug("Standing %s is an alliance" % standing)
-                        if EveAllianceInfo.objects.filter(alliance_id=standing).exists():
-                            alliance = EveAllianceInfo.objects.get(alliance_id=standing)
-                            if alliance.is_blue is not True:
-                                logger.info("Updating alliance %s as blue" % alliance)
-                                alliance.is_blue = True
-                                alliance.save()
-                        else:
-                            EveManager.create_alliance(standing, is_blue=True)
-                    elif EveApiManager.check_if_id_is_corp(standing):
-                        logger.debug("Standing %s is a corp" % standing)
-                        if EveCorporationInfo.objects.filter(corporation_id=standing).exists():
-                            corp = EveCorporationInfo.objects.get(corporation_id=standing)
-                            if corp.is_blue is not True:
-                                logger.info("Updating corp %s as blue" % corp)
-                                corp.is_blue = True
-                                corp.save()
-                        else:
-                            logger.info("Creating model for blue corp with id %s" % standing)
-                            EveManager.create_corporation(standing, is_blue=True)
-
-        # update alliance standings
-        for alliance in EveAllianceInfo.objects.filter(is_blue=True):
-            if int(alliance.alliance_id) in standings:
-                if float(standings[int(alliance.alliance_id)]['standing']) < float(settings.BLUE_STANDING):
-                    logger.info("Alliance %s no longer meets minimum blue standing threshold" % alliance)
-                    alliance.is_blue = False
-                    alliance.save()
-            else:
-                logger.info("Alliance %s no longer in standings" % alliance)
-                alliance.is_blue = False
-                alliance.save()
-
-        # update corp standings
-        for corp in EveCorporationInfo.objects.filter(is_blue=True):
-            if int(corp.corporation_id) in standings:
-                if float(standings[int(corp.corporation_id)]['standing']) < float(settings.BLUE_STANDING):
-                    logger.info("Corp %s no longer meets minimum blue standing threshold" % corp)
-                    corp.is_blue = False
-                    corp.save()
-            else:
-                if corp.alliance:
-                    if not corp.alliance.is_blue:
-                        logger.info("Corp %s and its alliance %s are no longer blue" % (corp, corp.alliance))
-                        corp.is_blue = False
-                        corp.save()
-                else:
-                    logger.info("Corp %s is no longer blue" % corp)
-                    corp.is_blue = False
-                    corp.save()
+        return dict((int(id), float(standing['standing'])) for id, standing in standings.items())
     except evelink.api.APIError as e:
         logger.error("Model update failed with error code %s" % e.code)
+        return None
+
+
+@periodic_task(run_every=crontab(minute=0, hour="*/2"))
+def run_corp_update():
+    if not EveApiManager.check_if_api_server_online():
+        logger.warn("Aborted updating corp and alliance models: API server unreachable")
+        return
+
+    start = time.time()
+    summary = {
+        'alliances_examined': 0,
+        'alliances_created': 0,
+        'alliances_changed': 0,
+        'corps_examined': 0,
+        'corps_created': 0,
+        'corps_changed': 0,
+        'deleted': 0,
+        'failed': 0,
+    }
+
+    def fetched(results):
+        # objects which failed to fetch are left as they are until the next run
+        summary['failed'] += len(getattr(results, 'failed', []))
+        return list(results)
+
+    member_alliance_ids = set(int(id) for id in settings.STR_ALLIANCE_IDS)
+    member_corp_ids = set(int(id) for id in settings.STR_CORP_IDS)
+    standings = _get_standings()
+    blue_ids = set(id for id, standing in (standings or {}).items() if standing >= settings.BLUE_STANDING)
+
+    local_alliances = dict((a['alliance_id'], a) for a in EveAllianceInfo.objects.values(
+        'pk', 'alliance_id', 'executor_corp_id', 'is_blue'))
+    local_corps = dict((c['corporation_id'], c) for c in EveCorporationInfo.objects.values(
+        'pk', 'corporation_id', 'member_count', 'alliance_id', 'is_blue'))
 
-    # delete unnecessary alliance models
-    for alliance in EveAllianceInfo.objects.filter(is_blue=False):
-        logger.debug("Checking to delete alliance %s" % alliance)
-        if not alliance.alliance_id in settings.STR_ALLIANCE_IDS:
-            logger.info("Deleting unnecessary alliance model %s" % alliance)
-            alliance.delete()
+    # classify blue standings we have no model for, alliances first
+    unknown = [id for id in blue_ids if id not in local_alliances and id not in local_corps]
+    results = EveManager.get_alliances(unknown) if unknown else []
+    alliances = fetched(results)
+    unknown = set(unknown) - set(int(alliance.id) for alliance in alliances) - set(
+        int(id) for id in getattr(results, 'failed', []))
+    corps = fetched(EveManager.get_corporations(unknown)) if unknown else []
+
+    # alliances: member alliances and everything we already have
+    alliances += fetched(EveManager.get_alliances(
+        (member_alliance_ids | set(local_alliances)) - set(int(alliance.id) for alliance in alliances)))
+    alliance_blue = {}
+    new_alliances = []
+    alliance_changes = {}
+    for alliance in alliances:
+        alliance_id = int(alliance.id)
+        row = local_alliances.get(alliance_id)
+        if standings is not None:
+            is_blue = alliance_id in blue_ids
+        else:
+            is_blue = row['is_blue'] if row else False
+        alliance_blue[alliance_id] = is_blue
+        desired = {
+            'executor_corp_id': str(alliance.executor_corp_id),
+            'is_blue': is_blue,
+        }
+        if row:
+            changes = _diff(row, desired)
+            if changes:
+                alliance_changes[row['pk']] = changes
+        else:
+            new_alliances.append(EveAllianceInfo(
+                alliance_id=alliance_id,
+                alliance_name=alliance.name,
+                alliance_ticker=alliance.ticker,
+                **desired
+            ))
+    _apply_changes(EveAllianceInfo, alliance_changes)
+    EveAllianceInfo.objects.bulk_create(new_alliances)
+    summary['alliances_examined'] = len(alliances)
+    summary['alliances_created'] = len(new_alliances)
+    summary['alliances_changed'] = len(alliance_changes)
+    alliance_pks = dict(EveAllianceInfo.objects.values_list('alliance_id', 'pk'))
+
+    # corps: member corps, corps of all known alliances and everything we already have
+    corp_ids = member_corp_ids | set(local_corps)
+    for alliance in alliances:
+        corp_ids |= set(int(id) for id in alliance.corp_ids)
+    corps += fetched(EveManager.get_corporations(corp_ids - set(int(corp.id) for corp in corps)))
+    new_corps = []
+    corp_changes = {}
+    for corp in corps:
+        corp_id = int(corp.id)
+        row = local_corps.get(corp_id)
+        alliance_id = int(corp.alliance_id) if corp.alliance_id else None
+        if standings is None:
+            is_blue = row['is_blue'] if row else alliance_blue.get(alliance_id, False)
+        elif corp_id in standings:
+            is_blue = corp_id in blue_ids
+        elif alliance_blue.get(alliance_id, False):
+            # blue through its alliance
+            is_blue = row['is_blue'] if row else True
+        else:
+            is_blue = False
+        desired = {
+            'member_count': corp.members,
+            'alliance_id': alliance_pks.get(alliance_id),
+            'is_blue': is_blue,
+        }
+        if row:
+            changes = _diff(row, desired)
+            if changes:
+                corp_changes[row['pk']] = changes
+        else:
+            new_corps.append(EveCorporationInfo(
+                corporation_id=corp_id,
+                corporation_name=corp.name,
+                corporation_ticker=corp.ticker,
+                **desired
+            ))
+    _apply_changes(EveCorporationInfo, corp_changes)
+    EveCorporationInfo.objects.bulk_create(new_corps)
+    summary['corps_examined'] = len(corps)
+    summary['corps_created'] = len(new_corps)
+    summary['corps_changed'] = len(corp_changes)
+
+    # delete unnecessary alliance models, and with them their corps
+    deleted, __ = EveAllianceInfo.objects.filter(is_blue=False).exclude(
+        alliance_id__in=member_alliance_ids).delete()
+    summary['deleted'] += deleted
 
     # delete unnecessary corp models
-    for corp in EveCorporationInfo.objects.filter(is_blue=False):
-        logger.debug("Checking to delete corp %s" % corp)
-        if not corp.corporation_id in settings.STR_CORP_IDS:
-            logger.debug("Corp %s is not member corp" % corp)
-            if corp.alliance:
-                logger.debug("Corp %s has alliance %s" % (corp, corp.alliance))
-                if not corp.alliance.alliance_id in settings.STR_ALLIANCE_IDS:
-                    logger.info("Deleting unnecessary corp model %s" % corp)
-                    corp.delete()
-            else:
-                logger.info("Deleting unnecessary corp model %s" % corp)
-                corp.delete()
+    deleted, __ = EveCorporationInfo.objects.filter(is_blue=False).exclude(
+        corporation_id__in=member_corp_ids).exclude(alliance__alliance_id__in=member_alliance_ids).delete()
+    summary['deleted'] += deleted
+
+    summary['duration'] = time.time() - start
+    # standings may have changed, so re-evaluate who is a member or blue
+    update_all_states.delay()
+    logger.info("Corp update examined %(alliances_examined)s alliances (%(alliances_created)s created, "
+                "%(alliances_changed)s changed) and %(corps_examined)s corps (%(corps_created)s created, "
+                "%(corps_changed)s changed), deleted %(deleted)s models and failed to fetch %(failed)s "
+                "in %(duration).2fs" % summary)
+    return summary
@@ -1 +1,422 @@
-# Create your tests here.
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+from bravado.exception import HTTPNotFound
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from datetime import timedelta
+
+from alliance_auth.tests.auth_utils import AuthUtils
+from alliance_auth.tests.cache_utils import LOCMEM_CACHE
+
+from .models import EveAllianceInfo, EveApiKeyPair, EveCorporationInfo
+from .providers import EveAdapter, EveProvider, Alliance, Character, Corporation, ObjectNotFound, local_cache, \
+    _fetch_many
+from services.managers.eve_api_manager import EveApiManager
+from . import universe
+
+from .tasks import run_corp_update, run_api_refresh, refresh_api
+
+MODULE_PATH = 'eveonline.providers'
+
+
+class StubProvider(EveProvider):
+    def __init__(self, corps, alliances=None):
+        self.corps = corps
+        self.alliances = alliances or {}
+        self.adapter = self
+
+    def get_corp(self, corp_id):
+        if int(corp_id) not in self.corps:
+            raise ObjectNotFound(corp_id, 'corporation')
+        name, alliance_id = self.corps[int(corp_id)]
+        return Corporation(self.adapter, int(corp_id), name, 'TICK', 1, 10, alliance_id)
+
+    def get_alliance(self, alliance_id):
+        if int(alliance_id) not in self.alliances:
+            raise ObjectNotFound(alliance_id, 'alliance')
+        return Alliance(self.adapter, int(alliance_id), self.alliances[int(alliance_id)], 'TICK', [], None)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EveAdapterBulkTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.provider = StubProvider({1: ('Corp One', None), 2: ('Corp Two', None), 3: ('Corp Three', None)})
+        self.adapter = EveAdapter(self.provider, self.provider, self.provider, self.provider)
+
+    def test_get_corps_skips_missing(self):
+        corps = self.adapter.get_corps([1, 4, 2])
+
+        self.assertEqual([1, 2], [c.id for c in corps])
+        self.assertEqual('Corp Two', corps[1].name)
+
+    def test_get_corps_deduplicates(self):
+        with mock.patch.object(self.provider, 'get_corps', wraps=self.provider.get_corps) as get_corps:
+            corps = self.adapter.get_corps([1, '1', 2])
+
+            self.assertEqual(2, len(corps))
+            args, kwargs = get_corps.call_args
+            self.assertEqual([1, 2], args[0])
+
+    def test_get_corps_only_fetches_misses(self):
+        self.adapter.get_corp(1)
+
+        with mock.patch.object(self.provider, 'get_corps', wraps=self.provider.get_corps) as get_corps:
+            corps = self.adapter.get_corps([1, 2, 3])
+
+            self.assertEqual([1, 2, 3], [c.id for c in corps])
+            self.assertEqual(1, get_corps.call_count)
+            args, kwargs = get_corps.call_args
+            self.assertEqual([2, 3], args[0])
+            self.assertIs(self.adapter, corps[0].provider)
+
+        # Everything is now cached
+        with mock.patch.object(self.provider, 'get_corps') as get_corps:
+            self.adapter.get_corps([1, 2, 3])
+            self.assertFalse(get_corps.called)
+
+    def test_get_corps_isolates_errors(self):
+        get_corp = self.provider.get_corp
+
+        def flaky_get_corp(corp_id):
+            if int(corp_id) == 2:
+                raise IOError('timed out')
+            return get_corp(corp_id)
+
+        with mock.patch.object(self.provider, 'get_corp', side_effect=flaky_get_corp):
+            corps = self.adapter.get_corps([1, 2, 3])
+
+        self.assertEqual([1, 3], [c.id for c in corps])
+        self.assertEqual([2], corps.failed)
+        # not remembered as missing, so fetched again next time
+        self.assertEqual('Corp Two', self.adapter.get_corps([2])[0].name)
+
+
+class ResolveCharactersTestCase(TestCase):
+    def setUp(self):
+        self.provider = StubProvider({1: ('Corp One', 10), 2: ('Corp Two', None)}, alliances={10: 'Alliance Ten'})
+
+    def test_resolve_characters_shares_lookups(self):
+        characters = [
+            Character(self.provider, 100, 'Alt One', 1, 10),
+            Character(self.provider, 101, 'Alt Two', 1, 10),
+            Character(self.provider, 102, 'Alt Three', 2, None),
+        ]
+
+        with mock.patch.object(self.provider, 'get_corp', wraps=self.provider.get_corp) as get_corp, \
+                mock.patch.object(self.provider, 'get_alliance', wraps=self.provider.get_alliance) as get_alliance:
+            self.provider.resolve_characters(characters)
+
+            self.assertEqual(2, get_corp.call_count)
+            self.assertEqual(1, get_alliance.call_count)
+
+            # Nothing further is fetched when the attributes are accessed
+            self.assertIs(characters[0].corp, characters[1].corp)
+            self.assertEqual('Corp One', characters[0].corp.name)
+            self.assertEqual('Alliance Ten', characters[1].alliance.name)
+            self.assertEqual('Corp Two', characters[2].corp.name)
+            self.assertIsNone(characters[2].alliance.id)
+            self.assertEqual(2, get_corp.call_count)
+            self.assertEqual(1, get_alliance.call_count)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class UniverseCacheTestCase(TestCase):
+    def setUp(self):
+        # start with no counts pending from earlier tests
+        universe.flush_stats()
+        cache.clear()
+        local_cache.clear()
+        self.client = mock.Mock()
+        self.client.Universe.get_universe_systems_system_id.return_value.result.return_value = {
+            'solar_system_name': 'Jita'}
+
+    def test_name_fetched_once(self):
+        self.assertEqual('Jita', universe.get_system_name(30000142, client=self.client))
+        local_cache.clear()
+        self.assertEqual('Jita', universe.get_system_name(30000142, client=self.client))
+
+        self.assertEqual(1, self.client.Universe.get_universe_systems_system_id.call_count)
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_rate': 0.5}, universe.cache_stats()['system'])
+
+    def test_stats_counted_in_process(self):
+        universe.get_system_name(30000142, client=self.client)
+        with mock.patch.object(universe, 'cache', wraps=cache) as shared_cache:
+            universe.get_system_name(30000142, client=self.client)
+            self.assertFalse(shared_cache.method_calls)
+
+    def test_not_found(self):
+        self.client.Universe.get_universe_stations_station_id.side_effect = HTTPNotFound(mock.Mock(status_code=404))
+        with self.assertRaises(ObjectNotFound):
+            universe.get_station_name(1, client=self.client)
+
+    def test_warm(self):
+        cache.set(universe.NAME_KEY % ('system', 1), 'Cached')
+
+        self.assertEqual(2, universe.warm('system', [1, 2, 3, 2], client=self.client))
+        self.assertEqual(2, self.client.Universe.get_universe_systems_system_id.call_count)
+
+    @mock.patch('eveonline.managers.EveManager.get_adapter')
+    def test_get_itemtype(self, get_adapter):
+        get_adapter.return_value.itemtype_provider.get_itemtype.return_value.name = 'Rifter'
+        from .managers import EveManager
+
+        self.assertEqual('Rifter', EveManager.get_itemtype(587).name)
+        self.assertEqual('Rifter', EveManager.get_itemtype(587).name)
+        self.assertEqual(1, get_adapter.return_value.itemtype_provider.get_itemtype.call_count)
+
+
+class EveAdapterLocalCacheTestCase(TestCase):
+    def setUp(self):
+        local_cache.clear()
+        self.provider = StubProvider({})
+        self.provider.get_alliance = mock.Mock(
+            side_effect=lambda id: Alliance(self.provider, int(id), 'Alliance', 'TICK', [1, 2], 1))
+        self.adapter = EveAdapter(self.provider, self.provider, self.provider, self.provider)
+
+    def test_served_from_local_cache(self):
+        # the test settings use a dummy shared cache so hits must come from the local tier
+        self.adapter.get_alliance(10)
+        alliance = self.adapter.get_alliance(10)
+
+        self.assertEqual(1, self.provider.get_alliance.call_count)
+        self.assertIs(self.adapter, alliance.provider)
+        self.assertEqual(1, EveAdapter.cache_stats()['hits'])
+
+    def test_returns_snapshots(self):
+        self.adapter.get_alliance(10)
+        first = self.adapter.get_alliance(10)
+        first.name = 'Changed'
+        second = self.adapter.get_alliance(10)
+
+        self.assertIsNot(first, second)
+        self.assertEqual('Alliance', second.name)
+        self.assertEqual((1, 2), second.corp_ids)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EveAdapterRefreshTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.provider = StubProvider({1: ('Corp One', None)})
+        self.adapter = EveAdapter(self.provider, self.provider, self.provider, self.provider)
+
+    def test_not_found_is_cached(self):
+        with mock.patch.object(self.provider, 'get_corp', wraps=self.provider.get_corp) as get_corp:
+            with self.assertRaises(ObjectNotFound):
+                self.adapter.get_corp(2)
+            with self.assertRaises(ObjectNotFound):
+                self.adapter.get_corp(2)
+            self.assertEqual([], self.adapter.get_corps([2]))
+
+            self.assertEqual(1, get_corp.call_count)
+
+    def test_bulk_not_found_is_cached(self):
+        self.assertEqual([1], [c.id for c in self.adapter.get_corps([1, 2])])
+
+        with mock.patch.object(self.provider, 'get_corp') as get_corp:
+            with self.assertRaises(ObjectNotFound):
+                self.adapter.get_corp(2)
+            self.assertFalse(get_corp.called)
+
+    @mock.patch(MODULE_PATH + '.time')
+    def test_stale_served_while_locked(self, time):
+        time.time.return_value = 1000
+        self.adapter.get_corp(1)
+
+        # Expire the entry, and have another worker hold the refresh lock
+        local_cache.clear()
+        time.time.return_value = 1000 + 301
+        cache.add(EveAdapter._lock_key(EveAdapter._cache_key(Corporation, 1)), 1)
+
+        with mock.patch.object(self.provider, 'get_corp') as get_corp:
+            self.assertEqual('Corp One', self.adapter.get_corp(1).name)
+            self.assertEqual([1], [c.id for c in self.adapter.get_corps([1])])
+            self.assertFalse(get_corp.called)
+
+    @mock.patch(MODULE_PATH + '.time')
+    def test_stale_refreshed_when_unlocked(self, time):
+        time.time.return_value = 1000
+        self.adapter.get_corp(1)
+
+        local_cache.clear()
+        time.time.return_value = 1000 + 301
+
+        with mock.patch.object(self.provider, 'get_corp', wraps=self.provider.get_corp) as get_corp:
+            self.adapter.get_corp(1)
+            self.assertEqual(1, get_corp.call_count)
+        # The lock is released once the refresh completes
+        self.assertIsNone(cache.get(EveAdapter._lock_key(EveAdapter._cache_key(Corporation, 1))))
+
+    def test_cached_before_lock_released(self):
+        lock_key = EveAdapter._lock_key(EveAdapter._cache_key(Corporation, 1))
+        locked = []
+
+        def cache_objs(objs):
+            # waiting workers give up once the lock goes, so the fresh entry must already be there
+            locked.append(cache.get(lock_key))
+            return EveAdapter._cache(objs)
+
+        with mock.patch.object(self.adapter, '_cache', side_effect=cache_objs):
+            self.adapter.get_corp(1)
+
+        self.assertEqual([1], locked)
+        self.assertIsNone(cache.get(lock_key))
+
+
+@override_settings(STR_CORP_IDS=['3'], STR_ALLIANCE_IDS=['10'], STANDING_LEVEL='corp', BLUE_STANDING=5.0)
+class RunCorpUpdateTestCase(TestCase):
+    def setUp(self):
+        alliance = EveAllianceInfo.objects.create(alliance_id='10', alliance_name='Alliance Ten', alliance_ticker='TEN',
+                                                  executor_corp_id='1')
+        EveCorporationInfo.objects.create(corporation_id='1', corporation_name='Corp One', corporation_ticker='ONE',
+                                          member_count=5, alliance=alliance)
+        EveCorporationInfo.objects.create(corporation_id='2', corporation_name='Corp Two', corporation_ticker='TWO',
+                                          member_count=5, is_blue=True)
+        EveCorporationInfo.objects.create(corporation_id='3', corporation_name='Corp Three', corporation_ticker='THR',
+                                          member_count=5)
+
+        self.alliances = {
+            '10': Alliance(None, 10, 'Alliance Ten', 'TEN', [1, 4], 1),
+        }
+        self.corps = {
+            '1': Corporation(None, 1, 'Corp One', 'ONE', 100, 6, 10),
+            '2': Corporation(None, 2, 'Corp Two', 'TWO', 100, 5, None),
+            '3': Corporation(None, 3, 'Corp Three', 'THR', 100, 5, None),
+            '4': Corporation(None, 4, 'Corp Four', 'FOR', 100, 5, 10),
+            '20': Corporation(None, 20, 'Corp Twenty', 'TWY', 100, 5, None),
+        }
+
+    @mock.patch('eveonline.tasks.EveManager')
+    @mock.patch('eveonline.tasks.EveApiManager')
+    def test_run_corp_update(self, api_manager, manager):
+        api_manager.check_if_api_server_online.return_value = True
+        api_manager.get_corp_standings.return_value = {'corp': {20: {'standing': 10.0}}}
+        manager.get_alliances.side_effect = lambda ids: [self.alliances[str(id)] for id in ids
+                                                         if str(id) in self.alliances]
+        manager.get_corporations.side_effect = lambda ids: [self.corps[str(id)] for id in ids
+                                                            if str(id) in self.corps]
+
+        summary = run_corp_update()
+
+        self.assertEqual(6, EveCorporationInfo.objects.get(corporation_id='1').member_count)
+        self.assertEqual(10, EveCorporationInfo.objects.get(corporation_id=4).alliance.alliance_id)
+        self.assertTrue(EveCorporationInfo.objects.get(corporation_id='20').is_blue)
+        # no longer blue and not a member
+        self.assertFalse(EveCorporationInfo.objects.filter(corporation_id='2').exists())
+        self.assertTrue(EveCorporationInfo.objects.filter(corporation_id='3').exists())
+
+        self.assertEqual(1, summary['alliances_examined'])
+        self.assertEqual(0, summary['alliances_changed'])
+        self.assertEqual(5, summary['corps_examined'])
+        self.assertEqual(2, summary['corps_created'])
+        # corp 1 member count and corp 2 blue status
+        self.assertEqual(2, summary['corps_changed'])
+        self.assertEqual(1, summary['deleted'])
+
+    @mock.patch('eveonline.tasks.EveManager')
+    @mock.patch('eveonline.tasks.EveApiManager')
+    def test_run_corp_update_unchanged(self, api_manager, manager):
+        api_manager.check_if_api_server_online.return_value = True
+        api_manager.get_corp_standings.return_value = {'corp': {2: {'standing': 10.0}}}
+        self.corps['1'].members = 5
+        self.alliances['10'].corp_ids = [1]
+        manager.get_alliances.side_effect = lambda ids: [self.alliances[str(id)] for id in ids
+                                                         if str(id) in self.alliances]
+        manager.get_corporations.side_effect = lambda ids: [self.corps[str(id)] for id in ids
+                                                            if str(id) in self.corps]
+
+        summary = run_corp_update()
+
+        self.assertEqual(0, summary['failed'])
+        self.assertEqual(0, summary['alliances_changed'])
+        self.assertEqual(0, summary['corps_changed'])
+        self.assertEqual(0, summary['corps_created'])
+        self.assertEqual(0, summary['deleted'])
+
+    @mock.patch('eveonline.tasks.EveManager')
+    @mock.patch('eveonline.tasks.EveApiManager')
+    def test_run_corp_update_fetch_error(self, api_manager, manager):
+        api_manager.check_if_api_server_online.return_value = True
+        api_manager.get_corp_standings.return_value = {'corp': {20: {'standing': 10.0}}}
+        self.corps['4'].members = 8
+
+        def get_corp(corp_id):
+            if str(corp_id) == '1':
+                raise IOError('502 Bad Gateway')
+            if str(corp_id) not in self.corps:
+                raise ObjectNotFound(corp_id, 'corporation')
+            return self.corps[str(corp_id)]
+
+        manager.get_alliances.side_effect = lambda ids: [self.alliances[str(id)] for id in ids
+                                                         if str(id) in self.alliances]
+        manager.get_corporations.side_effect = lambda ids: _fetch_many(get_corp, ids)
+
+        summary = run_corp_update()
+
+        self.assertEqual(1, summary['failed'])
+        # the failed corp is left alone while the others are still updated
+        self.assertEqual(5, EveCorporationInfo.objects.get(corporation_id='1').member_count)
+        self.assertEqual(8, EveCorporationInfo.objects.get(corporation_id='4').member_count)
+        self.assertTrue(EveCorporationInfo.objects.get(corporation_id='20').is_blue)
+        self.assertFalse(EveCorporationInfo.objects.filter(corporation_id='2').exists())
+
+
+class ApiRefreshTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.users = []
+        for i, validated in enumerate([None, now - timedelta(hours=1), now - timedelta(hours=3),
+                                       now - timedelta(hours=2), now - timedelta(minutes=10)]):
+            user = AuthUtils.create_user('user_%s' % i, disconnect_signals=True)
+            EveApiKeyPair.objects.create(api_id=str(i), api_key='key', user=user, last_validated=validated,
+                                         last_refresh=validated)
+            self.users.append(user)
+        # keeps failing, refreshed recently
+        self.users[2].eveapikeypair_set.update(last_refresh=now - timedelta(minutes=5))
+        AuthUtils.create_user('no_keys', disconnect_signals=True)
+
+    @mock.patch('eveonline.tasks.API_REFRESH_INTERVAL', 60 * 60)
+    @mock.patch('eveonline.tasks.refresh_user_apis')
+    @mock.patch('eveonline.tasks.EveApiManager')
+    def test_run_api_refresh_schedules_oldest(self, api_manager, refresh_user_apis):
+        api_manager.check_if_api_server_online.return_value = True
+
+        run_api_refresh()
+
+        # a quarter of the 5 users with keys per 15 minute run, rounded up
+        self.assertEqual(2, refresh_user_apis.delay.call_count)
+        scheduled = [args[0] for args, kwargs in refresh_user_apis.delay.call_args_list]
+        self.assertEqual([self.users[0], self.users[3]], scheduled)
+
+    @mock.patch('eveonline.tasks.EveManager')
+    @mock.patch('eveonline.tasks.EveApiManager.validate_api')
+    def test_refresh_api_records_outcome(self, validate_api, manager):
+        manager.get_characters_from_api.return_value = []
+        api = EveApiKeyPair.objects.get(api_id='0')
+
+        refresh_api(api)
+
+        api.refresh_from_db()
+        self.assertEqual(EveApiKeyPair.REFRESH_SUCCESS, api.last_refresh_status)
+        self.assertIsNotNone(api.last_validated)
+        self.assertEqual(api.last_validated, api.last_refresh)
+
+        validate_api.side_effect = EveApiManager.ApiServerUnreachableError(Exception())
+        refresh_api(api)
+
+        refreshed = EveApiKeyPair.objects.get(api_id='0')
+        self.assertEqual(EveApiKeyPair.REFRESH_ERROR, refreshed.last_refresh_status)
+        self.assertEqual(api.last_validated, refreshed.last_validated)
+        self.assertGreater(refreshed.last_refresh, api.last_refresh)
@@ -0,0 +1,195 @@
+"""
+Long lived cache of EVE universe names: solar systems, stations, structures and item types.
+These almost never change, so are kept far longer than characters and corps.
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+from collections import Counter
+
+from bravado.exception import HTTPNotFound, HTTPUnprocessableEntity
+from django.conf import settings
+from django.core.cache import cache
+from esi.clients import esi_client_factory
+
+from alliance_auth.threads import thread_map
+from eveonline.providers import ObjectNotFound, local_cache, _unique, BULK_FETCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# optional settings to control how long universe names are cached, structures being renamable by their owners
+UNIVERSE_CACHE_DURATION = int(getattr(settings, 'EVEONLINE_UNIVERSE_CACHE_DURATION', 60 * 60 * 24 * 30))
+STRUCTURE_CACHE_DURATION = int(getattr(settings, 'EVEONLINE_STRUCTURE_CACHE_DURATION', 60 * 60 * 24))
+# seconds hits and misses are counted in process before being added to the shared counters
+STATS_FLUSH_INTERVAL = int(getattr(settings, 'EVEONLINE_UNIVERSE_STATS_FLUSH_INTERVAL', 60))
+
+NAME_KEY = 'EVEONLINE_UNIVERSE_NAME_%s_%s'
+STATS_KEY = 'EVEONLINE_UNIVERSE_STATS_%s_%s'
+
+_public_client = None
+_public_client_lock = threading.Lock()
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_stats_flushed = time.time()
+
+
+def _client(client=None):
+    global _public_client
+    if client is not None:
+        return client
+    if _public_client is None:
+        with _public_client_lock:
+            if _public_client is None:
+                _public_client = esi_client_factory()
+    return _public_client
+
+
+def _fetch_system(client, system_id):
+    return _client(client).Universe.get_universe_systems_system_id(system_id=system_id).result()['solar_system_name']
+
+
+def _fetch_station(client, station_id):
+    return _client(client).Universe.get_universe_stations_station_id(station_id=station_id).result()['station_name']
+
+
+def _fetch_structure(client, structure_id):
+    return _client(client).Universe.get_universe_structures_structure_id(structure_id=structure_id).result()['name']
+
+
+def _fetch_type(client, type_id):
+    # go through the configured item type provider rather than always asking ESI
+    from eveonline.managers import EveManager
+    return EveManager.get_adapter().itemtype_provider.get_itemtype(type_id).name
+
+
+CATEGORIES = {
+    'system': (_fetch_system, UNIVERSE_CACHE_DURATION),
+    'station': (_fetch_station, UNIVERSE_CACHE_DURATION),
+    'structure': (_fetch_structure, STRUCTURE_CACHE_DURATION),
+    'type': (_fetch_type, UNIVERSE_CACHE_DURATION),
+}
+
+
+def _incr(key, delta=1):
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # key expired or the cache doesn't store anything
+        return delta
+
+
+def flush_stats():
+    """
+    Add the hits and misses counted in this process to the shared counters
+    """
+    global _stats_flushed
+    with _stats_lock:
+        counts = dict(_stats)
+        _stats.clear()
+        _stats_flushed = time.time()
+    for (category, counter), n in counts.items():
+        _incr(STATS_KEY % (category, counter), n)
+
+
+def _count(category, counter):
+    # counted in process so cache hits don't cost a round trip to the shared cache
+    with _stats_lock:
+        _stats[(category, counter)] += 1
+        due = time.time() - _stats_flushed >= STATS_FLUSH_INTERVAL
+    if due:
+        flush_stats()
+
+
+def get_name(category, id, client=None):
+    """
+    Get the name of a universe object from the in-process or shared cache, fetching it on a miss
+    :param category: one of system, station, structure or type
+    :param id: object ID
+    :param client: ESI client to fetch with, required for structures the public client can't see
+    :return: str
+    :raises ObjectNotFound: if the object does not exist
+    """
+    key = NAME_KEY % (category, id)
+    name = local_cache.get(key)
+    if name is None:
+        name = cache.get(key)
+        if name is not None:
+            local_cache.set(key, name)
+    if name is not None:
+        _count(category, 'hits')
+        return name
+
+    _count(category, 'misses')
+    fetch, duration = CATEGORIES[category]
+    try:
+        name = fetch(client, id)
+    except (HTTPNotFound, HTTPUnprocessableEntity):
+        raise ObjectNotFound(id, category)
+    logger.debug('Caching %s %s name %s' % (category, id, name))
+    cache.set(key, name, duration)
+    local_cache.set(key, name)
+    return name
+
+
+def get_system_name(system_id, client=None):
+    return get_name('system', system_id, client=client)
+
+
+def get_station_name(station_id, client=None):
+    return get_name('station', station_id, client=client)
+
+
+def get_structure_name(structure_id, client=None):
+    return get_name('structure', structure_id, client=client)
+
+
+def get_type_name(type_id, client=None):
+    return get_name('type', type_id, client=client)
+
+
+def warm(category, ids, client=None):
+    """
+    Fetch the names of objects not already in the shared cache using a bounded pool of worker threads
+    :param category: one of system, station, structure or type
+    :param ids: iterable of object IDs
+    :param client: ESI client to fetch with
+    :return: number of names fetched
+    """
+    ids = _unique(ids)
+    cached = cache.get_many([NAME_KEY % (category, id) for id in ids])
+    missing = [id for id in ids if NAME_KEY % (category, id) not in cached]
+
+    def _warm(id):
+        try:
+            get_name(category, id, client=client)
+            return True
+        except ObjectNotFound as e:
+            logger.debug('Not warming missing object: %s' % e)
+            return False
+
+    return thread_map(_warm, missing, BULK_FETCH_WORKERS, uses_db=False).count(True)
+
+
+def cache_stats():
+    """
+    Lookups served from cache and fetched since the counters were last cleared, across all processes
+    which have flushed their counts
+    :return: dict of category to dict of hits, misses and hit_rate
+    """
+    flush_stats()
+    keys = [STATS_KEY % (category, counter) for category in CATEGORIES for counter in ('hits', 'misses')]
+    counts = cache.get_many(keys)
+    stats = {}
+    for category in CATEGORIES:
+        hits = counts.get(STATS_KEY % (category, 'hits'), 0)
+        misses = counts.get(STATS_KEY % (category, 'misses'), 0)
+        stats[category] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': float(hits) / (hits + misses) if hits + misses else None,
+        }
+    return stats
@@ -1 +1,2 @@
 from __future__ import unicode_literals
+default_app_config = 'fleetactivitytracking.apps.FatConfig'
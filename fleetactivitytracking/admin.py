@@ -1,7 +1,8 @@
 from __future__ import unicode_literals
 from django.contrib import admin
-from fleetactivitytracking.models import Fatlink, Fat
+from fleetactivitytracking.models import Fatlink, Fat, PendingFat
 
 
 admin.site.register(Fatlink)
 admin.site.register(Fat)
+admin.site.register(PendingFat)
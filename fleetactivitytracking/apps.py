@@ -5,3 +5,6 @@ from django.apps import AppConfig
 
 class FatConfig(AppConfig):
     name = 'fleetactivitytracking'
+
+    def ready(self):
+        import fleetactivitytracking.signals
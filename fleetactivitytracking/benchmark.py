@@ -0,0 +1,70 @@
+"""
+Benchmark for the per corp counts behind the FAT statistics pages
+
+Seeds a synthetic alliance and its fleets into the configured database inside a transaction,
+times the queries and rolls everything back afterwards.
+
+    python manage.py shell -c "from fleetactivitytracking.benchmark import run; run()"
+"""
+from __future__ import print_function, unicode_literals
+
+import datetime
+import sys
+import timeit
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from eveonline import benchmark
+from eveonline.benchmark import CORP_ID_BASE, CHARACTER_ID_BASE, Rollback
+from eveonline.models import EveCharacter
+from fleetactivitytracking.models import Fat, Fatlink, FatMonthlyRollup
+
+
+def seed(corps, characters, fatlinks):
+    benchmark.seed(corps, characters)
+    chars = list(EveCharacter.objects.filter(character_id__gte=CHARACTER_ID_BASE).order_by('pk'))
+
+    now = timezone.now()
+    Fatlink.objects.bulk_create([
+        Fatlink(fatdatetime=now - datetime.timedelta(hours=i), duration=60, name='Benchmark %d' % i,
+                hash='benchmark%d' % i, creator=chars[0].user)
+        for i in range(fatlinks)])
+    fats = []
+    for n, link in enumerate(Fatlink.objects.filter(hash__startswith='benchmark')):
+        # Each fleet is attended by a rotating slice of the alliance
+        for char in chars[n % 10::10]:
+            fats.append(Fat(character=char, fatlink=link, system='Jita', shiptype='Rifter', station='', user=char.user,
+                            corporation_id=char.corporation_id))
+    Fat.objects.bulk_create(fats, batch_size=500)
+    # bulk_create skips the signals which maintain the rollups
+    FatMonthlyRollup.objects.rebuild()
+    return now
+
+
+def fat_statistics(start, end, corps):
+    # Per corp counts with one query per corp, as fleetactivitytracking.views.CorpStat used to fetch them
+    return [Fat.objects.filter(character__corporation_id=CORP_ID_BASE + i).filter(
+        fatlink__fatdatetime__gte=start).filter(fatlink__fatdatetime__lte=end).count() for i in range(corps)]
+
+
+def fat_rollup_statistics(start):
+    # Per corp counts as fetched by fleetactivitytracking.views.fatlink_statistics_view
+    return dict(FatMonthlyRollup.objects.filter(year=start.year, month=start.month).values_list(
+        'corporation_id').annotate(Sum('count')).order_by())
+
+
+def run(corps=50, characters=5000, fatlinks=200, iterations=5, out=sys.stdout):
+    try:
+        with transaction.atomic():
+            now = seed(corps, characters, fatlinks)
+            start, end = now - datetime.timedelta(days=30), now
+
+            elapsed = timeit.timeit(lambda: fat_statistics(start, end, corps), number=iterations)
+            print('%-20s %5d corps      %8.2fms' % ('fat statistics', corps, elapsed * 1000 / iterations), file=out)
+            elapsed = timeit.timeit(lambda: fat_rollup_statistics(now), number=iterations)
+            print('%-20s %5d corps      %8.2fms' % ('fat rollup stats', corps, elapsed * 1000 / iterations), file=out)
+            raise Rollback
+    except Rollback:
+        pass
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+
+class FatMonthlyRollupManager(models.Manager):
+    use_in_migrations = True
+
+    @staticmethod
+    def key_for(fat):
+        """
+        Get the rollup row a Fat is counted in
+        :param fat: Fat
+        :return: dict of field lookups
+        """
+        when = timezone.localtime(fat.fatlink.fatdatetime)
+        return {
+            'year': when.year,
+            'month': when.month,
+            'corporation_id': fat.corporation_id,
+            'user_id': fat.user_id,
+            'shiptype': fat.shiptype,
+        }
+
+    def add(self, key, delta):
+        """
+        Adjust the count of a rollup row, creating it if needed and removing it once empty
+        :param key: lookups from key_for
+        :param delta: int to add to the count
+        """
+        if delta > 0 and not self.filter(**key).update(count=F('count') + delta):
+            try:
+                with transaction.atomic():
+                    self.create(count=delta, **key)
+            except IntegrityError:
+                # created by a concurrent registration
+                self.filter(**key).update(count=F('count') + delta)
+        elif delta < 0:
+            self.filter(**key).update(count=F('count') + delta)
+            self.filter(count__lte=0, **key).delete()
+
+    def rebuild(self):
+        """
+        Recount all rollups from the Fat table
+        """
+        Fat = self.model._meta.apps.get_model('fleetactivitytracking', 'Fat')
+        counts = Fat.objects.annotate(year=ExtractYear('fatlink__fatdatetime'),
+                                      month=ExtractMonth('fatlink__fatdatetime')).values(
+            'year', 'month', 'corporation_id', 'user_id', 'shiptype').annotate(n=Count('pk')).order_by()
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([self.model(year=c['year'], month=c['month'], corporation_id=c['corporation_id'],
+                                         user_id=c['user_id'], shiptype=c['shiptype'], count=c['n'])
+                              for c in counts], batch_size=500)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:51
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import fleetactivitytracking.managers
+
+
+def populate_fat_corps(apps, schema_editor):
+    Fat = apps.get_model('fleetactivitytracking', 'Fat')
+    for corp_id in Fat.objects.values_list('character__corporation_id', flat=True).distinct():
+        Fat.objects.filter(character__corporation_id=corp_id).update(corporation_id=corp_id)
+
+
+def rebuild_rollups(apps, schema_editor):
+    apps.get_model('fleetactivitytracking', 'FatMonthlyRollup').objects.rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('eveonline', '0010_integer_eve_ids'),
+        ('fleetactivitytracking', '0003_auto_20160906_2354'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FatMonthlyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('corporation_id', models.BigIntegerField(blank=True, null=True)),
+                ('shiptype', models.CharField(max_length=30)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            managers=[
+                ('objects', fleetactivitytracking.managers.FatMonthlyRollupManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fat',
+            name='corporation_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='fatmonthlyrollup',
+            unique_together=set([('year', 'month', 'corporation_id', 'user', 'shiptype')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='fatmonthlyrollup',
+            index_together=set([('user', 'year', 'month')]),
+        ),
+        migrations.RunPython(populate_fat_corps, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+    ]
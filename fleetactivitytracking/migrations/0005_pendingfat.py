@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:03
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('esi', '0004_remove_unique_access_token'),
+        ('eveonline', '0010_integer_eve_ids'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('fleetactivitytracking', '0004_fatmonthlyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingFat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('character', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='eveonline.EveCharacter')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pendingfat',
+            name='fatlink',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='fleetactivitytracking.Fatlink'),
+        ),
+        migrations.AddField(
+            model_name='pendingfat',
+            name='token',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='esi.Token'),
+        ),
+        migrations.AddField(
+            model_name='pendingfat',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pendingfat',
+            unique_together=set([('character', 'fatlink')]),
+        ),
+    ]
@@ -3,7 +3,9 @@ from django.utils.encoding import python_2_unicode_compatible
 from django.db import models
 from django.contrib.auth.models import User
 from eveonline.models import EveCharacter
+from esi.models import Token
 from django.utils import timezone
+from fleetactivitytracking.managers import FatMonthlyRollupManager
 
 
 def get_sentinel_user():
@@ -31,6 +33,8 @@ class Fat(models.Model):
     shiptype = models.CharField(max_length=30)
     station = models.CharField(max_length=125)
     user = models.ForeignKey(User)
+    # the character's corp when the fat was registered, so statistics don't move when they change corp
+    corporation_id = models.BigIntegerField(null=True, blank=True, db_index=True)
 
     class Meta:
         unique_together = (('character', 'fatlink'),)
@@ -38,3 +42,50 @@ class Fat(models.Model):
     def __str__(self):
         output = "Fat-link for %s" % self.character.character_name
         return output.encode('utf-8')
+
+    def save(self, *args, **kwargs):
+        if self.corporation_id is None and self.character_id:
+            self.corporation_id = self.character.corporation_id
+        super(Fat, self).save(*args, **kwargs)
+
+
+@python_2_unicode_compatible
+class PendingFat(models.Model):
+    """
+    A fatlink click waiting for a worker to fetch the character's location and ship and register its Fat.
+    """
+    character = models.ForeignKey(EveCharacter, on_delete=models.CASCADE)
+    fatlink = models.ForeignKey(Fatlink, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    token = models.ForeignKey(Token, on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('character', 'fatlink'),)
+
+    def __str__(self):
+        return "Pending fat-link for %s" % self.character.character_name
+
+
+@python_2_unicode_compatible
+class FatMonthlyRollup(models.Model):
+    """
+    Number of fats per month for each corp, user and ship type, kept up to date by signals as Fats are saved
+    and deleted so statistics don't need to scan the Fat table.
+    """
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    corporation_id = models.BigIntegerField(null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    shiptype = models.CharField(max_length=30)
+    count = models.PositiveIntegerField(default=0)
+
+    objects = FatMonthlyRollupManager()
+
+    class Meta:
+        unique_together = (('year', 'month', 'corporation_id', 'user', 'shiptype'),)
+        index_together = (('user', 'year', 'month'),)
+
+    def __str__(self):
+        return "%s fats for %s in %s %04d-%02d" % (self.count, self.user, self.shiptype, self.year, self.month)
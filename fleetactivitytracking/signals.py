@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from fleetactivitytracking.models import Fat, FatMonthlyRollup
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Fat)
+def pre_save_fat(sender, instance, *args, **kwargs):
+    if instance.pk:
+        try:
+            old_instance = Fat.objects.select_related('fatlink').get(pk=instance.pk)
+            instance._rollup_key = FatMonthlyRollup.objects.key_for(old_instance)
+        except Fat.DoesNotExist:
+            pass
+
+
+@receiver(post_save, sender=Fat)
+def post_save_fat(sender, instance, created, *args, **kwargs):
+    key = FatMonthlyRollup.objects.key_for(instance)
+    old_key = getattr(instance, '_rollup_key', None)
+    if old_key != key:
+        logger.debug("Counting fat %s for %s in monthly rollup" % (instance.pk, instance.user))
+        if old_key:
+            FatMonthlyRollup.objects.add(old_key, -1)
+        FatMonthlyRollup.objects.add(key, 1)
+    instance._rollup_key = key
+
+
+@receiver(post_delete, sender=Fat)
+def post_delete_fat(sender, instance, *args, **kwargs):
+    FatMonthlyRollup.objects.add(getattr(instance, '_rollup_key', None) or FatMonthlyRollup.objects.key_for(instance),
+                                 -1)
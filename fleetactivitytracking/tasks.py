@@ -0,0 +1,143 @@
+from __future__ import unicode_literals
+
+import logging
+from collections import Counter
+
+from bravado.exception import HTTPError
+from celery.task import task, periodic_task
+from celery.task.schedules import crontab
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from esi.errors import TokenError
+
+from alliance_auth.threads import thread_map
+from eveonline import universe
+from eveonline.managers import EveManager
+from eveonline.providers import ObjectNotFound
+from fleetactivitytracking.models import Fat, PendingFat, FatMonthlyRollup
+
+logger = logging.getLogger(__name__)
+
+# optional settings for how many queued clicks are registered at a time, how many characters are looked up at once
+# and how many times a click is retried before being dropped
+REGISTRATION_BATCH_SIZE = int(getattr(settings, 'FAT_REGISTRATION_BATCH_SIZE', 100))
+REGISTRATION_WORKERS = int(getattr(settings, 'FAT_REGISTRATION_WORKERS', 10))
+REGISTRATION_MAX_ATTEMPTS = int(getattr(settings, 'FAT_REGISTRATION_MAX_ATTEMPTS', 3))
+
+QUEUED_KEY = 'FAT_REGISTRATION_QUEUED'
+RUNNING_KEY = 'FAT_REGISTRATION_RUNNING'
+
+
+def get_fat_details(token):
+    """
+    Fetch where a character is and what they are flying
+    :param token: esi Token for the character
+    :return: tuple of system, station and ship type names
+    """
+    c = token.get_esi_client()
+    location = c.Location.get_characters_character_id_location(character_id=token.character_id).result()
+    ship = c.Location.get_characters_character_id_ship(character_id=token.character_id).result()
+    system = universe.get_system_name(location['solar_system_id'], client=c)
+    if location['structure_id']:
+        station = universe.get_structure_name(location['structure_id'], client=c)
+    elif location['station_id']:
+        station = universe.get_station_name(location['station_id'], client=c)
+    else:
+        station = "No Station"
+    return system, station, EveManager.get_itemtype(ship['ship_type_id']).name
+
+
+def queue_registration():
+    """
+    Ask a worker to register pending fats, unless one has already been asked to
+    """
+    if cache.add(QUEUED_KEY, True, 60):
+        register_pending_fats.delay()
+
+
+def _fetch_details(pending):
+    try:
+        return get_fat_details(pending.token)
+    except (HTTPError, TokenError, ObjectNotFound, KeyError) as e:
+        logger.warning("Failed to fetch fat details for %s: %s" % (pending.character.character_name, e))
+    except Exception:
+        # one broken click shouldn't stop the rest of the batch registering
+        logger.exception("Unexpected error fetching fat details for %s" % pending.character.character_name)
+    return None
+
+
+def _register(batch, details):
+    """
+    Bulk insert Fats for a batch of pending clicks, keeping failed clicks to be retried
+    :param batch: list of PendingFat
+    :param details: list of fat details or None for each PendingFat
+    :return: number of Fats registered
+    """
+    fats = []
+    failed = []
+    for pending, detail in zip(batch, details):
+        if detail is None:
+            failed.append(pending.pk)
+            continue
+        system, station, shiptype = detail
+        fat = Fat(character=pending.character, fatlink=pending.fatlink, user=pending.user, system=system,
+                  station=station, shiptype=shiptype, corporation_id=pending.character.corporation_id)
+        try:
+            fat.clean_fields()
+        except ValidationError as e:
+            logger.warning("Dropping invalid fat for %s: %s" % (pending.character.character_name, e))
+            continue
+        fats.append(fat)
+
+    with transaction.atomic():
+        existing = set(Fat.objects.filter(fatlink_id__in=set(fat.fatlink_id for fat in fats),
+                                          character_id__in=set(fat.character_id for fat in fats)).values_list(
+            'character_id', 'fatlink_id'))
+        fats = [fat for fat in fats if (fat.character_id, fat.fatlink_id) not in existing]
+        Fat.objects.bulk_create(fats)
+        # bulk_create doesn't send the signals which maintain the rollups
+        counts = Counter(tuple(sorted(FatMonthlyRollup.objects.key_for(fat).items())) for fat in fats)
+        for key, n in counts.items():
+            FatMonthlyRollup.objects.add(dict(key), n)
+        PendingFat.objects.filter(pk__in=[pending.pk for pending in batch]).exclude(pk__in=failed).delete()
+        PendingFat.objects.filter(pk__in=failed).update(attempts=F('attempts') + 1)
+        PendingFat.objects.filter(pk__in=failed, attempts__gte=REGISTRATION_MAX_ATTEMPTS).delete()
+    return len(fats)
+
+
+@task
+def register_pending_fats():
+    """
+    Fetch the location and ship of queued fatlink clicks in batches and register their Fats
+    :return: number of Fats registered
+    """
+    cache.delete(QUEUED_KEY)
+    if not cache.add(RUNNING_KEY, True, 60 * 10):
+        logger.debug("Pending fats are already being registered")
+        return 0
+    registered = 0
+    last_pk = 0
+    try:
+        while True:
+            batch = list(PendingFat.objects.select_related('token', 'fatlink', 'character').filter(
+                pk__gt=last_pk).order_by('pk')[:REGISTRATION_BATCH_SIZE])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            details = thread_map(_fetch_details, batch, REGISTRATION_WORKERS)
+            registered += _register(batch, details)
+    finally:
+        cache.delete(RUNNING_KEY)
+    if registered:
+        logger.info("Registered %s pending fats" % registered)
+    return registered
+
+
+@periodic_task(run_every=crontab(minute='*'))
+def register_stale_pending_fats():
+    # picks up clicks left behind by a lost or failed registration task
+    if PendingFat.objects.exists():
+        register_pending_fats.delay()
@@ -0,0 +1,151 @@
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+import datetime
+
+from bravado.exception import HTTPError
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from alliance_auth.tests.auth_utils import AuthUtils
+
+from esi.models import Token
+from eveonline.models import EveCharacter, EveCorporationInfo
+
+from .models import Fat, Fatlink, FatMonthlyRollup, PendingFat
+from .tasks import register_pending_fats, REGISTRATION_MAX_ATTEMPTS
+
+
+@override_settings(STR_CORP_IDS=['1'], STR_ALLIANCE_IDS=[], LANGUAGE_CODE='en')
+class FatMonthlyRollupTestCase(TestCase):
+    def setUp(self):
+        self.user = AuthUtils.create_member('member')
+        EveCorporationInfo.objects.create(corporation_id=1, corporation_name='Member Corp', corporation_ticker='MEM',
+                                          member_count=2)
+        EveCorporationInfo.objects.create(corporation_id=2, corporation_name='Other Corp', corporation_ticker='OTH',
+                                          member_count=1)
+        EveCorporationInfo.objects.create(corporation_id=3, corporation_name='Idle Corp', corporation_ticker='IDL',
+                                          member_count=1)
+        self.main = EveCharacter.objects.create(character_id=10, character_name='Main', corporation_id=1,
+                                                corporation_name='Member Corp', corporation_ticker='MEM',
+                                                user=self.user)
+        self.alt = EveCharacter.objects.create(character_id=11, character_name='Alt', corporation_id=2,
+                                               corporation_name='Other Corp', corporation_ticker='OTH',
+                                               user=self.user)
+        self.links = [Fatlink.objects.create(fatdatetime=timezone.make_aware(datetime.datetime(2017, month, 15)),
+                                             duration=60, name='Fleet %s' % i, hash='hash%s' % i,
+                                             creator=self.user) for i, month in enumerate((1, 1, 2))]
+
+    def fat(self, character, fatlink, shiptype='Rifter'):
+        return Fat.objects.create(character=character, fatlink=fatlink, system='Jita', shiptype=shiptype,
+                                  station='', user=character.user)
+
+    def rollups(self):
+        return set(FatMonthlyRollup.objects.values_list('year', 'month', 'corporation_id', 'shiptype', 'count'))
+
+    def test_rollup_maintained(self):
+        fat = self.fat(self.main, self.links[0])
+        self.fat(self.main, self.links[1])
+        self.fat(self.alt, self.links[2], shiptype='Slasher')
+        self.assertEqual(self.rollups(), {(2017, 1, 1, 'Rifter', 2), (2017, 2, 2, 'Slasher', 1)})
+
+        # changing corp afterwards doesn't move past fats
+        self.main.corporation_id = 2
+        self.main.save()
+        fat.shiptype = 'Slasher'
+        fat.save()
+        self.assertEqual(self.rollups(), {(2017, 1, 1, 'Rifter', 1), (2017, 1, 1, 'Slasher', 1),
+                                          (2017, 2, 2, 'Slasher', 1)})
+
+        fat.delete()
+        self.links[2].delete()
+        self.assertEqual(self.rollups(), {(2017, 1, 1, 'Rifter', 1)})
+
+    def test_rebuild(self):
+        self.fat(self.main, self.links[0])
+        self.fat(self.main, self.links[1], shiptype='Slasher')
+        self.fat(self.alt, self.links[2])
+        expected = self.rollups()
+        FatMonthlyRollup.objects.all().delete()
+
+        FatMonthlyRollup.objects.rebuild()
+
+        self.assertEqual(self.rollups(), expected)
+
+    def test_statistics_views(self):
+        self.fat(self.main, self.links[0])
+        self.fat(self.main, self.links[1], shiptype='Slasher')
+        self.fat(self.alt, self.links[1])
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+
+        response = self.client.get(reverse('auth_fatlink_view_statistics_month', kwargs={'year': 2017, 'month': 1}))
+        self.assertEqual([(s.corp.corporation_id, s.n_fats) for s in response.context['fatStats']], [(1, 2), (2, 1)])
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('auth_fatlink_view_personal_statistics_year', kwargs={'year': 2017}))
+        self.assertEqual([n for month, name, n in response.context['monthlystats'][:3]], [3, 0, 0])
+
+        response = self.client.get(reverse('auth_fatlink_view_personal_statistics_month',
+                                           kwargs={'year': 2017, 'month': 1}))
+        self.assertEqual(response.context['shipStats'], [('Rifter', 2), ('Slasher', 1)])
+        self.assertEqual(response.context['n_fats'], 3)
+
+
+@override_settings(LANGUAGE_CODE='en')
+class PendingFatTestCase(TestCase):
+    def setUp(self):
+        self.user = AuthUtils.create_member('member')
+        self.fatlink = Fatlink.objects.create(fatdatetime=timezone.make_aware(datetime.datetime(2017, 3, 15)),
+                                              duration=60, name='Fleet', hash='hash', creator=self.user)
+        self.pending = []
+        for character_id in (10, 11, 12):
+            character = EveCharacter.objects.create(character_id=character_id, character_name='Pilot %s' % character_id,
+                                                    corporation_id=1, corporation_name='Member Corp',
+                                                    corporation_ticker='MEM', user=self.user)
+            token = Token.objects.create(character_id=character_id, character_name=character.character_name,
+                                         character_owner_hash='hash%s' % character_id, access_token='token',
+                                         user=self.user)
+            self.pending.append(PendingFat.objects.create(character=character, fatlink=self.fatlink, user=self.user,
+                                                          token=token))
+
+    @mock.patch('fleetactivitytracking.tasks.get_fat_details')
+    def test_register_pending_fats(self, get_fat_details):
+        def details(token):
+            if token.character_id == 12:
+                raise HTTPError(mock.Mock(status_code=502))
+            return 'Jita', 'No Station', 'Rifter'
+        get_fat_details.side_effect = details
+        # already registered by another click
+        Fat.objects.create(character=self.pending[1].character, fatlink=self.fatlink, system='Amarr',
+                           shiptype='Slasher', station='', user=self.user)
+
+        self.assertEqual(register_pending_fats(), 1)
+
+        self.assertEqual(set(Fat.objects.values_list('character__character_id', 'system')),
+                         {(10, 'Jita'), (11, 'Amarr')})
+        self.assertEqual(Fat.objects.get(character__character_id=10).corporation_id, 1)
+        self.assertEqual(set(FatMonthlyRollup.objects.values_list('shiptype', 'count')),
+                         {('Rifter', 1), ('Slasher', 1)})
+        self.assertEqual(PendingFat.objects.get().attempts, 1)
+
+        for i in range(REGISTRATION_MAX_ATTEMPTS - 1):
+            register_pending_fats()
+        self.assertFalse(PendingFat.objects.exists())
+
+    def test_pending_shown(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('auth_fatlink_view'))
+
+        self.assertEqual(len(response.context['pending_fats']), 3)
+        self.assertContains(response, 'Registration pending', count=3)
@@ -7,12 +7,14 @@ from django.contrib.auth.decorators import permission_required
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from alliance_auth.pagination import get_page
+from django.db.models import Q, Sum
 from eveonline.models import EveCharacter
 from eveonline.models import EveCorporationInfo
 from eveonline.managers import EveManager
 from fleetactivitytracking.forms import FatlinkForm
-from fleetactivitytracking.models import Fatlink, Fat
+from fleetactivitytracking.models import Fatlink, Fat, FatMonthlyRollup, PendingFat
+from fleetactivitytracking.tasks import get_fat_details, queue_registration
 
 from esi.decorators import token_required
 
@@ -28,26 +30,14 @@ logger = logging.getLogger(__name__)
 
 FATS_PER_PAGE = int(getattr(settings, 'FATS_PER_PAGE', 20))
 
-
-def get_page(model_list, page_num):
-    p = Paginator(model_list, FATS_PER_PAGE)
-    try:
-        fats = p.page(page_num)
-    except PageNotAnInteger:
-        fats = p.page(1)
-    except EmptyPage:
-        fats = p.page(p.num_pages)
-    return fats
+# optional setting to accept fatlink clicks straight away and fetch their location and ship in the background
+ASYNC_REGISTRATION = getattr(settings, 'FAT_ASYNC_REGISTRATION', False)
 
 
 class CorpStat(object):
-    def __init__(self, corp_id, start_of_month, start_of_next_month, corp=None):
-        if corp:
-            self.corp = corp
-        else:
-            self.corp = EveCorporationInfo.objects.get(corporation_id=corp_id)
-        self.n_fats = Fat.objects.filter(character__corporation_id=self.corp.corporation_id).filter(
-            fatlink__fatdatetime__gte=start_of_month).filter(fatlink__fatdatetime__lte=start_of_next_month).count()
+    def __init__(self, corp, n_fats=0):
+        self.corp = corp
+        self.n_fats = n_fats
         self.blue = self.corp.is_blue
 
     def avg_fat(self):
@@ -77,12 +67,13 @@ def fatlink_view(request):
     logger.debug("fatlink_view called by user %s" % request.user)
 
     latest_fats = Fat.objects.filter(user=user).order_by('-id')[:5]
+    pending_fats = PendingFat.objects.filter(user=user).select_related('fatlink', 'character').order_by('-id')
     if user.has_perm('auth.fleetactivitytracking'):
         latest_links = Fatlink.objects.all().order_by('-id')[:5]
-        context = {'user': user, 'fats': latest_fats, 'fatlinks': latest_links}
+        context = {'user': user, 'fats': latest_fats, 'pending_fats': pending_fats, 'fatlinks': latest_links}
 
     else:
-        context = {'user': user, 'fats': latest_fats}
+        context = {'user': user, 'fats': latest_fats, 'pending_fats': pending_fats}
 
     return render(request, 'fleetactivitytracking/fatlinkview.html', context=context)
 
@@ -96,27 +87,17 @@ def fatlink_statistics_view(request, year=datetime.date.today().year, month=date
     start_of_next_month = first_day_of_next_month(year, month)
     start_of_previous_month = first_day_of_previous_month(year, month)
 
-    fat_stats = {}
-
-    # get FAT stats for member corps
-    for corp_id in settings.STR_CORP_IDS:
-        fat_stats[corp_id] = CorpStat(corp_id, start_of_month, start_of_next_month)
-    for alliance_id in settings.STR_ALLIANCE_IDS:
-        alliance_corps = EveCorporationInfo.objects.filter(alliance__alliance_id=alliance_id)
-        for corp in alliance_corps:
-            fat_stats[corp.corporation_id] = CorpStat(corp.corporation_id, start_of_month, start_of_next_month)
-
-    # get FAT stats for corps not in alliance
-    fats_in_span = Fat.objects.filter(fatlink__fatdatetime__gte=start_of_month).filter(
-        fatlink__fatdatetime__lt=start_of_next_month).exclude(character__corporation_id__in=fat_stats)
+    # fats per corp from the monthly rollup, without scanning the month's fats
+    fat_counts = dict(FatMonthlyRollup.objects.filter(year=year, month=month).values_list(
+        'corporation_id').annotate(Sum('count')).order_by())
 
-    for fat in fats_in_span:
-        if fat.character.corporation_id not in fat_stats:
-            fat_stats[fat.character.corporation_id] = CorpStat(fat.character.corporation_id, start_of_month,
-                                                               start_of_next_month)
+    # member corps are always shown, other corps only if they have fats
+    corps = EveCorporationInfo.objects.filter(
+        Q(corporation_id__in=settings.STR_CORP_IDS) | Q(alliance__alliance_id__in=settings.STR_ALLIANCE_IDS) |
+        Q(corporation_id__in=[corp_id for corp_id in fat_counts if corp_id is not None]))
+    stat_list = [CorpStat(corp, fat_counts.get(corp.corporation_id, 0)) for corp in corps]
 
-    # collect and sort stats
-    stat_list = [fat_stats[x] for x in fat_stats]
+    # sort stats
     stat_list.sort(key=lambda stat: stat.corp.corporation_name)
     stat_list.sort(key=lambda stat: (stat.n_fats, stat.n_fats / stat.corp.member_count), reverse=True)
 
@@ -138,14 +119,11 @@ def fatlink_personal_statistics_view(request, year=datetime.date.today().year):
     user = request.user
     logger.debug("fatlink_personal_statistics_view called by user %s" % request.user)
 
-    personal_fats = Fat.objects.filter(user=user).order_by('id')
-
     monthlystats = [0 for month in range(1, 13)]
 
-    for fat in personal_fats:
-        fatdate = fat.fatlink.fatdatetime
-        if fatdate.year == year:
-            monthlystats[fatdate.month - 1] += 1
+    for month, n_fats in FatMonthlyRollup.objects.filter(user=user, year=year).values_list('month').annotate(
+            Sum('count')).order_by():
+        monthlystats[month - 1] = n_fats
 
     monthlystats = [(i + 1, datetime.date(year, i + 1, 1).strftime("%h"), monthlystats[i]) for i in range(12)]
 
@@ -172,14 +150,9 @@ def fatlink_monthly_personal_statistics_view(request, year, month, char_id=None)
         user = request.user
     logger.debug("Personal monthly statistics view for user %s called by %s" % (user, request.user))
 
-    personal_fats = Fat.objects.filter(user=user).filter(fatlink__fatdatetime__gte=start_of_month).filter(
-        fatlink__fatdatetime__lt=start_of_next_month)
-
-    ship_statistics = dict()
-    n_fats = 0
-    for fat in personal_fats:
-        ship_statistics[fat.shiptype] = ship_statistics.setdefault(fat.shiptype, 0) + 1
-        n_fats += 1
+    ship_statistics = dict(FatMonthlyRollup.objects.filter(user=user, year=year, month=month).values_list(
+        'shiptype').annotate(Sum('count')).order_by())
+    n_fats = sum(ship_statistics.values())
     context = {'user': user, 'shipStats': sorted(ship_statistics.items()), 'month': start_of_month.strftime("%h"),
                'year': year, 'n_fats': n_fats, 'char_id': char_id, 'previous_month': start_of_previous_month,
                'next_month': start_of_next_month}
@@ -203,30 +176,23 @@ def click_fatlink_view(request, token, hash, fatname):
 
             character = EveManager.get_character_by_id(token.character_id)
 
-            if character:
-                # get data
-                c = token.get_esi_client()
-                location = c.Location.get_characters_character_id_location(character_id=token.character_id).result()
-                ship = c.Location.get_characters_character_id_ship(character_id=token.character_id).result()
-                location['solar_system_name'] = \
-                    c.Universe.get_universe_systems_system_id(system_id=location['solar_system_id']).result()[
-                        'solar_system_name']
-                if location['structure_id']:
-                    location['station_name'] = \
-                        c.Universe.get_universe_structures_structure_id(structure_id=location['structure_id']).result()[
-                            'name']
-                elif location['station_id']:
-                    location['station_name'] = \
-                        c.Universe.get_universe_stations_station_id(station_id=location['station_id']).result()[
-                            'station_name']
+            if character and ASYNC_REGISTRATION:
+                # don't hold up the request waiting on ESI, a worker registers the fat in a batch
+                if Fat.objects.filter(character=character, fatlink=fatlink).exists():
+                    messages.error(request, 'Fat with this Character and Fatlink already exists.')
                 else:
-                    location['station_name'] = "No Station"
-                ship['ship_type_name'] = EveManager.get_itemtype(ship['ship_type_id']).name
+                    PendingFat.objects.get_or_create(character=character, fatlink=fatlink,
+                                                     defaults={'user': character.user, 'token': token})
+                    queue_registration()
+                    messages.success(request, 'Fleet participation queued for registration.')
+            elif character:
+                # get data
+                system, station, shiptype = get_fat_details(token)
 
                 fat = Fat()
-                fat.system = location['solar_system_name']
-                fat.station = location['station_name']
-                fat.shiptype = ship['ship_type_name']
+                fat.system = system
+                fat.station = station
+                fat.shiptype = shiptype
                 fat.fatlink = fatlink
                 fat.character = character
                 fat.user = character.user
@@ -315,7 +281,7 @@ def modify_fatlink_view(request, hash=""):
 
     registered_fats = Fat.objects.filter(fatlink=fatlink).order_by('character__character_name')
 
-    fat_page = get_page(registered_fats, request.GET.get('page', 1))
+    fat_page = get_page(registered_fats, request.GET.get('page', 1), FATS_PER_PAGE)
 
     context = {'fatlink': fatlink, 'registered_fats': fat_page}
 
@@ -1,10 +1,14 @@
 from __future__ import unicode_literals
+from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from datetime import datetime
 
 import logging
+import os
 import requests
 import json
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -13,23 +17,92 @@ userid = settings.FLEETUP_USER_ID
 apiid = settings.FLEETUP_API_ID
 groupid = settings.FLEETUP_GROUP_ID
 
+BASE_URL = "http://api.fleet-up.com/Api.svc/"
+REQUEST_TIMEOUT = float(getattr(settings, 'FLEETUP_REQUEST_TIMEOUT', 10))
+# seconds a response is served before being refreshed in the background
+CACHE_FRESH = int(getattr(settings, 'FLEETUP_CACHE_FRESH', 5 * 60))
+# seconds a stale response is still served while it is refreshed, in case Fleet-Up is down
+CACHE_TIMEOUT = int(getattr(settings, 'FLEETUP_CACHE_TIMEOUT', 24 * 60 * 60))
+
+RESPONSE_KEY = 'FLEETUP_RESPONSE_%s'
+REFRESH_LOCK_KEY = 'FLEETUP_REFRESH_%s'
+
 
 class FleetUpManager:
+    # group wide endpoints kept up to date by fleetup.tasks.refresh_fleetup
+    GROUP_ENDPOINTS = ('GroupCharacters', 'Operations', 'Timers', 'Doctrines', 'Fittings')
+
+    _session = None
+    _pid = None
+
     def __init__(self):
         pass
 
+    @classmethod
+    def session(cls):
+        # pool connections to Fleet-Up, but don't share them with a forked worker
+        if cls._session is None or cls._pid != os.getpid():
+            cls._session = requests.Session()
+            cls._pid = os.getpid()
+        return cls._session
+
+    @staticmethod
+    def is_configured():
+        return all((appkey, userid, apiid, groupid))
+
+    @staticmethod
+    def group_paths():
+        return ["%s/%s" % (endpoint, groupid) for endpoint in FleetUpManager.GROUP_ENDPOINTS]
+
+    @staticmethod
+    def fetch(path):
+        """
+        Fetch an API path from Fleet-Up and cache the response
+        :param path: path below the API key, e.g. Operations/<groupid>
+        :return: decoded JSON response
+        :raises requests.exceptions.RequestException: if Fleet-Up could not be reached or returned an error
+        :raises ValueError: if the response is not JSON
+        """
+        url = BASE_URL + str(appkey) + "/" + str(userid) + "/" + str(apiid) + "/" + path
+        r = FleetUpManager.session().get(url, timeout=REQUEST_TIMEOUT)
+        # don't replace a good cached response with an error page
+        r.raise_for_status()
+        data = json.loads(r.content.decode())
+        cache.set(RESPONSE_KEY % path, {'data': data, 'fetched': time.time()}, CACHE_TIMEOUT)
+        return data
+
+    @staticmethod
+    def _get_json(path):
+        """
+        Get a cached API response, only waiting on Fleet-Up if nothing is cached.
+        Stale responses are served while a refresh is queued, or refreshed in this request
+        if the fleetup app isn't installed for workers to run its tasks.
+        """
+        cached = cache.get(RESPONSE_KEY % path)
+        if cached is None:
+            return FleetUpManager.fetch(path)
+        if time.time() - cached['fetched'] > CACHE_FRESH and cache.add(REFRESH_LOCK_KEY % path, True,
+                                                                        int(REQUEST_TIMEOUT) * 6):
+            if apps.is_installed('fleetup'):
+                from fleetup.tasks import refresh_fleetup_path
+                refresh_fleetup_path.delay(path)
+            else:
+                # the lock is left to expire so a failing Fleet-Up isn't retried on every page
+                try:
+                    return FleetUpManager.fetch(path)
+                except (requests.exceptions.RequestException, ValueError, UnicodeDecodeError) as e:
+                    logger.warn("Failed to refresh Fleet-Up %s, serving stale data: %s" % (path, e))
+        return cached['data']
+
     @staticmethod
     def get_fleetup_members():
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/GroupCharacters/" + str(groupid) + ""
         try:
-            jsondata = requests.get(url).content
-            fmembers = json.loads(jsondata.decode())
+            fmembers = FleetUpManager._get_json("GroupCharacters/%s" % groupid)
             return {row["UserId"]: {"user_id": row["UserId"],
                                     "char_name": row["EveCharName"],
                                     "char_id": row["EveCharId"],
                                     "corporation": row["Corporation"]} for row in fmembers["Data"]}
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError, TypeError):
             logger.debug("No fleetup members retrieved.")
@@ -37,11 +110,8 @@ class FleetUpManager:
 
     @staticmethod
     def get_fleetup_operations():
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/Operations/" + str(groupid) + ""
         try:
-            jsondata = requests.get(url).content
-            foperations = json.loads(jsondata.decode())
+            foperations = FleetUpManager._get_json("Operations/%s" % groupid)
             return {row["StartString"]: {"subject": row["Subject"],
                                          "start": (datetime.strptime(row["StartString"], "%Y-%m-%d %H:%M:%S")),
                                          "end": (datetime.strptime(row["EndString"], "%Y-%m-%d %H:%M:%S")),
@@ -52,7 +122,7 @@ class FleetUpManager:
                                          "url": row["Url"],
                                          "doctrine": row["Doctrines"],
                                          "organizer": row["Organizer"]} for row in foperations["Data"]}
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError):
             logger.debug("No fleetup operations retrieved.")
@@ -60,11 +130,8 @@ class FleetUpManager:
 
     @staticmethod
     def get_fleetup_timers():
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/Timers/" + str(groupid) + ""
         try:
-            jsondata = requests.get(url).content
-            ftimers = json.loads(jsondata.decode())
+            ftimers = FleetUpManager._get_json("Timers/%s" % groupid)
             return {row["ExpiresString"]: {"solarsystem": row["SolarSystem"],
                                            "planet": row["Planet"],
                                            "moon": row["Moon"],
@@ -73,7 +140,7 @@ class FleetUpManager:
                                            "timer_type": row["TimerType"],
                                            "expires": (datetime.strptime(row["ExpiresString"], "%Y-%m-%d %H:%M:%S")),
                                            "notes": row["Notes"]} for row in ftimers["Data"]}
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError, TypeError):
             logger.debug("No fleetup timers retrieved.")
@@ -81,13 +148,10 @@ class FleetUpManager:
 
     @staticmethod
     def get_fleetup_doctrines():
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/Doctrines/" + str(groupid) + ""
         try:
-            jsondata = requests.get(url).content
-            fdoctrines = json.loads(jsondata.decode())
+            fdoctrines = FleetUpManager._get_json("Doctrines/%s" % groupid)
             return {"fleetup_doctrines": fdoctrines["Data"]}
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError):
             logger.debug("No fleetup doctrines retrieved.")
@@ -95,13 +159,10 @@ class FleetUpManager:
 
     @staticmethod
     def get_fleetup_doctrine(doctrinenumber):
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/DoctrineFittings/%s" % doctrinenumber
         try:
-            jsondata = requests.get(url).content
-            fdoctrine = json.loads(jsondata.decode())
+            fdoctrine = FleetUpManager._get_json("DoctrineFittings/%s" % doctrinenumber)
             return {"fitting_doctrine": fdoctrine}
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError):
             logger.warn("Fleetup doctrine number %s not found" % doctrinenumber)
@@ -109,11 +170,8 @@ class FleetUpManager:
 
     @staticmethod
     def get_fleetup_fittings():
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/Fittings/" + str(groupid) + ""
         try:
-            jsondata = requests.get(url).content
-            ffittings = json.loads(jsondata.decode())
+            ffittings = FleetUpManager._get_json("Fittings/%s" % groupid)
             return {row["FittingId"]: {"fitting_id": row["FittingId"],
                                        "name": row["Name"],
                                        "icon_id": row["EveTypeId"],
@@ -125,7 +183,7 @@ class FleetUpManager:
                                        "last_update": (
                                        datetime.strptime(row["LastUpdatedString"], "%Y-%m-%d %H:%M:%S"))} for row in
                     ffittings["Data"]}
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError, TypeError):
             logger.debug("No fleetup fittings retrieved.")
@@ -133,13 +191,10 @@ class FleetUpManager:
 
     @staticmethod
     def get_fleetup_fitting(fittingnumber):
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/Fitting/%s" % fittingnumber
         try:
-            jsondata = requests.get(url).content
-            ffitting = json.loads(jsondata.decode())
+            ffitting = FleetUpManager._get_json("Fitting/%s" % fittingnumber)
             return {"fitting_data": ffitting["Data"]}
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError):
             logger.warn("Fleetup fitting number %s not found" % fittingnumber)
@@ -149,13 +204,10 @@ class FleetUpManager:
 
     @staticmethod
     def get_fleetup_doctrineid(fittingnumber):
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/Fitting/%s" % fittingnumber
         try:
-            jsondata = requests.get(url).content
-            fdoctrineid = json.loads(jsondata.decode())
+            fdoctrineid = FleetUpManager._get_json("Fitting/%s" % fittingnumber)
             return fdoctrineid['Data']['Doctrines'][0]['DoctrineId']
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError):
             logger.warn("Fleetup doctrine number not found for fitting number %s" % fittingnumber)
@@ -165,13 +217,10 @@ class FleetUpManager:
 
     @staticmethod
     def get_fleetup_fitting_eft(fittingnumber):
-        url = "http://api.fleet-up.com/Api.svc/" + str(appkey) + "/" + str(userid) + "/" + str(
-            apiid) + "/Fitting/%s/eft" % fittingnumber
         try:
-            jsondata = requests.get(url).content
-            ffittingeft = json.loads(jsondata.decode())
+            ffittingeft = FleetUpManager._get_json("Fitting/%s/eft" % fittingnumber)
             return {"fitting_eft": ffittingeft["Data"]["FittingData"]}
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             logger.warn("Can't connect to Fleet-Up API, is it offline?!")
         except (ValueError, UnicodeDecodeError):
             logger.warn("Fleetup fitting eft not found for fitting number %s" % fittingnumber)
@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+
+import logging
+
+import requests
+from celery.task import task, periodic_task
+from celery.task.schedules import crontab
+from django.core.cache import cache
+
+from fleetup.managers import FleetUpManager, REFRESH_LOCK_KEY
+
+logger = logging.getLogger(__name__)
+
+
+@task
+def refresh_fleetup_path(path):
+    """
+    Refresh a cached Fleet-Up API response
+    :param path: API path as passed to FleetUpManager.fetch
+    """
+    try:
+        FleetUpManager.fetch(path)
+    except (requests.exceptions.RequestException, ValueError, UnicodeDecodeError) as e:
+        logger.warn("Failed to refresh Fleet-Up %s, serving stale data: %s" % (path, e))
+    finally:
+        cache.delete(REFRESH_LOCK_KEY % path)
+
+
+@periodic_task(run_every=crontab(minute="*/5"))
+def refresh_fleetup():
+    if not FleetUpManager.is_configured():
+        logger.debug("Fleet-Up is not configured, skipping refresh")
+        return
+    for path in FleetUpManager.group_paths():
+        refresh_fleetup_path(path)
@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+import json
+import time
+
+import requests
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from alliance_auth.tests.cache_utils import LOCMEM_CACHE
+
+from .managers import FleetUpManager, RESPONSE_KEY, CACHE_FRESH
+from .tasks import refresh_fleetup
+
+
+FITTING = {'Data': {'FittingId': 1, 'Name': 'Rifter', 'Doctrines': [{'DoctrineId': 7}]}}
+
+
+def response(data):
+    r = mock.Mock()
+    r.content = json.dumps(data).encode('utf-8')
+    return r
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class FleetUpManagerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(FleetUpManager, 'session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.multiple('fleetup.managers', appkey='key', userid=1, apiid='api', groupid=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fitting_fetched_once(self):
+        self.session.get.return_value = response(FITTING)
+
+        self.assertEqual(FleetUpManager.get_fleetup_fitting(1), {'fitting_data': FITTING['Data']})
+        self.assertEqual(FleetUpManager.get_fleetup_doctrineid(1), 7)
+
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_stale_response_served_while_refreshing(self):
+        cache.set(RESPONSE_KEY % 'Fitting/1', {'data': FITTING, 'fetched': time.time() - CACHE_FRESH - 1})
+        updated = {'Data': {'FittingId': 1, 'Name': 'Updated Rifter', 'Doctrines': []}}
+        self.session.get.return_value = response(updated)
+
+        with mock.patch('fleetup.tasks.refresh_fleetup_path') as refresh:
+            self.assertEqual(FleetUpManager.get_fleetup_fitting(1), {'fitting_data': FITTING['Data']})
+            self.assertEqual(FleetUpManager.get_fleetup_fitting(1), {'fitting_data': FITTING['Data']})
+            refresh.delay.assert_called_once_with('Fitting/1')
+        self.session.get.assert_not_called()
+
+    @mock.patch('fleetup.managers.apps.is_installed', return_value=False)
+    def test_stale_response_refreshed_without_workers(self, is_installed):
+        cache.set(RESPONSE_KEY % 'Fitting/1', {'data': FITTING, 'fetched': time.time() - CACHE_FRESH - 1})
+        updated = {'Data': {'FittingId': 1, 'Name': 'Updated Rifter', 'Doctrines': []}}
+        self.session.get.return_value = response(updated)
+
+        with mock.patch('fleetup.tasks.refresh_fleetup_path') as refresh:
+            self.assertEqual(FleetUpManager.get_fleetup_fitting(1), {'fitting_data': updated['Data']})
+            refresh.delay.assert_not_called()
+        is_installed.assert_called_with('fleetup')
+
+    @mock.patch('fleetup.managers.apps.is_installed', return_value=False)
+    def test_error_response_keeps_stale_data(self, is_installed):
+        cache.set(RESPONSE_KEY % 'Fitting/1', {'data': FITTING, 'fetched': time.time() - CACHE_FRESH - 1})
+        r = response({'Data': None, 'Message': 'Service Unavailable'})
+        r.raise_for_status.side_effect = requests.exceptions.HTTPError('503 Server Error')
+        self.session.get.return_value = r
+
+        self.assertEqual(FleetUpManager.get_fleetup_fitting(1), {'fitting_data': FITTING['Data']})
+        self.assertEqual(cache.get(RESPONSE_KEY % 'Fitting/1')['data'], FITTING)
+
+    def test_refresh_fleetup(self):
+        self.session.get.return_value = response({'Data': []})
+
+        refresh_fleetup()
+
+        self.assertEqual(self.session.get.call_count, len(FleetUpManager.GROUP_ENDPOINTS))
+        self.session.get.reset_mock()
+        self.assertEqual(FleetUpManager.get_fleetup_timers(), {})
+        self.assertEqual(FleetUpManager.get_fleetup_doctrines(), {'fleetup_doctrines': []})
+        self.session.get.assert_not_called()
+
+    @mock.patch('fleetup.managers.appkey', '')
+    def test_refresh_skipped_when_unconfigured(self):
+        refresh_fleetup()
+
+        self.session.get.assert_not_called()
+
+    def test_refresh_failure_keeps_stale_response(self):
+        doctrines = {'Data': [{'DoctrineId': 7}]}
+        cache.set(RESPONSE_KEY % 'Doctrines/2', {'data': doctrines, 'fetched': time.time() - CACHE_FRESH - 1})
+        self.session.get.side_effect = requests.exceptions.Timeout()
+
+        refresh_fleetup()
+
+        self.assertEqual(FleetUpManager.get_fleetup_doctrines(), {'fleetup_doctrines': doctrines['Data']})
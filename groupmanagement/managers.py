@@ -39,7 +39,8 @@ class GroupManager:
         :return: bool True if user can manage groups, False otherwise
         """
         if user.is_authenticated:
-            return cls.has_management_permission(user) or (user.leads_groups.all() and UserState.member_state(user))
+            return cls.has_management_permission(user) or (
+                UserState.member_state(user) and user.leads_groups.exists())
         return False
 
     @classmethod
@@ -52,5 +53,5 @@ class GroupManager:
         """
         if user.is_authenticated:
             return cls.has_management_permission(user) or (
-                user.leads_groups.filter(group=group).exists() and UserState.member_state(user))
+                UserState.member_state(user) and user.leads_groups.filter(group=group).exists())
         return False
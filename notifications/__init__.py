@@ -6,11 +6,27 @@ logger = logging.getLogger(__name__)
 MAX_NOTIFICATIONS = 50
 
 
+def _trim(user_pks):
+    """
+    Delete the oldest notifications of users with more than MAX_NOTIFICATIONS
+    :param user_pks: User primary keys
+    """
+    from django.db.models import Count
+    from .models import Notification
+    # clear the default ordering so it isn't added to the GROUP BY
+    over_limit = Notification.objects.filter(user__pk__in=user_pks).order_by().values('user').annotate(
+        total=Count('pk')).filter(total__gt=MAX_NOTIFICATIONS).values_list('user', flat=True)
+    excess = []
+    for user_pk in over_limit:
+        excess += Notification.objects.filter(user__pk=user_pk).order_by('-timestamp', '-pk').values_list(
+            'pk', flat=True)[MAX_NOTIFICATIONS:]
+    if excess:
+        Notification.objects.filter(pk__in=excess).delete()
+        logger.debug("Trimmed %s old notifications" % len(excess))
+
+
 def notify(user, title, message=None, level='info'):
     from .models import Notification
-    if Notification.objects.filter(user=user).count() > MAX_NOTIFICATIONS:
-        for n in Notification.objects.filter(user=user)[MAX_NOTIFICATIONS-1:]:
-            n.delete()
     notif = Notification()
     notif.user = user
     notif.title = title
@@ -19,4 +35,25 @@ def notify(user, title, message=None, level='info'):
     notif.message = message
     notif.level = level
     notif.save()
+    _trim([user.pk])
     logger.info("Created notification %s" % notif)
+
+
+def notify_many(users, title, message=None, level='info'):
+    """
+    Create the same notification for many users at once
+    :param users: iterable of django.contrib.auth.models.User or a User queryset
+    :param title: notification title
+    :param message: notification message, defaults to the title
+    :param level: notification level
+    """
+    from .models import Notification
+    if hasattr(users, 'values_list'):
+        user_pks = list(users.values_list('pk', flat=True))
+    else:
+        user_pks = [user.pk for user in users]
+    Notification.objects.bulk_create([
+        Notification(user_id=pk, title=title, message=message or title, level=level) for pk in user_pks])
+    _trim(user_pks)
+    Notification.objects.invalidate_user_notification_cache(*user_pks)
+    logger.info("Created notification %s for %s users" % (title, len(user_pks)))
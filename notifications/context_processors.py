@@ -3,4 +3,6 @@ from notifications.models import Notification
 
 
 def user_notification_count(request):
-    return {'notifications': len(Notification.objects.filter(user__id=request.user.id).filter(viewed=False))}
+    if not request.user.is_authenticated:
+        return {'notifications': 0}
+    return {'notifications': Notification.objects.user_unread_count(request.user.pk)}
@@ -8,7 +8,7 @@ class NotificationHandler(logging.Handler):
     def emit(self, record):
         from django.contrib.auth.models import User, Permission
         from django.db.models import Q
-        from notifications import notify
+        from notifications import notify_many
         from notifications.models import Notification
 
         try:
@@ -21,12 +21,11 @@ class NotificationHandler(logging.Handler):
 
             users = User.objects.filter(Q(groups__permissions=perm) | Q(user_permissions=perm) | Q(is_superuser=True)).distinct()
 
-            for user in users:
-                notify(
-                    user,
-                    "%s [%s:%s]" % (record.levelname, record.funcName, record.lineno),
-                    level = str([item[0] for item in Notification.LEVEL_CHOICES if item[1] == record.levelname][0]),
-                    message = message
-                )
+            notify_many(
+                users,
+                "%s [%s:%s]" % (record.levelname, record.funcName, record.lineno),
+                level = str([item[0] for item in Notification.LEVEL_CHOICES if item[1] == record.levelname][0]),
+                message = message
+            )
         except Permission.DoesNotExist:
             pass
@@ -0,0 +1,32 @@
+from __future__ import unicode_literals
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+# optional setting for how long unread counts are cached, as a safety net for changes made outside the ORM
+UNREAD_COUNT_CACHE_TIMEOUT = int(getattr(settings, 'NOTIFICATIONS_UNREAD_COUNT_CACHE_TIMEOUT', 5 * 60))
+
+UNREAD_COUNT_KEY = 'NOTIFICATIONS_UNREAD_COUNT_%s'
+
+
+class NotificationManager(models.Manager):
+    def user_unread_count(self, user_pk):
+        """
+        Get the number of unread notifications for a user, from the cache if possible
+        :param user_pk: User primary key
+        :return: int
+        """
+        key = UNREAD_COUNT_KEY % user_pk
+        count = cache.get(key)
+        if count is None:
+            count = self.filter(user__pk=user_pk, viewed=False).count()
+            cache.set(key, count, UNREAD_COUNT_CACHE_TIMEOUT)
+        return count
+
+    @staticmethod
+    def invalidate_user_notification_cache(*user_pks):
+        """
+        Clear the cached unread counts of users whose notifications have changed
+        :param user_pks: User primary keys
+        """
+        cache.delete_many([UNREAD_COUNT_KEY % pk for pk in user_pks])
@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 from django.utils.encoding import python_2_unicode_compatible
 from django.db import models
 from django.contrib.auth.models import User
+from notifications.managers import NotificationManager
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +25,17 @@ class Notification(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     viewed = models.BooleanField(default=False)
 
+    objects = NotificationManager()
+
+    def save(self, *args, **kwargs):
+        super(Notification, self).save(*args, **kwargs)
+        Notification.objects.invalidate_user_notification_cache(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        result = super(Notification, self).delete(*args, **kwargs)
+        Notification.objects.invalidate_user_notification_cache(self.user_id)
+        return result
+
     def view(self):
         logger.info("Marking notification as viewed: %s" % self)
         self.viewed = True
@@ -37,3 +49,6 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        index_together = [
+            ('user', 'viewed', 'timestamp'),
+        ]
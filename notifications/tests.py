@@ -1 +1,75 @@
-# Create your tests here.
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory, override_settings
+
+from alliance_auth.tests.auth_utils import AuthUtils
+from alliance_auth.tests.cache_utils import LOCMEM_CACHE
+
+from . import notify, notify_many, MAX_NOTIFICATIONS
+from .context_processors import user_notification_count
+from .models import Notification
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class NotificationTestCase(TestCase):
+    def setUp(self):
+        self.user = AuthUtils.create_user('user_1', disconnect_signals=True)
+        self.other = AuthUtils.create_user('user_2', disconnect_signals=True)
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_notify_trims_old(self):
+        for i in range(MAX_NOTIFICATIONS + 5):
+            notify(self.user, 'Notification %s' % i)
+
+        notifications = Notification.objects.filter(user=self.user)
+        self.assertEqual(notifications.count(), MAX_NOTIFICATIONS)
+        self.assertEqual(notifications.first().title, 'Notification %s' % (MAX_NOTIFICATIONS + 4))
+        self.assertFalse(notifications.filter(title='Notification 4').exists())
+
+    def test_notify_many(self):
+        for i in range(MAX_NOTIFICATIONS):
+            notify(self.user, 'Old %s' % i)
+
+        notify_many([self.user, self.other], 'Mass', message='Mass message', level='danger')
+
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), MAX_NOTIFICATIONS)
+        self.assertEqual(Notification.objects.filter(user=self.user).first().title, 'Mass')
+        notif = Notification.objects.get(user=self.other)
+        self.assertEqual(notif.message, 'Mass message')
+        self.assertEqual(notif.level, 'danger')
+
+    def test_unread_count_cached(self):
+        notify(self.user, 'First')
+        self.assertEqual(Notification.objects.user_unread_count(self.user.pk), 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Notification.objects.user_unread_count(self.user.pk), 1)
+
+    def test_unread_count_invalidated(self):
+        notify(self.user, 'First')
+        self.assertEqual(Notification.objects.user_unread_count(self.user.pk), 1)
+
+        notify_many([self.user], 'Second')
+        self.assertEqual(Notification.objects.user_unread_count(self.user.pk), 2)
+
+        Notification.objects.get(title='First').view()
+        self.assertEqual(Notification.objects.user_unread_count(self.user.pk), 1)
+
+        Notification.objects.get(title='Second').delete()
+        self.assertEqual(Notification.objects.user_unread_count(self.user.pk), 0)
+
+    def test_context_processor(self):
+        notify(self.user, 'First')
+        request = RequestFactory().get('/')
+
+        request.user = self.user
+        self.assertEqual(user_notification_count(request), {'notifications': 1})
+
+        request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            self.assertEqual(user_notification_count(request), {'notifications': 0})
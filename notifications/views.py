@@ -57,6 +57,7 @@ def remove_notification(request, notif_id):
 def mark_all_read(request):
     logger.debug('mark all notifications read called by user %s' % request.user)
     Notification.objects.filter(user=request.user).update(viewed=True)
+    Notification.objects.invalidate_user_notification_cache(request.user.pk)
     messages.success(request, 'Marked all notifications as read.')
     return redirect('auth_notification_list')
 
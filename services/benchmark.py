@@ -0,0 +1,69 @@
+"""
+Benchmark for rendering the hooked menus in the base template
+
+Registers synthetic menu items under a hook name no template uses, renders them
+for a user created inside a transaction and rolls everything back afterwards.
+
+    python manage.py shell -c "from services.benchmark import run; run()"
+"""
+from __future__ import print_function, unicode_literals
+
+import sys
+import timeit
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import transaction
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from alliance_auth import hooks
+from authentication.models import AuthServicesInfo
+from services.hooks import MenuItemHook
+from services.templatetags.menu_items import process_menu_items, menu_cache
+
+HOOK_NAME = 'benchmark_menu_hook'
+URL_NAMES = ('auth_dashboard', 'auth_groups', 'auth_help', 'auth_services', 'auth_fatlink_view')
+
+
+class Rollback(Exception):
+    pass
+
+
+def register(items):
+    if hooks.get_hooks(HOOK_NAME):
+        return
+    for i in range(items):
+        hooks.register(HOOK_NAME, lambda i=i: MenuItemHook('Benchmark %d' % i, 'fa fa-cogs fa-fw',
+                                                           URL_NAMES[i % len(URL_NAMES)], order=items - i))
+
+
+def uncached_menu(request):
+    # Menu items as services.templatetags.menu_items used to build them on every render
+    items = [fn() for fn in hooks.get_hooks(HOOK_NAME)]
+    items.sort(key=lambda i: i.order)
+    return [item.render(request) for item in items]
+
+
+def run(items=10, iterations=200, out=sys.stdout):
+    register(items)
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user('benchmark_menu')
+            AuthServicesInfo.objects.get_or_create(user=user)
+            request = RequestFactory().get(reverse('auth_dashboard'))
+            request.user = user
+            request.resolver_match = resolve(request.path)
+            user.get_all_permissions()
+
+            elapsed = timeit.timeit(lambda: uncached_menu(request), number=iterations)
+            print('%-20s %5d items      %8.3fms' % ('uncached menu', items, elapsed * 1000 / iterations), file=out)
+            menu_cache.clear()
+            elapsed = timeit.timeit(lambda: process_menu_items(HOOK_NAME, request), number=iterations)
+            print('%-20s %5d items      %8.3fms' % ('cached menu', items, elapsed * 1000 / iterations), file=out)
+            request.user = AnonymousUser()
+            elapsed = timeit.timeit(lambda: process_menu_items(HOOK_NAME, request), number=iterations)
+            print('%-20s %5d items      %8.3fms' % ('cached anon menu', items, elapsed * 1000 / iterations),
+                  file=out)
+            raise Rollback
+    except Rollback:
+        pass
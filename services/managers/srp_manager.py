@@ -1,16 +1,41 @@
 from __future__ import unicode_literals
 from django.conf import settings
+from django.core.cache import cache
 
+import os
 import requests
 import logging
 
 logger = logging.getLogger(__name__)
 
+# optional settings for where kill data is fetched from and how long to wait for it
+KILLBOARD_URL = getattr(settings, 'SRP_KILLBOARD_URL', 'https://www.zkillboard.com/api/killID/%s')
+KILLBOARD_TIMEOUT = float(getattr(settings, 'SRP_KILLBOARD_TIMEOUT', 10))
+# killmails never change, so they can be cached for a long time
+KILL_DATA_CACHE_TIMEOUT = int(getattr(settings, 'SRP_KILL_DATA_CACHE_TIMEOUT', 60 * 60 * 24 * 30))
+
+KILL_DATA_KEY = 'SRP_KILL_DATA_%s'
+
 
 class srpManager:
+    _session = None
+    _pid = None
+
     def __init__(self):
         pass
 
+    @classmethod
+    def session(cls):
+        # pool connections to the killboard, but don't share them with a forked worker
+        if cls._session is None or cls._pid != os.getpid():
+            cls._session = requests.Session()
+            cls._session.headers.update({
+                'User-Agent': "%s Alliance Auth" % settings.DOMAIN,
+                'Content-Type': 'application/json',
+            })
+            cls._pid = os.getpid()
+        return cls._session
+
     @staticmethod
     def get_kill_id(killboard_link):
         num_set = '0123456789'
@@ -19,18 +44,33 @@ class srpManager:
 
     @staticmethod
     def get_kill_data(kill_id):
-        url = ("https://www.zkillboard.com/api/killID/%s" % kill_id)
-        headers = {
-            'User-Agent': "%s Alliance Auth" % settings.DOMAIN,
-            'Content-Type': 'application/json',
-        }
-        r = requests.get(url, headers=headers)
-        result = r.json()[0]
+        """
+        Get the ship type and total value of a kill, from the cache if possible
+        :param kill_id: zKillboard kill ID
+        :return: tuple of ship type ID and total value
+        :raises ValueError: if the kill does not exist
+        :raises requests.RequestException: if the killboard could not be reached or gave an unreadable response
+        """
+        if not kill_id:
+            raise ValueError("Invalid Kill ID")
+        key = KILL_DATA_KEY % kill_id
+        data = cache.get(key)
+        if data is not None:
+            return tuple(data)
+        r = srpManager.session().get(KILLBOARD_URL % kill_id, timeout=KILLBOARD_TIMEOUT)
+        r.raise_for_status()
+        try:
+            result = r.json()
+        except ValueError as e:
+            # a maintenance page says nothing about whether the kill exists
+            raise requests.RequestException("Unreadable killboard response for kill ID %s: %s" % (kill_id, e))
+        result = result[0] if result else None
         if result:
             ship_type = result['victim']['shipTypeID']
             logger.debug("Ship type for kill ID %s is determined to be %s" % (kill_id, ship_type))
             ship_value = result['zkb']['totalValue']
             logger.debug("total loss value for kill id %s is %s" % (kill_id, ship_value))
+            cache.set(key, (ship_type, ship_value), KILL_DATA_CACHE_TIMEOUT)
             return ship_type, ship_value
         else:
             raise ValueError("Invalid Kill ID")
@@ -0,0 +1,210 @@
+from __future__ import unicode_literals
+
+import logging
+import math
+import os
+import re
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    # Py3
+    from urllib.parse import urlparse
+except ImportError:
+    # Py2
+    from urlparse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Longest we will sleep waiting for a rate limit before giving up and letting the caller reschedule
+MAX_RATE_LIMIT_WAIT = float(getattr(settings, 'DISCORD_RATE_LIMIT_MAX_WAIT', 60))
+# Times a request is retried after a 429 response
+MAX_RATE_LIMIT_RETRIES = int(getattr(settings, 'DISCORD_RATE_LIMIT_RETRIES', 3))
+REQUEST_TIMEOUT = float(getattr(settings, 'DISCORD_REQUEST_TIMEOUT', 30))
+
+GLOBAL_LIMIT_KEY = 'DISCORD_RATE_LIMIT_GLOBAL'
+BUCKET_KEY = 'DISCORD_RATE_LIMIT_BUCKET_%s'
+BUCKET_USED_KEY = 'DISCORD_RATE_LIMIT_USED_%s'
+
+# Top level resources which get their own rate limit buckets per ID
+MAJOR_PARAMETERS = ('guilds', 'channels', 'webhooks')
+SNOWFLAKE_RE = re.compile(r'/([^/]+)/(\d+)')
+
+
+class DiscordRateLimited(Exception):
+    def __init__(self, retry_after):
+        """
+        Raised when a request cannot be made within the maximum wait
+        :param retry_after: seconds until the request may be made
+        """
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return 'Discord rate limit exceeded, retry after %.1f seconds' % self.retry_after
+
+
+class DiscordClient(object):
+    """
+    Discord REST client sharing rate limit state between processes through the cache
+
+    Rate limit buckets are tracked per route from the X-RateLimit-* response headers.
+    Each request reserves one of its bucket's remaining requests before being sent, and
+    waits for an exhausted bucket or the global limit to reset rather than being sent
+    and rejected with a 429.
+    """
+    def __init__(self):
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self):
+        # Don't share pooled connections with a forked worker
+        if self._session is None or self._pid != os.getpid():
+            self._session = requests.Session()
+            self._pid = os.getpid()
+        return self._session
+
+    @staticmethod
+    def route(method, url):
+        """
+        Get the rate limit bucket of a request. IDs other than major parameters are generalised.
+        :param method: HTTP method
+        :param url: request URL
+        :return: str
+        """
+        def generalise(match):
+            if match.group(1) in MAJOR_PARAMETERS:
+                return match.group(0)
+            return '/%s/{id}' % match.group(1)
+        return '%s %s' % (method.upper(), SNOWFLAKE_RE.sub(generalise, urlparse(url).path))
+
+    @staticmethod
+    def _bucket_key(route, key=BUCKET_KEY):
+        # memcached does not allow whitespace in keys
+        return key % route.replace(' ', '_')
+
+    @staticmethod
+    def _set(key, value, reset):
+        cache.set(key, value, max(1, int(math.ceil(reset - time.time()))))
+
+    @staticmethod
+    def wait_time(route, reserve=False):
+        """
+        Seconds until a request on the given route may be made
+        :param route: rate limit bucket from route()
+        :param reserve: take one of the bucket's remaining requests, so concurrent workers can't all send the last
+        :return: float
+        """
+        now = time.time()
+        until = cache.get(GLOBAL_LIMIT_KEY) or now
+        bucket = cache.get(DiscordClient._bucket_key(route))
+        if bucket:
+            used_key = DiscordClient._bucket_key(route, BUCKET_USED_KEY)
+            if reserve:
+                # incremented rather than decremented as memcached won't count below zero
+                try:
+                    used = cache.incr(used_key)
+                except ValueError:
+                    used = 1
+                exhausted = used > bucket['remaining']
+            else:
+                exhausted = (cache.get(used_key) or 0) >= bucket['remaining']
+            if exhausted:
+                until = max(until, bucket['reset'])
+        return max(0, until - now)
+
+    def _wait(self, route):
+        delay = self.wait_time(route, reserve=True)
+        if delay > MAX_RATE_LIMIT_WAIT:
+            raise DiscordRateLimited(delay)
+        if delay > 0:
+            logger.debug("Waiting %.2f seconds for Discord rate limit on %s" % (delay, route))
+            time.sleep(delay)
+
+    def _update(self, route, response):
+        """
+        Record the rate limit state reported by a response
+        :return: seconds to wait before retrying if the request was rate limited, otherwise None
+        """
+        now = time.time()
+        headers = response.headers
+        if 'X-RateLimit-Remaining' in headers:
+            if 'X-RateLimit-Reset-After' in headers:
+                reset = now + float(headers['X-RateLimit-Reset-After'])
+            else:
+                reset = float(headers.get('X-RateLimit-Reset', now))
+            self._record(route, int(headers['X-RateLimit-Remaining']), reset)
+
+        if response.status_code != 429:
+            return None
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if 'retry_after' in data:
+            # the body gives milliseconds
+            retry_after = float(data['retry_after']) / 1000
+        else:
+            # the Retry-After header gives seconds
+            retry_after = float(headers.get('Retry-After', 1))
+        if data.get('global') or headers.get('X-RateLimit-Global'):
+            logger.warn("Hit Discord global rate limit, retrying after %.2f seconds" % retry_after)
+            self._set(GLOBAL_LIMIT_KEY, now + retry_after, now + retry_after)
+        else:
+            logger.warn("Hit Discord rate limit on %s, retrying after %.2f seconds" % (route, retry_after))
+            self._set(self._bucket_key(route), {'remaining': 0, 'reset': now + retry_after}, now + retry_after)
+            self._set(self._bucket_key(route, BUCKET_USED_KEY), 0, now + retry_after)
+        return retry_after
+
+    def _record(self, route, remaining, reset):
+        """
+        Record the remaining requests a response reported for its bucket
+        """
+        key = self._bucket_key(route)
+        used_key = self._bucket_key(route, BUCKET_USED_KEY)
+        bucket = cache.get(key)
+        if bucket and abs(bucket['reset'] - reset) < 1:
+            # same window, where requests reserved by other workers may not have reached Discord yet
+            used = cache.get(used_key) or 0
+            remaining = min(bucket['remaining'], remaining + used)
+        else:
+            self._set(used_key, 0, reset)
+        self._set(key, {'remaining': remaining, 'reset': reset}, reset)
+
+    def request(self, method, url, **kwargs):
+        """
+        Make a rate limited request
+        :param method: HTTP method
+        :param url: request URL
+        :param kwargs: passed to requests.Session.request
+        :return: requests.Response
+        :raises DiscordRateLimited: if the rate limit will not reset within MAX_RATE_LIMIT_WAIT
+        """
+        route = self.route(method, url)
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        retry_after = None
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self._wait(route)
+            r = self.session.request(method, url, **kwargs)
+            retry_after = self._update(route, r)
+            if retry_after is None:
+                return r
+        raise DiscordRateLimited(retry_after)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+discord_client = DiscordClient()
@@ -1,10 +1,10 @@
 from __future__ import unicode_literals
-import requests
 import json
 import re
 from django.conf import settings
 from services.models import GroupCache
 from requests_oauthlib import OAuth2Session
+from .client import discord_client, DiscordRateLimited
 import logging
 import datetime
 from django.utils import timezone
@@ -64,12 +64,12 @@ class DiscordOAuthManager:
 
             custom_headers = {'accept': 'application/json', 'authorization': 'Bearer ' + token}
             path = DISCORD_URL + "/invites/" + str(settings.DISCORD_INVITE_CODE)
-            r = requests.post(path, headers=custom_headers)
+            r = discord_client.post(path, headers=custom_headers)
             logger.debug("Got status code %s after accepting Discord invite" % r.status_code)
             r.raise_for_status()
 
             path = DISCORD_URL + "/users/@me"
-            r = requests.get(path, headers=custom_headers)
+            r = discord_client.get(path, headers=custom_headers)
             logger.debug("Got status code %s after retrieving Discord profile" % r.status_code)
             r.raise_for_status()
 
@@ -86,7 +86,7 @@ class DiscordOAuthManager:
             custom_headers = {'content-type': 'application/json', 'authorization': 'Bot ' + settings.DISCORD_BOT_TOKEN}
             data = {'nick': nickname, }
             path = DISCORD_URL + "/guilds/" + str(settings.DISCORD_GUILD_ID) + "/members/" + str(user_id)
-            r = requests.patch(path, headers=custom_headers, json=data)
+            r = discord_client.patch(path, headers=custom_headers, json=data)
             logger.debug("Got status code %s after setting nickname for Discord user ID %s (%s)" % (
                 r.status_code, user_id, nickname))
             if r.status_code == 404:
@@ -94,6 +94,8 @@ class DiscordOAuthManager:
                 return True
             r.raise_for_status()
             return True
+        except DiscordRateLimited:
+            raise
         except:
             logger.exception("Failed to set nickname for Discord user ID %s (%s)" % (user_id, nickname))
             return False
@@ -103,7 +105,7 @@ class DiscordOAuthManager:
         try:
             custom_headers = {'accept': 'application/json', 'authorization': 'Bot ' + settings.DISCORD_BOT_TOKEN}
             path = DISCORD_URL + "/guilds/" + str(settings.DISCORD_GUILD_ID) + "/members/" + str(user_id)
-            r = requests.delete(path, headers=custom_headers)
+            r = discord_client.delete(path, headers=custom_headers)
             logger.debug("Got status code %s after removing Discord user ID %s" % (r.status_code, user_id))
             if r.status_code == 404:
                 logger.warn("Discord user ID %s already left the server." % user_id)
@@ -118,7 +120,7 @@ class DiscordOAuthManager:
     def __get_groups():
         custom_headers = {'accept': 'application/json', 'authorization': 'Bot ' + settings.DISCORD_BOT_TOKEN}
         path = DISCORD_URL + "/guilds/" + str(settings.DISCORD_GUILD_ID) + "/roles"
-        r = requests.get(path, headers=custom_headers)
+        r = discord_client.get(path, headers=custom_headers)
         logger.debug("Got status code %s after retrieving Discord roles" % r.status_code)
         r.raise_for_status()
         return r.json()
@@ -164,7 +166,7 @@ class DiscordOAuthManager:
     def __generate_role():
         custom_headers = {'accept': 'application/json', 'authorization': 'Bot ' + settings.DISCORD_BOT_TOKEN}
         path = DISCORD_URL + "/guilds/" + str(settings.DISCORD_GUILD_ID) + "/roles"
-        r = requests.post(path, headers=custom_headers)
+        r = discord_client.post(path, headers=custom_headers)
         logger.debug("Received status code %s after generating new role." % r.status_code)
         r.raise_for_status()
         return r.json()
@@ -179,7 +181,7 @@ class DiscordOAuthManager:
             'permissions': permissions,
         }
         path = DISCORD_URL + "/guilds/" + str(settings.DISCORD_GUILD_ID) + "/roles/" + str(role_id)
-        r = requests.patch(path, headers=custom_headers, data=json.dumps(data))
+        r = discord_client.patch(path, headers=custom_headers, data=json.dumps(data))
         logger.debug("Received status code %s after editing role id %s" % (r.status_code, role_id))
         r.raise_for_status()
         return r.json()
@@ -196,6 +198,6 @@ class DiscordOAuthManager:
         group_ids = [DiscordOAuthManager.__group_name_to_id(DiscordOAuthManager._sanitize_groupname(g)) for g in groups]
         path = DISCORD_URL + "/guilds/" + str(settings.DISCORD_GUILD_ID) + "/members/" + str(user_id)
         data = {'roles': group_ids}
-        r = requests.patch(path, headers=custom_headers, json=data)
+        r = discord_client.patch(path, headers=custom_headers, json=data)
         logger.debug("Received status code %s after setting user roles" % r.status_code)
         r.raise_for_status()
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 import logging
+import math
 
 from alliance_auth.celeryapp import app
 from django.conf import settings
@@ -10,6 +11,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from eveonline.managers import EveManager
 from notifications import notify
 from services.modules.discord.manager import DiscordOAuthManager
+from services.modules.discord.client import DiscordRateLimited
 from services.tasks import only_one
 from .models import DiscordUser
 
@@ -74,6 +76,9 @@ class DiscordTasks:
             logger.debug("Updating user %s discord groups to %s" % (user, groups))
             try:
                 DiscordOAuthManager.update_groups(user.discord.uid, groups)
+            except DiscordRateLimited as e:
+                logger.info("Discord group sync for %s rate limited, retrying in %.0f seconds" % (user, e.retry_after))
+                raise task_self.retry(countdown=int(math.ceil(e.retry_after)))
             except Exception as e:
                 if task_self:
                     logger.exception("Discord group sync failed for %s, retrying in 10 mins" % user)
@@ -89,8 +94,8 @@ class DiscordTasks:
     @app.task(name='discord.update_all_groups')
     def update_all_groups():
         logger.debug("Updating ALL discord groups")
-        for discord_user in DiscordUser.objects.exclude(uid__exact=''):
-            DiscordTasks.update_groups.delay(discord_user.user.pk)
+        for pk in DiscordUser.objects.exclude(uid__exact='').values_list('user_id', flat=True):
+            DiscordTasks.update_groups.delay(pk)
 
     @staticmethod
     @app.task(bind=True, name='discord.update_nickname')
@@ -102,6 +107,10 @@ class DiscordTasks:
             logger.debug("Updating user %s discord nickname to %s" % (user, character.character_name))
             try:
                 DiscordOAuthManager.update_nickname(user.discord.uid, character.character_name)
+            except DiscordRateLimited as e:
+                logger.info("Discord nickname sync for %s rate limited, retrying in %.0f seconds" % (
+                    user, e.retry_after))
+                raise self.retry(countdown=int(math.ceil(e.retry_after)))
             except Exception as e:
                 if self:
                     logger.exception("Discord nickname sync failed for %s, retrying in 10 mins" % user)
@@ -117,8 +126,8 @@ class DiscordTasks:
     @app.task(name='discord.update_all_nicknames')
     def update_all_nicknames():
         logger.debug("Updating ALL discord nicknames")
-        for discord_user in DiscordUser.objects.exclude(uid__exact=''):
-            DiscordTasks.update_nickname.delay(discord_user.user.user_id)
+        for pk in DiscordUser.objects.exclude(uid__exact='').values_list('user_id', flat=True):
+            DiscordTasks.update_nickname.delay(pk)
 
     @classmethod
     def disable(cls):
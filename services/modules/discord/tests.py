@@ -7,16 +7,19 @@ except ImportError:
     # Py2
     import mock
 
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.cache import cache
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
 
 from alliance_auth.tests.auth_utils import AuthUtils
+from alliance_auth.tests.cache_utils import LOCMEM_CACHE
 
 from .auth_hooks import DiscordService
 from .models import DiscordUser
 from .tasks import DiscordTasks
+from .client import DiscordClient, DiscordRateLimited
 
 MODULE_PATH = 'services.modules.discord'
 
@@ -191,3 +194,113 @@ class DiscordViewsTestCase(TestCase):
         self.assertRedirects(response, expected_url='/en/services/', target_status_code=200)
         with self.assertRaises(ObjectDoesNotExist):
             discord_user = User.objects.get(pk=self.member.pk).discord
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DiscordClientTestCase(TestCase):
+    url = 'https://discordapp.com/api/guilds/100/members/200'
+
+    def setUp(self):
+        cache.clear()
+        self.client = DiscordClient()
+        self.client._session = mock.Mock()
+        self.client._pid = mock.ANY
+
+    @staticmethod
+    def response(status_code=200, headers=None, json=None):
+        r = mock.Mock(status_code=status_code, headers=headers or {})
+        r.json.return_value = json or {}
+        return r
+
+    def test_route(self):
+        self.assertEqual(DiscordClient.route('patch', self.url), 'PATCH /api/guilds/100/members/{id}')
+        self.assertEqual(DiscordClient.route('get', 'https://discordapp.com/api/guilds/100/roles'),
+                         'GET /api/guilds/100/roles')
+
+    @mock.patch(MODULE_PATH + '.client.time')
+    def test_waits_for_exhausted_bucket(self, time):
+        time.time.return_value = 1000.0
+        self.client.session.request.return_value = self.response(
+            headers={'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1002'})
+
+        self.client.patch(self.url, json={})
+        self.assertFalse(time.sleep.called)
+
+        # Another member of the same guild shares the bucket
+        self.client.patch('https://discordapp.com/api/guilds/100/members/300', json={})
+        time.sleep.assert_called_once_with(2.0)
+
+        # Other routes are unaffected
+        time.sleep.reset_mock()
+        self.client.get('https://discordapp.com/api/guilds/100/roles')
+        self.assertFalse(time.sleep.called)
+
+    @mock.patch(MODULE_PATH + '.client.time')
+    def test_requests_reserved_before_sending(self, time):
+        time.time.return_value = 1000.0
+        self.client.session.request.return_value = self.response(
+            headers={'X-RateLimit-Remaining': '2', 'X-RateLimit-Reset': '1002'})
+        self.client.patch(self.url, json={})
+        route = DiscordClient.route('PATCH', self.url)
+
+        # Workers sending at the same time each take one of the remaining requests
+        self.assertEqual(DiscordClient.wait_time(route, reserve=True), 0)
+        self.assertEqual(DiscordClient.wait_time(route, reserve=True), 0)
+        self.assertEqual(DiscordClient.wait_time(route), 2.0)
+        self.assertEqual(DiscordClient.wait_time(route, reserve=True), 2.0)
+
+        # A response from one of them doesn't hand the reserved requests out again
+        self.client.session.request.return_value = self.response(
+            headers={'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset': '1002'})
+        self.client._update(route, self.client.session.request.return_value)
+        self.assertEqual(DiscordClient.wait_time(route), 2.0)
+
+    @mock.patch(MODULE_PATH + '.client.time')
+    def test_retries_after_429(self, time):
+        time.time.return_value = 1000.0
+        self.client.session.request.side_effect = [
+            self.response(429, json={'retry_after': 1500, 'global': False}),
+            self.response(204),
+        ]
+
+        r = self.client.patch(self.url, json={})
+
+        self.assertEqual(r.status_code, 204)
+        self.assertEqual(self.client.session.request.call_count, 2)
+        time.sleep.assert_called_once_with(1.5)
+
+    @mock.patch(MODULE_PATH + '.client.time')
+    def test_retries_after_header_seconds(self, time):
+        time.time.return_value = 1000.0
+        no_body = self.response(429, headers={'Retry-After': '5'})
+        no_body.json.side_effect = ValueError
+        self.client.session.request.side_effect = [no_body, self.response(204)]
+
+        self.client.patch(self.url, json={})
+
+        time.sleep.assert_called_once_with(5.0)
+
+    @mock.patch(MODULE_PATH + '.client.time')
+    def test_global_limit_shared(self, time):
+        time.time.return_value = 1000.0
+        self.client.session.request.side_effect = [
+            self.response(429, json={'retry_after': 500, 'global': True}),
+            self.response(204),
+        ]
+        self.client.patch(self.url, json={})
+
+        # A different client, as in another worker, also waits out the global limit
+        self.assertEqual(DiscordClient.wait_time('GET /api/users/@me'), 0.5)
+
+    @mock.patch(MODULE_PATH + '.client.MAX_RATE_LIMIT_WAIT', 10)
+    @mock.patch(MODULE_PATH + '.client.time')
+    def test_long_wait_raises(self, time):
+        time.time.return_value = 1000.0
+        self.client.session.request.return_value = self.response(
+            429, json={'retry_after': 60000, 'global': False})
+
+        with self.assertRaises(DiscordRateLimited) as cm:
+            self.client.patch(self.url, json={})
+        self.assertEqual(cm.exception.retry_after, 60)
+        self.assertEqual(self.client.session.request.call_count, 1)
+        self.assertFalse(time.sleep.called)
@@ -1,26 +1,57 @@
 from __future__ import unicode_literals
 
 import logging
+from collections import defaultdict, OrderedDict
 
 from django.conf import settings
 
-from services.modules.teamspeak3.util.ts3 import TS3Server, TeamspeakError
+from services.modules.teamspeak3.util.ts3 import TS3ServerPool, TeamspeakError
 from .models import TSgroup
 
 logger = logging.getLogger(__name__)
 
+POOL_SIZE = int(getattr(settings, 'TEAMSPEAK3_SERVERQUERY_POOL_SIZE', 1))
+KEEPALIVE_INTERVAL = int(getattr(settings, 'TEAMSPEAK3_SERVERQUERY_KEEPALIVE', 60))
+# Max clients per servergroupaddclient/servergroupdelclient command
+GROUP_BATCH_SIZE = int(getattr(settings, 'TEAMSPEAK3_GROUP_BATCH_SIZE', 100))
+
+# servergrouplist type of regular (non template, non query) groups
+REGULAR_GROUP_TYPE = '1'
+
 
 class Teamspeak3Manager:
+    pool = None
+
     def __init__(self):
         pass
 
+    @classmethod
+    def get_pool(cls):
+        if not cls.pool:
+            cls.pool = TS3ServerPool(settings.TEAMSPEAK3_SERVER_IP, settings.TEAMSPEAK3_SERVER_PORT,
+                                     settings.TEAMSPEAK3_SERVERQUERY_USER, settings.TEAMSPEAK3_SERVERQUERY_PASSWORD,
+                                     settings.TEAMSPEAK3_VIRTUAL_SERVER, size=POOL_SIZE, keepalive=KEEPALIVE_INTERVAL)
+        return cls.pool
+
     @staticmethod
-    def __get_created_server():
-        server = TS3Server(settings.TEAMSPEAK3_SERVER_IP, settings.TEAMSPEAK3_SERVER_PORT)
-        server.login(settings.TEAMSPEAK3_SERVERQUERY_USER, settings.TEAMSPEAK3_SERVERQUERY_PASSWORD)
-        server.use(settings.TEAMSPEAK3_VIRTUAL_SERVER)
-        logger.debug("Got TS3 server instance based on settings.")
-        return server
+    def server():
+        """
+        Get a logged in ServerQuery connection from this worker's pool
+        Nested calls share the same connection.
+        :return: context manager yielding TS3Server
+        """
+        return Teamspeak3Manager.get_pool().connection()
+
+    @staticmethod
+    def _entries(ret):
+        """
+        Normalise a send_command response to a list of entries
+        """
+        if isinstance(ret, list):
+            return ret
+        if isinstance(ret, dict):
+            return [ret]
+        return []
 
     @staticmethod
     def __santatize_username(username):
@@ -41,116 +72,116 @@ class Teamspeak3Manager:
     @staticmethod
     def _get_userid(uid):
         logger.debug("Looking for uid %s on TS3 server." % uid)
-        server = Teamspeak3Manager.__get_created_server()
-        try:
-            ret = server.send_command('customsearch', {'ident': 'sso_uid', 'pattern': uid})
-            if ret and 'keys' in ret and 'cldbid' in ret['keys']:
-                logger.debug("Got userid %s for uid %s" % (ret['keys']['cldbid'], uid))
-                return ret['keys']['cldbid']
-        except TeamspeakError as e:
-            if not e.code == '1281':
-                raise e
-        return None
+        with Teamspeak3Manager.server() as server:
+            try:
+                ret = server.send_command('customsearch', {'ident': 'sso_uid', 'pattern': uid})
+                if ret and 'keys' in ret and 'cldbid' in ret['keys']:
+                    logger.debug("Got userid %s for uid %s" % (ret['keys']['cldbid'], uid))
+                    return ret['keys']['cldbid']
+            except TeamspeakError as e:
+                if not e.code == '1281':
+                    raise e
+            return None
 
     @staticmethod
     def _group_id_by_name(groupname):
-        server = Teamspeak3Manager.__get_created_server()
-        logger.debug("Looking for group %s on TS3 server." % groupname)
-        group_cache = server.send_command('servergrouplist')
-        logger.debug("Received group cache from server: %s" % group_cache)
-        for group in group_cache:
-            logger.debug("Checking group %s" % group)
-            if group['keys']['name'] == groupname:
-                logger.debug("Found group %s, returning id %s" % (groupname, group['keys']['sgid']))
-                return group['keys']['sgid']
-        logger.debug("Group %s not found on server." % groupname)
-        return None
+        with Teamspeak3Manager.server() as server:
+            logger.debug("Looking for group %s on TS3 server." % groupname)
+            group_cache = server.send_command('servergrouplist')
+            logger.debug("Received group cache from server: %s" % group_cache)
+            for group in group_cache:
+                logger.debug("Checking group %s" % group)
+                if group['keys']['name'] == groupname:
+                    logger.debug("Found group %s, returning id %s" % (groupname, group['keys']['sgid']))
+                    return group['keys']['sgid']
+            logger.debug("Group %s not found on server." % groupname)
+            return None
 
     @staticmethod
     def _create_group(groupname):
         logger.debug("Creating group %s on TS3 server." % groupname)
-        server = Teamspeak3Manager.__get_created_server()
-        sgid = Teamspeak3Manager._group_id_by_name(groupname)
-        if not sgid:
-            logger.debug("Group does not yet exist. Proceeding with creation.")
-            ret = server.send_command('servergroupadd', {'name': groupname})
-            Teamspeak3Manager.__group_cache = None
-            sgid = ret['keys']['sgid']
-            server.send_command('servergroupaddperm',
-                                {'sgid': sgid, 'permsid': 'i_group_needed_modify_power', 'permvalue': 75,
-                                 'permnegated': 0, 'permskip': 0})
-            server.send_command('servergroupaddperm',
-                                {'sgid': sgid, 'permsid': 'i_group_needed_member_add_power', 'permvalue': 100,
-                                 'permnegated': 0, 'permskip': 0})
-            server.send_command('servergroupaddperm',
-                                {'sgid': sgid, 'permsid': 'i_group_needed_member_remove_power', 'permvalue': 100,
-                                 'permnegated': 0, 'permskip': 0})
-        logger.info("Created group on TS3 server with name %s and id %s" % (groupname, sgid))
-        return sgid
+        with Teamspeak3Manager.server() as server:
+            sgid = Teamspeak3Manager._group_id_by_name(groupname)
+            if not sgid:
+                logger.debug("Group does not yet exist. Proceeding with creation.")
+                ret = server.send_command('servergroupadd', {'name': groupname})
+                Teamspeak3Manager.__group_cache = None
+                sgid = ret['keys']['sgid']
+                server.send_command('servergroupaddperm',
+                                    {'sgid': sgid, 'permsid': 'i_group_needed_modify_power', 'permvalue': 75,
+                                     'permnegated': 0, 'permskip': 0})
+                server.send_command('servergroupaddperm',
+                                    {'sgid': sgid, 'permsid': 'i_group_needed_member_add_power', 'permvalue': 100,
+                                     'permnegated': 0, 'permskip': 0})
+                server.send_command('servergroupaddperm',
+                                    {'sgid': sgid, 'permsid': 'i_group_needed_member_remove_power', 'permvalue': 100,
+                                     'permnegated': 0, 'permskip': 0})
+            logger.info("Created group on TS3 server with name %s and id %s" % (groupname, sgid))
+            return sgid
 
     @staticmethod
     def _user_group_list(cldbid):
         logger.debug("Retrieving group list for user with id %s" % cldbid)
-        server = Teamspeak3Manager.__get_created_server()
-        try:
-            groups = server.send_command('servergroupsbyclientid', {'cldbid': cldbid})
-        except TeamspeakError as e:
-            if e.code == '1281': # no groups
-                groups = []
-            else:
-                raise e
-        logger.debug("Retrieved group list: %s" % groups)
-        outlist = {}
-
-        if type(groups) == list:
-            logger.debug("Recieved multiple groups. Iterating.")
-            for group in groups:
-                outlist[group['keys']['name']] = group['keys']['sgid']
-        elif type(groups) == dict:
-            logger.debug("Recieved single group.")
-            outlist[groups['keys']['name']] = groups['keys']['sgid']
-        logger.debug("Returning name/id pairing: %s" % outlist)
-        return outlist
+        with Teamspeak3Manager.server() as server:
+            try:
+                groups = server.send_command('servergroupsbyclientid', {'cldbid': cldbid})
+            except TeamspeakError as e:
+                if e.code == '1281': # no groups
+                    groups = []
+                else:
+                    raise e
+            logger.debug("Retrieved group list: %s" % groups)
+            outlist = {}
+
+            if type(groups) == list:
+                logger.debug("Recieved multiple groups. Iterating.")
+                for group in groups:
+                    outlist[group['keys']['name']] = group['keys']['sgid']
+            elif type(groups) == dict:
+                logger.debug("Recieved single group.")
+                outlist[groups['keys']['name']] = groups['keys']['sgid']
+            logger.debug("Returning name/id pairing: %s" % outlist)
+            return outlist
 
     @staticmethod
     def _group_list():
         logger.debug("Retrieving group list on TS3 server.")
-        server = Teamspeak3Manager.__get_created_server()
-        group_cache = server.send_command('servergrouplist')
-        logger.debug("Received group cache from server: %s" % group_cache)
-        outlist = {}
-        if group_cache:
-            for group in group_cache:
-                logger.debug("Assigning name/id dict: %s = %s" % (group['keys']['name'], group['keys']['sgid']))
-                outlist[group['keys']['name']] = group['keys']['sgid']
-        else:
-            logger.error("Received empty group cache while retrieving group cache from TS3 server. 1024 error.")
-        logger.debug("Returning name/id pairing: %s" % outlist)
-        return outlist
+        with Teamspeak3Manager.server() as server:
+            group_cache = server.send_command('servergrouplist')
+            logger.debug("Received group cache from server: %s" % group_cache)
+            outlist = {}
+            if group_cache:
+                for group in group_cache:
+                    logger.debug("Assigning name/id dict: %s = %s" % (group['keys']['name'], group['keys']['sgid']))
+                    outlist[group['keys']['name']] = group['keys']['sgid']
+            else:
+                logger.error("Received empty group cache while retrieving group cache from TS3 server. 1024 error.")
+            logger.debug("Returning name/id pairing: %s" % outlist)
+            return outlist
 
     @staticmethod
     def _add_user_to_group(uid, groupid):
         logger.debug("Adding group id %s to TS3 user id %s" % (groupid, uid))
-        server = Teamspeak3Manager.__get_created_server()
-        user_groups = Teamspeak3Manager._user_group_list(uid)
+        with Teamspeak3Manager.server() as server:
+            user_groups = Teamspeak3Manager._user_group_list(uid)
 
-        if groupid not in user_groups.values():
-            logger.debug("User does not have group already. Issuing command to add.")
-            server.send_command('servergroupaddclient',
-                                {'sgid': str(groupid), 'cldbid': uid})
-            logger.info("Added user id %s to group id %s on TS3 server." % (uid, groupid))
+            if groupid not in user_groups.values():
+                logger.debug("User does not have group already. Issuing command to add.")
+                server.send_command('servergroupaddclient',
+                                    {'sgid': str(groupid), 'cldbid': uid})
+                logger.info("Added user id %s to group id %s on TS3 server." % (uid, groupid))
 
     @staticmethod
     def _remove_user_from_group(uid, groupid):
         logger.debug("Removing group id %s from TS3 user id %s" % (groupid, uid))
-        server = Teamspeak3Manager.__get_created_server()
-        user_groups = Teamspeak3Manager._user_group_list(uid)
+        with Teamspeak3Manager.server() as server:
+            user_groups = Teamspeak3Manager._user_group_list(uid)
 
-        if str(groupid) in user_groups.values():
-            logger.debug("User is in group. Issuing command to remove.")
-            server.send_command('servergroupdelclient',
-                                {'sgid': str(groupid), 'cldbid': uid})
-            logger.info("Removed user id %s from group id %s on TS3 server." % (uid, groupid))
+            if str(groupid) in user_groups.values():
+                logger.debug("User is in group. Issuing command to remove.")
+                server.send_command('servergroupdelclient',
+                                    {'sgid': str(groupid), 'cldbid': uid})
+                logger.info("Removed user id %s from group id %s on TS3 server." % (uid, groupid))
 
     @staticmethod
     def _sync_ts_group_db():
@@ -185,89 +216,89 @@ class Teamspeak3Manager:
     def add_user(username, corp_ticker):
         username_clean = Teamspeak3Manager.__santatize_username(Teamspeak3Manager.__generate_username(username,
                                                                                                       corp_ticker))
-        server = Teamspeak3Manager.__get_created_server()
-        logger.debug("Adding user to TS3 server with cleaned username %s" % username_clean)
-        server_groups = Teamspeak3Manager._group_list()
+        with Teamspeak3Manager.server() as server:
+            logger.debug("Adding user to TS3 server with cleaned username %s" % username_clean)
+            server_groups = Teamspeak3Manager._group_list()
 
-        if settings.DEFAULT_AUTH_GROUP not in server_groups:
-            Teamspeak3Manager._create_group(settings.DEFAULT_AUTH_GROUP)
+            if settings.DEFAULT_AUTH_GROUP not in server_groups:
+                Teamspeak3Manager._create_group(settings.DEFAULT_AUTH_GROUP)
 
-        alliance_group_id = Teamspeak3Manager._group_id_by_name(settings.DEFAULT_AUTH_GROUP)
+            alliance_group_id = Teamspeak3Manager._group_id_by_name(settings.DEFAULT_AUTH_GROUP)
 
-        try:
-            ret = server.send_command('tokenadd', {'tokentype': 0, 'tokenid1': alliance_group_id, 'tokenid2': 0,
-                                                   'tokendescription': username_clean,
-                                                   'tokencustomset': "ident=sso_uid value=%s" % username_clean})
-        except TeamspeakError as e:
-            logger.error("Failed to add teamspeak user %s: %s" % (username, str(e)))
-            return "",""
+            try:
+                ret = server.send_command('tokenadd', {'tokentype': 0, 'tokenid1': alliance_group_id, 'tokenid2': 0,
+                                                       'tokendescription': username_clean,
+                                                       'tokencustomset': "ident=sso_uid value=%s" % username_clean})
+            except TeamspeakError as e:
+                logger.error("Failed to add teamspeak user %s: %s" % (username, str(e)))
+                return "",""
 
-        try:
-            token = ret['keys']['token']
-            logger.info("Created permission token for user %s on TS3 server" % username_clean)
-            return username_clean, token
-        except:
-            logger.exception("Failed to add teamspeak user %s - received response: %s" % (username_clean, ret))
-            return "", ""
+            try:
+                token = ret['keys']['token']
+                logger.info("Created permission token for user %s on TS3 server" % username_clean)
+                return username_clean, token
+            except:
+                logger.exception("Failed to add teamspeak user %s - received response: %s" % (username_clean, ret))
+                return "", ""
 
     @staticmethod
     def add_blue_user(username, corp_ticker):
         username_clean = Teamspeak3Manager.__santatize_username(Teamspeak3Manager.__generate_username_blue(username,
                                                                                                            corp_ticker))
-        server = Teamspeak3Manager.__get_created_server()
-        logger.debug("Adding user to TS3 server with cleaned username %s" % username_clean)
-        server_groups = Teamspeak3Manager._group_list()
-        if settings.DEFAULT_BLUE_GROUP not in server_groups:
-            Teamspeak3Manager._create_group(settings.DEFAULT_BLUE_GROUP)
+        with Teamspeak3Manager.server() as server:
+            logger.debug("Adding user to TS3 server with cleaned username %s" % username_clean)
+            server_groups = Teamspeak3Manager._group_list()
+            if settings.DEFAULT_BLUE_GROUP not in server_groups:
+                Teamspeak3Manager._create_group(settings.DEFAULT_BLUE_GROUP)
 
-        blue_group_id = Teamspeak3Manager._group_id_by_name(settings.DEFAULT_BLUE_GROUP)
+            blue_group_id = Teamspeak3Manager._group_id_by_name(settings.DEFAULT_BLUE_GROUP)
 
-        try:
-            ret = server.send_command('tokenadd', {'tokentype': 0, 'tokenid1': blue_group_id, 'tokenid2': 0,
-                                                   'tokendescription': username_clean,
-                                                   'tokencustomset': "ident=sso_uid value=%s" % username_clean})
-        except TeamspeakError as e:
-            logger.error("Failed to add blue teamspeak user %s: %s" % (username, str(e)))
-            return "",""
+            try:
+                ret = server.send_command('tokenadd', {'tokentype': 0, 'tokenid1': blue_group_id, 'tokenid2': 0,
+                                                       'tokendescription': username_clean,
+                                                       'tokencustomset': "ident=sso_uid value=%s" % username_clean})
+            except TeamspeakError as e:
+                logger.error("Failed to add blue teamspeak user %s: %s" % (username, str(e)))
+                return "",""
 
-        try:
-            token = ret['keys']['token']
-            logger.info("Created permission token for blue user %s on TS3 server" % username_clean)
-            return username_clean, token
-        except:
-            logger.exception("Failed to add blue teamspeak user %s - received response: %s" % (username_clean, ret))
-            return "", ""
+            try:
+                token = ret['keys']['token']
+                logger.info("Created permission token for blue user %s on TS3 server" % username_clean)
+                return username_clean, token
+            except:
+                logger.exception("Failed to add blue teamspeak user %s - received response: %s" % (username_clean, ret))
+                return "", ""
 
     @staticmethod
     def delete_user(uid):
-        server = Teamspeak3Manager.__get_created_server()
-        user = Teamspeak3Manager._get_userid(uid)
-        logger.debug("Deleting user %s with id %s from TS3 server." % (user, uid))
-        if user:
-            clients = server.send_command('clientlist')
-            for client in clients:
+        with Teamspeak3Manager.server() as server:
+            user = Teamspeak3Manager._get_userid(uid)
+            logger.debug("Deleting user %s with id %s from TS3 server." % (user, uid))
+            if user:
+                clients = server.send_command('clientlist')
+                for client in clients:
+                    try:
+                        if client['keys']['client_database_id'] == user:
+                            logger.debug("Found user %s on TS3 server - issuing deletion command." % user)
+                            server.send_command('clientkick', {'clid': client['keys']['clid'], 'reasonid': 5,
+                                                               'reasonmsg': 'Auth service deleted'})
+                    except:
+                        logger.exception("Failed to delete user id %s from TS3 - received response %s" % (uid, client))
+                        return False
                 try:
-                    if client['keys']['client_database_id'] == user:
-                        logger.debug("Found user %s on TS3 server - issuing deletion command." % user)
-                        server.send_command('clientkick', {'clid': client['keys']['clid'], 'reasonid': 5,
-                                                           'reasonmsg': 'Auth service deleted'})
-                except:
-                    logger.exception("Failed to delete user id %s from TS3 - received response %s" % (uid, client))
+                    ret = server.send_command('clientdbdelete', {'cldbid': user})
+                except TeamspeakError as e:
+                    logger.error("Failed to delete teamspeak user %s: %s" % (uid, str(e)))
+                    return False
+                if ret == '0':
+                    logger.info("Deleted user with id %s from TS3 server." % uid)
+                    return True
+                else:
+                    logger.exception("Failed to delete user id %s from TS3 - received response %s" % (uid, ret))
                     return False
-            try:
-                ret = server.send_command('clientdbdelete', {'cldbid': user})
-            except TeamspeakError as e:
-                logger.error("Failed to delete teamspeak user %s: %s" % (uid, str(e)))
-                return False
-            if ret == '0':
-                logger.info("Deleted user with id %s from TS3 server." % uid)
-                return True
             else:
-                logger.exception("Failed to delete user id %s from TS3 - received response %s" % (uid, ret))
-                return False
-        else:
-            logger.warn("User with id %s not found on TS3 server. Assuming succesful deletion." % uid)
-            return True
+                logger.warn("User with id %s not found on TS3 server. Assuming succesful deletion." % uid)
+                return True
 
     @staticmethod
     def check_user_exists(uid):
@@ -279,18 +310,25 @@ class Teamspeak3Manager:
     @staticmethod
     def generate_new_permissionkey(uid, username, corpticker):
         logger.debug("Re-issuing permission key for user id %s" % uid)
-        Teamspeak3Manager.delete_user(uid)
-        return Teamspeak3Manager.add_user(username, corpticker)
+        with Teamspeak3Manager.server():
+            Teamspeak3Manager.delete_user(uid)
+            return Teamspeak3Manager.add_user(username, corpticker)
 
     @staticmethod
     def generate_new_blue_permissionkey(uid, username, corpticker):
         logger.debug("Re-issuing blue permission key for user id %s" % uid)
-        Teamspeak3Manager.delete_user(uid)
-        return Teamspeak3Manager.add_blue_user(username, corpticker)
+        with Teamspeak3Manager.server():
+            Teamspeak3Manager.delete_user(uid)
+            return Teamspeak3Manager.add_blue_user(username, corpticker)
 
     @staticmethod
     def update_groups(uid, ts_groups):
         logger.debug("Updating uid %s TS3 groups %s" % (uid, ts_groups))
+        with Teamspeak3Manager.server():
+            Teamspeak3Manager.__update_groups(uid, ts_groups)
+
+    @staticmethod
+    def __update_groups(uid, ts_groups):
         userid = Teamspeak3Manager._get_userid(uid)
         addgroups = []
         remgroups = []
@@ -314,3 +352,109 @@ class Teamspeak3Manager:
             for g in remgroups:
                 logger.info("Removing Teamspeak user %s from group %s" % (userid, g))
                 Teamspeak3Manager._remove_user_from_group(userid, g)
+
+    @staticmethod
+    def _client_ids():
+        """
+        Get the database ids of all clients registered through auth
+        :return: dict of uid: cldbid
+        """
+        logger.debug("Retrieving all sso_uid clients from TS3 server.")
+        with Teamspeak3Manager.server() as server:
+            try:
+                ret = server.send_command('customsearch', {'ident': 'sso_uid', 'pattern': '%'})
+            except TeamspeakError as e:
+                if not e.code == '1281':
+                    raise e
+                ret = []
+        return dict((entry['keys']['value'], int(entry['keys']['cldbid']))
+                    for entry in Teamspeak3Manager._entries(ret) if 'value' in entry['keys'])
+
+    @staticmethod
+    def _group_members():
+        """
+        Get the members of every regular server group
+        :return: dict of sgid: set of cldbids
+        """
+        logger.debug("Retrieving members of all groups on TS3 server.")
+        members = {}
+        with Teamspeak3Manager.server() as server:
+            for group in Teamspeak3Manager._entries(server.send_command('servergrouplist')):
+                if group['keys'].get('type') != REGULAR_GROUP_TYPE:
+                    continue
+                sgid = int(group['keys']['sgid'])
+                try:
+                    ret = server.send_command('servergroupclientlist', {'sgid': sgid})
+                except TeamspeakError as e:
+                    if not e.code == '1281':  # empty group
+                        raise e
+                    ret = []
+                members[sgid] = set(int(entry['keys']['cldbid'])
+                                    for entry in Teamspeak3Manager._entries(ret) if 'cldbid' in entry['keys'])
+        return members
+
+    @staticmethod
+    def _batch_group_command(command, changes):
+        """
+        Issue a group membership command for many clients at once using the pipe separated syntax
+        :param command: servergroupaddclient or servergroupdelclient
+        :param changes: dict of sgid: list of cldbids
+        :return: tuple of (clients changed, clients failed)
+        """
+        done = failed = 0
+        with Teamspeak3Manager.server() as server:
+            for sgid, cldbids in changes.items():
+                cldbids = sorted(cldbids)
+                for i in range(0, len(cldbids), GROUP_BATCH_SIZE):
+                    batch = cldbids[i:i + GROUP_BATCH_SIZE]
+                    try:
+                        server.send_command(command, OrderedDict([('sgid', sgid), ('cldbid', batch)]))
+                        done += len(batch)
+                    except TeamspeakError as e:
+                        logger.error("Failed %s for group %s clients %s: %s" % (command, sgid, batch, str(e)))
+                        failed += len(batch)
+        return done, failed
+
+    @staticmethod
+    def update_all_groups(user_ts_groups):
+        """
+        Reconcile the TS3 groups of many users against one snapshot of the server's groups
+        :param user_ts_groups: dict of uid: {TS group name: TS group id}
+        :return: dict summarising the changes made
+        """
+        with Teamspeak3Manager.server():
+            client_ids = Teamspeak3Manager._client_ids()
+            members = Teamspeak3Manager._group_members()
+
+            client_groups = defaultdict(set)
+            for sgid, cldbids in members.items():
+                for cldbid in cldbids:
+                    client_groups[cldbid].add(sgid)
+
+            add = defaultdict(list)
+            remove = defaultdict(list)
+            missing = 0
+            for uid, ts_groups in user_ts_groups.items():
+                cldbid = client_ids.get(uid)
+                if cldbid is None:
+                    logger.debug("User with uid %s not found on TS3 server." % uid)
+                    missing += 1
+                    continue
+                wanted = set(ts_groups.values())
+                current = client_groups[cldbid]
+                for sgid in wanted - current:
+                    if sgid in members:
+                        add[sgid].append(cldbid)
+                    else:
+                        logger.warn("Group id %s for uid %s does not exist on TS3 server." % (sgid, uid))
+                for sgid in current - wanted:
+                    remove[sgid].append(cldbid)
+
+            added, add_failed = Teamspeak3Manager._batch_group_command('servergroupaddclient', add)
+            removed, remove_failed = Teamspeak3Manager._batch_group_command('servergroupdelclient', remove)
+        return {
+            'added': added,
+            'removed': removed,
+            'failed': add_failed + remove_failed,
+            'missing': missing,
+        }
@@ -16,7 +16,7 @@ logger = logging.getLogger(__name__)
 
 def trigger_all_ts_update():
     logger.debug("Triggering update_all_groups")
-    Teamspeak3Tasks.update_all_groups()
+    Teamspeak3Tasks.update_all_groups.delay()
 
 
 @receiver(m2m_changed, sender=AuthTS.ts_group.through)
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 import logging
+from collections import defaultdict
 
 from alliance_auth.celeryapp import app
 from celery.schedules import crontab
@@ -64,20 +65,41 @@ class Teamspeak3Tasks:
         TSgroup.objects.all().delete()
         logger.info("Teamspeak3 disabled")
 
+    @staticmethod
+    def get_ts_groups(auth_groups):
+        """
+        Get the TS groups mapped to the given auth groups
+        :param auth_groups: Group queryset or iterable of group ids
+        :return: dict of TS group name: TS group id
+        """
+        return dict(TSgroup.objects.filter(authts__auth_group__in=auth_groups).values_list(
+            'ts_group_name', 'ts_group_id'))
+
+    @staticmethod
+    def get_all_user_ts_groups():
+        """
+        Get the TS groups every user with a TS account should have, in a fixed number of queries
+        :return: dict of Teamspeak3User uid: {TS group name: TS group id}
+        """
+        auth_group_ts_groups = defaultdict(dict)
+        for authts in AuthTS.objects.prefetch_related('ts_group'):
+            for ts_group in authts.ts_group.all():
+                auth_group_ts_groups[authts.auth_group_id][ts_group.ts_group_name] = ts_group.ts_group_id
+
+        uids = dict(Teamspeak3User.objects.exclude(uid__exact='').values_list('user_id', 'uid'))
+        user_ts_groups = dict((uid, {}) for uid in uids.values())
+        memberships = User.groups.through.objects.filter(user_id__in=uids.keys()).values_list('user_id', 'group_id')
+        for user_id, group_id in memberships:
+            user_ts_groups[uids[user_id]].update(auth_group_ts_groups.get(group_id, {}))
+        return user_ts_groups
+
     @staticmethod
     @app.task(bind=True, name="teamspeak3.update_groups")
     def update_groups(self, pk):
         user = User.objects.get(pk=pk)
         logger.debug("Updating user %s teamspeak3 groups" % user)
         if Teamspeak3Tasks.has_account(user):
-            usergroups = user.groups.all()
-            groups = {}
-            for usergroup in usergroups:
-                filtered_groups = AuthTS.objects.filter(auth_group=usergroup)
-                if filtered_groups:
-                    for filtered_group in filtered_groups:
-                        for ts_group in filtered_group.ts_group.all():
-                            groups[ts_group.ts_group_name] = ts_group.ts_group_id
+            groups = Teamspeak3Tasks.get_ts_groups(user.groups.all())
             logger.debug("Updating user %s teamspeak3 groups to %s" % (user, groups))
             try:
                 Teamspeak3Manager.update_groups(user.teamspeak3.uid, groups)
@@ -89,8 +111,13 @@ class Teamspeak3Tasks:
             logger.debug("User does not have a teamspeak3 account")
 
     @staticmethod
-    @app.task(name="teamspeak3.update_all_groups")
-    def update_all_groups():
+    @app.task(bind=True, name="teamspeak3.update_all_groups")
+    def update_all_groups(self):
         logger.debug("Updating ALL teamspeak3 groups")
-        for user in Teamspeak3User.objects.exclude(uid__exact=''):
-            Teamspeak3Tasks.update_groups.delay(user.user_id)
+        user_ts_groups = Teamspeak3Tasks.get_all_user_ts_groups()
+        try:
+            result = Teamspeak3Manager.update_all_groups(user_ts_groups)
+            logger.info("Reconciled teamspeak3 groups for %s users: %s" % (len(user_ts_groups), result))
+        except TeamspeakError as e:
+            logger.error("Error occured while syncing all TS groups: %s" % str(e))
+            raise self.retry(countdown=60*10)
@@ -1,5 +1,9 @@
 from __future__ import unicode_literals
 
+import socket
+import time
+from collections import OrderedDict
+
 try:
     # Py3
     from unittest import mock
@@ -17,9 +21,12 @@ from django.db.models import signals
 from alliance_auth.tests.auth_utils import AuthUtils
 
 from .auth_hooks import Teamspeak3Service
+from .manager import Teamspeak3Manager
 from .models import Teamspeak3User, AuthTS, TSgroup
 from .tasks import Teamspeak3Tasks
 from .signals import m2m_changed_authts_group, post_save_authts, post_delete_authts
+from .util.ts3 import TS3Proto, TS3Server, TS3ServerPool, PooledTS3Server, TeamspeakError
+from .util import benchmark
 
 MODULE_PATH = 'services.modules.teamspeak3'
 
@@ -71,9 +78,15 @@ class Teamspeak3HooksTestCase(TestCase):
     def test_update_all_groups(self, manager):
         service = self.service()
         service.update_all_groups()
-        # Check member and blue user have groups updated
-        self.assertTrue(manager.update_groups.called)
-        self.assertEqual(manager.update_groups.call_count, 2)
+        # Check member and blue user are reconciled in one pass
+        self.assertEqual(manager.update_all_groups.call_count, 1)
+        args, kwargs = manager.update_all_groups.call_args
+        self.assertEqual({self.member: {'Member': 1}, self.blue: {'Blue': 2}}, args[0])
+        self.assertFalse(manager.update_groups.called)
+
+    def test_get_all_user_ts_groups_queries(self):
+        with self.assertNumQueries(4):
+            Teamspeak3Tasks.get_all_user_ts_groups()
 
     def test_update_groups(self):
         # Check member has Member group updated
@@ -326,3 +339,221 @@ class Teamspeak3SignalsTestCase(TestCase):
         self.m2m_member.delete()  # Trigger delete signal
 
         self.assertTrue(trigger_all_ts_update.called)
+
+
+class TS3ServerPoolTestCase(TestCase):
+    def setUp(self):
+        self.pool = TS3ServerPool('127.0.0.1', 10011, 'serveradmin', 'password', 1)
+
+    @mock.patch.object(TS3ServerPool, '_connect')
+    def test_connection_reused(self, connect):
+        connect.return_value.last_used = time.time()
+        with self.pool.connection() as server:
+            with self.pool.connection() as nested:
+                self.assertIs(server, nested)
+        with self.pool.connection() as again:
+            self.assertIs(server, again)
+        self.assertEqual(connect.call_count, 1)
+
+    @mock.patch.object(TS3ServerPool, '_connect')
+    def test_broken_connection_discarded(self, connect):
+        connect.side_effect = lambda: mock.Mock(last_used=time.time())
+        with self.pool.connection() as server:
+            server._connected = False
+        with self.pool.connection() as again:
+            self.assertIsNot(server, again)
+        self.assertTrue(server.close.called)
+        self.assertEqual(connect.call_count, 2)
+
+    @mock.patch.object(TS3ServerPool, '_connect')
+    def test_keepalive(self, connect):
+        with self.pool.connection() as server:
+            server.last_used = 0
+        with self.pool.connection():
+            pass
+        self.assertTrue(server.keepalive.called)
+
+    @mock.patch.object(TS3Server, 'use')
+    @mock.patch.object(TS3Server, 'login')
+    @mock.patch.object(TS3Server, 'connect')
+    def test_reconnect_on_connection_lost(self, connect, login, use):
+        server = PooledTS3Server('127.0.0.1', 10011, 'serveradmin', 'password', 1)
+        self.assertEqual(connect.call_count, 1)
+        with mock.patch.object(TS3Server, 'send_command') as send_command:
+            send_command.side_effect = [TeamspeakError('1794'), '0']
+            self.assertEqual(server.send_command('version'), '0')
+            self.assertEqual(send_command.call_count, 2)
+        self.assertEqual(connect.call_count, 2)
+        self.assertEqual(login.call_count, 2)
+        use.assert_called_with(1)
+
+    @mock.patch.object(TS3Server, 'use')
+    @mock.patch.object(TS3Server, 'login')
+    @mock.patch.object(TS3Server, 'connect')
+    def test_changes_not_replayed(self, connect, login, use):
+        server = PooledTS3Server('127.0.0.1', 10011, 'serveradmin', 'password', 1)
+        with mock.patch.object(TS3Server, 'send_command') as send_command:
+            send_command.side_effect = socket.error()
+            with self.assertRaises(TeamspeakError) as cm:
+                server.send_command('tokenadd', {'tokentype': 0})
+            self.assertEqual(cm.exception.code, '1793')
+            self.assertEqual(send_command.call_count, 1)
+        # left closed for the pool to drop
+        self.assertEqual(connect.call_count, 1)
+        self.assertFalse(server._connected)
+
+    @mock.patch.object(TS3Server, 'connect')
+    def test_reconnect_retried_once(self, connect):
+        with mock.patch.object(TS3Server, 'send_command', return_value='0'):
+            server = PooledTS3Server('127.0.0.1', 10011, 'serveradmin', 'password', 1)
+        with mock.patch.object(TS3Server, 'send_command') as send_command:
+            # the server keeps dropping the session, including while logging in again
+            send_command.side_effect = TeamspeakError('1793')
+            with self.assertRaises(TeamspeakError):
+                server.send_command('version')
+            self.assertEqual(send_command.call_count, 2)
+        self.assertEqual(connect.call_count, 2)
+
+    @mock.patch.object(TS3Server, 'use')
+    @mock.patch.object(TS3Server, 'login')
+    @mock.patch.object(TS3Server, 'connect')
+    def test_no_reconnect_on_command_error(self, connect, login, use):
+        server = PooledTS3Server('127.0.0.1', 10011, 'serveradmin', 'password', 1)
+        with mock.patch.object(TS3Server, 'send_command') as send_command:
+            send_command.side_effect = TeamspeakError('1281')
+            with self.assertRaises(TeamspeakError):
+                server.send_command('customsearch')
+        self.assertEqual(connect.call_count, 1)
+
+
+class Teamspeak3ManagerTestCase(TestCase):
+    def setUp(self):
+        Teamspeak3Manager.pool = None
+
+    def tearDown(self):
+        Teamspeak3Manager.pool = None
+
+    @mock.patch.object(TS3ServerPool, '_connect')
+    def test_update_groups_single_session(self, connect):
+        def send_command(command, keys=None, opts=None):
+            if command == 'customsearch':
+                return {'keys': {'cldbid': '5'}, 'opts': []}
+            if command == 'servergroupsbyclientid':
+                return {'keys': {'name': 'Old', 'sgid': '2'}, 'opts': []}
+            return '0'
+        connect.return_value.send_command.side_effect = send_command
+
+        Teamspeak3Manager.update_groups('uid', {'Member': 1})
+
+        self.assertEqual(connect.call_count, 1)
+        commands = [args[0] for args, kwargs in connect.return_value.send_command.call_args_list]
+        self.assertIn('servergroupaddclient', commands)
+        self.assertIn('servergroupdelclient', commands)
+
+    @mock.patch.object(TS3ServerPool, '_connect')
+    def test_update_all_groups(self, connect):
+        group_members = {1: [10, 11], 2: [11], 3: []}
+
+        def send_command(command, keys=None, opts=None):
+            if command == 'customsearch':
+                return [{'keys': {'cldbid': '10', 'ident': 'sso_uid', 'value': 'a'}, 'opts': []},
+                        {'keys': {'cldbid': '11', 'ident': 'sso_uid', 'value': 'b'}, 'opts': []},
+                        {'keys': {'cldbid': '12', 'ident': 'sso_uid', 'value': 'c'}, 'opts': []}]
+            if command == 'servergrouplist':
+                return [{'keys': {'sgid': str(sgid), 'name': 'G%s' % sgid, 'type': '1'}, 'opts': []}
+                        for sgid in group_members] + [{'keys': {'sgid': '9', 'name': 'Query', 'type': '2'}, 'opts': []}]
+            if command == 'servergroupclientlist':
+                members = group_members[keys['sgid']]
+                if not members:
+                    raise TeamspeakError('1281')
+                return [{'keys': {'cldbid': str(m)}, 'opts': []} for m in members]
+            return '0'
+        server = connect.return_value
+        server.send_command.side_effect = send_command
+
+        result = Teamspeak3Manager.update_all_groups({
+            'a': {'G1': 1},  # unchanged
+            'b': {'G1': 1, 'G3': 3},  # +3, -2
+            'c': {'G2': 2, 'G3': 3},  # +2, +3
+            'd': {'G1': 1},  # not on the server
+        })
+
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(result, {'added': 3, 'removed': 1, 'failed': 0, 'missing': 1})
+        changes = [(args[0], dict(args[1])) for args, kwargs in server.send_command.call_args_list
+                   if args[0] in ('servergroupaddclient', 'servergroupdelclient')]
+        self.assertEqual(sorted(changes, key=lambda c: (c[0], c[1]['sgid'])), [
+            ('servergroupaddclient', {'sgid': 2, 'cldbid': [12]}),
+            ('servergroupaddclient', {'sgid': 3, 'cldbid': [11, 12]}),
+            ('servergroupdelclient', {'sgid': 2, 'cldbid': [11]}),
+        ])
+        self.assertNotIn(mock.call('servergroupclientlist', {'sgid': 9}), server.send_command.call_args_list)
+
+    def test_batch_group_command(self):
+        server = mock.Mock()
+        server.send_command.side_effect = ['0', TeamspeakError('2561')]
+        with mock.patch.object(Teamspeak3Manager, 'server') as get_server, \
+                mock.patch(MODULE_PATH + '.manager.GROUP_BATCH_SIZE', 2):
+            get_server.return_value.__enter__.return_value = server
+            result = Teamspeak3Manager._batch_group_command('servergroupaddclient', {5: [3, 1, 2]})
+
+        self.assertEqual(result, (2, 1))
+        self.assertEqual(server.send_command.call_args_list[0][0][0], 'servergroupaddclient')
+        self.assertEqual(server.send_command.call_args_list[0][0][1], {'sgid': 5, 'cldbid': [1, 2]})
+        self.assertEqual(server.send_command.call_args_list[1][0][1], {'sgid': 5, 'cldbid': [3]})
+
+    def test_construct_batched_command(self):
+        cmd = TS3Proto().construct_command('servergroupaddclient',
+                                           keys=OrderedDict([('sgid', 5), ('cldbid', [1, 2])]))
+        self.assertEqual(cmd, 'servergroupaddclient sgid=5 cldbid=1|cldbid=2')
+
+
+class TS3ProtoTestCase(TestCase):
+    def setUp(self):
+        self.proto = TS3Proto()
+        self.proto._connected = True
+
+    def test_parse_matches_legacy_parser(self):
+        for name, response in benchmark.load_transcripts().items():
+            for line in response.decode('utf-8').split('\n'):
+                self.assertEqual(benchmark.legacy_parse_command(line), self.proto.parse_command(line))
+
+    def test_parse_command(self):
+        self.assertEqual(self.proto.parse_command('error id=0 msg=ok\n'),
+                         {'command': 'error', 'keys': {'id': '0', 'msg': 'ok'}, 'opts': []})
+        self.assertEqual(self.proto.parse_command('\rsgid=1 name=A\\sB|sgid=2 name=x=y -uid\n'),
+                         [{'keys': {'sgid': '1', 'name': 'A B'}, 'opts': []},
+                          {'keys': {'sgid': '2', 'name': 'x=y'}, 'opts': ['uid']}])
+
+    def test_escaping_matches_legacy(self):
+        values = ['plain', 'a b/c|d', 'back\\slash', 'tab\tnew\nline\r\x07\x08\x0b\x0c', '\\s', 'Ødegaard', 42]
+        for value in values:
+            escaped = TS3Proto._escape_str(value)
+            self.assertEqual(benchmark.legacy_escape_str(value), escaped)
+            self.assertEqual(benchmark.legacy_unescape_str(escaped), TS3Proto._unescape_str(escaped))
+        for value in ['\\\\s', '\\\\\\s', '\\x', '\\']:
+            self.assertEqual(benchmark.legacy_unescape_str(value), TS3Proto._unescape_str(value))
+
+    def test_send_command_buffered(self):
+        response = benchmark.load_transcripts()['servergrouplist']
+        self.proto._sock = benchmark.TranscriptSocket(response, chunk_size=7)
+        self.proto._reset_buffer()
+        groups = self.proto.send_command('servergrouplist')
+        self.assertEqual(len(groups), 40)
+        self.assertEqual(groups[1]['keys']['name'], 'Server Admin')
+        self.assertEqual(self.proto._sock.pending, [])
+
+    def test_send_command_error(self):
+        self.proto._sock = benchmark.TranscriptSocket(b'error id=1281 msg=database\\sempty\\sresult\\sset\n\r')
+        self.proto._reset_buffer()
+        with self.assertRaises(TeamspeakError) as cm:
+            self.proto.send_command('customsearch')
+        self.assertEqual(cm.exception.code, '1281')
+
+    def test_send_command_connection_closed(self):
+        self.proto._sock = benchmark.TranscriptSocket(b'')
+        self.proto._reset_buffer()
+        with self.assertRaises(TeamspeakError) as cm:
+            self.proto.send_command('version')
+        self.assertEqual(cm.exception.code, '1793')
+        self.assertFalse(self.proto._connected)
@@ -0,0 +1,149 @@
+"""
+Micro-benchmark for the ServerQuery wire parser
+
+Replays the ServerQuery transcripts in util/transcripts through the legacy
+parser and TS3Proto, checks both produce identical output and reports timings.
+
+    python -m services.modules.teamspeak3.util.benchmark [iterations]
+"""
+from __future__ import print_function, unicode_literals
+
+import io
+import os
+import sys
+import timeit
+
+from .ts3 import TS3Proto, ts3_escape
+
+TRANSCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transcripts')
+
+
+def load_transcripts():
+    """
+    Load recorded ServerQuery responses
+    @return: dict of command name to raw response bytes
+    """
+    transcripts = {}
+    for name in sorted(os.listdir(TRANSCRIPT_DIR)):
+        if name.endswith('.txt'):
+            with io.open(os.path.join(TRANSCRIPT_DIR, name), 'rb') as f:
+                transcripts[name[:-4]] = f.read()
+    return transcripts
+
+
+def legacy_unescape_str(value):
+    if isinstance(value, int):
+        return "%d" % value
+    value = value.replace(r"\\", "\\")
+    for i, j in ts3_escape.items():
+        value = value.replace(j, i)
+    return value
+
+
+def legacy_escape_str(value):
+    if isinstance(value, int):
+        return "%d" % value
+    value = value.replace("\\", r'\\')
+    for i, j in ts3_escape.items():
+        value = value.replace(i, j)
+    return value
+
+
+def legacy_parse_command(commandstr):
+    """
+    The recursive split based parser TS3Proto used previously
+    """
+    if len(commandstr.split('|')) > 1:
+        vals = []
+        for cmd in commandstr.split('|'):
+            vals.append(legacy_parse_command(cmd))
+        return vals
+
+    cmdlist = commandstr.strip().split(' ')
+    command = None
+    keys = {}
+    opts = []
+
+    for key in cmdlist:
+        v = key.strip().split('=')
+        if len(v) > 1:
+            # Key, values may contain '='
+            v = [v[0], '='.join(v[1:])]
+            key, value = v
+            keys[key] = legacy_unescape_str(value)
+        elif not v == ['']:
+            if v[0][0] and v[0][0] == '-':
+                # Option
+                opts.append(v[0][1:])
+            else:
+                command = v[0]
+
+    d = {'keys': keys, 'opts': opts}
+    if command:
+        d['command'] = command
+    return d
+
+
+class TranscriptSocket(object):
+    """
+    Socket replaying a recorded response for every command sent
+    """
+    def __init__(self, response, chunk_size=1460):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.pending = []
+
+    def sendall(self, data):
+        self.pending = [self.response[i:i + self.chunk_size]
+                        for i in range(0, len(self.response), self.chunk_size)]
+
+    def recv(self, size):
+        return self.pending.pop(0) if self.pending else b''
+
+
+def legacy_send_command(sockfile):
+    """
+    Previous response loop, reading from an in memory file rather than the
+    unbuffered socket file so only parsing is compared
+    """
+    data = []
+    while True:
+        resp = legacy_parse_command(sockfile.readline().decode('utf-8'))
+        if 'command' not in resp:
+            data.append(resp)
+        else:
+            return data
+
+
+def send_command(proto):
+    return proto.send_command('benchmark')
+
+
+def run(iterations=200, out=sys.stdout):
+    proto = TS3Proto()
+    proto._connected = True
+    for name, response in sorted(load_transcripts().items()):
+        lines = response.decode('utf-8').split('\n')
+        if [legacy_parse_command(line) for line in lines] != [proto.parse_command(line) for line in lines]:
+            raise AssertionError('Parser output differs for %s' % name)
+
+        proto._sock = TranscriptSocket(response)
+        proto._reset_buffer()
+        legacy = timeit.timeit(lambda: legacy_send_command(io.BytesIO(response)), number=iterations)
+        current = timeit.timeit(lambda: send_command(proto), number=iterations)
+        print('%-24s %8d bytes  legacy %8.2fms  current %8.2fms  %5.1fx' % (
+            name, len(response), legacy * 1000 / iterations, current * 1000 / iterations, legacy / current), file=out)
+
+    values = []
+    for response in load_transcripts().values():
+        entries = legacy_parse_command(response.decode('utf-8').split('\n')[0])
+        for entry in entries if isinstance(entries, list) else [entries]:
+            values.extend(entry['keys'].values())
+    legacy = timeit.timeit(lambda: [legacy_escape_str(v) for v in values], number=iterations)
+    current = timeit.timeit(lambda: [TS3Proto._escape_str(v) for v in values], number=iterations)
+    print('%-24s %8d values legacy %8.2fms  current %8.2fms  %5.1fx' % (
+        'escape', len(values), legacy * 1000 / iterations, current * 1000 / iterations, legacy / current), file=out)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
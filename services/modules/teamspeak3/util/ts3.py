@@ -1,6 +1,18 @@
 from __future__ import unicode_literals
+import os
+import re
 import socket
 import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    text_type = unicode
+except NameError:
+    # Py3
+    text_type = str
 
 
 class ConnectionError:
@@ -23,6 +35,16 @@ ts3_escape = {'/': r"\/",
               "\t": r'\t',
               "\v": r'\v'}
 
+# Escape every character in one str.translate pass
+ts3_escape_table = dict((ord(i), j) for i, j in ts3_escape.items())
+ts3_escape_table[ord('\\')] = r'\\'
+
+ts3_unescape = dict((j[1], i) for i, j in ts3_escape.items())
+ts3_unescape_re = re.compile(r'\\([%s])' % re.escape(''.join(ts3_unescape)))
+
+RECV_SIZE = 64 * 1024
+
+
 class TS3Proto:
     bytesin = 0
     bytesout = 0
@@ -42,14 +64,34 @@ class TS3Proto:
             raise
         else:
             self._sock = s
-            self._sockfile = s.makefile('r', 0)
+            self._reset_buffer()
 
-        data = self._sockfile.readline()
+        data = self._readline()
         if data.strip() == "TS3":
-            self._sockfile.readline()
+            self._readline()
             self._connected = True
             return True
 
+    def _reset_buffer(self):
+        self._lines = deque()
+        self._partial = b''
+
+    def _readline(self):
+        """
+        Read the next line from the socket, receiving in large chunks
+        Returns an empty string once the server closes the connection.
+        """
+        while not self._lines:
+            data = self._sock.recv(RECV_SIZE)
+            if not data:
+                line, self._partial = self._partial, b''
+                return line.decode('utf-8', 'replace')
+            self.bytesin += len(data)
+            lines = (self._partial + data).split(b'\n')
+            self._partial = lines.pop()
+            self._lines.extend(lines)
+        return self._lines.popleft().decode('utf-8', 'replace') + '\n'
+
     def disconnect(self):
         self.send_command("quit")
         self._sock.close()
@@ -64,7 +106,11 @@ class TS3Proto:
         data = []
 
         while True:
-            resp = self._sockfile.readline()
+            resp = self._readline()
+            if not resp:
+                # EOF, the server has closed the connection
+                self._connected = False
+                raise TeamspeakError('1793')
             resp = self.parse_command(resp)
             if 'command' not in resp:
                 data.append(resp)
@@ -118,36 +164,40 @@ class TS3Proto:
     def parse_command(self, commandstr):
         """
         Parses a TS3 command string into command/keys/opts tuple
+        Responses with multiple entries are parsed into a list.
         @param commandstr: Command string
         @type commandstr: string
         """
 
-        if len(commandstr.split('|')) > 1:
-            vals = []
-            for cmd in commandstr.split('|'):
-                vals.append(self.parse_command(cmd))
-            return vals
+        if '|' in commandstr:
+            return [self._parse_entry(entry) for entry in commandstr.split('|')]
+        return self._parse_entry(commandstr)
+
+    def _parse_entry(self, entry):
+        """
+        Parses a single pipe separated entry of a TS3 command string
+        @param entry: Entry string
+        @type entry: string
+        """
 
-        cmdlist = commandstr.strip().split(' ')
         command = None
         keys = {}
         opts = []
-
-        for key in cmdlist:
-            v = key.strip().split('=')
-            if len(v) > 1:
-                # Key
-                if len > 2:
-                    # Fix the stupidities in TS3 escaping
-                    v = [v[0], '='.join(v[1:])]
-                key, value = v
-                keys[key] = self._unescape_str(value)
-            elif not v == ['']:
-                if v[0][0] and v[0][0] == '-':
-                    # Option
-                    opts.append(v[0][1:])
-                else:
-                    command = v[0]
+        unescape = self._unescape_str
+
+        for token in entry.split(' '):
+            token = token.strip()
+            if not token:
+                continue
+            # Values may contain unescaped '=', only the first one separates the key
+            key, sep, value = token.partition('=')
+            if sep:
+                keys[key] = unescape(value)
+            elif token[0] == '-':
+                # Option
+                opts.append(token[1:])
+            else:
+                command = token
 
         d = {'keys': keys, 'opts': opts}
         if command:
@@ -164,10 +214,7 @@ class TS3Proto:
 
         if isinstance(value, int):
             return "%d" % value
-        value = value.replace("\\", r'\\')
-        for i, j in ts3_escape.items():
-            value = value.replace(i, j)
-        return value
+        return text_type(value).translate(ts3_escape_table)
 
     @staticmethod
     def _unescape_str(value):
@@ -179,15 +226,19 @@ class TS3Proto:
 
         if isinstance(value, int):
             return "%d" % value
+        if '\\' not in value:
+            return value
+        # Collapse escaped backslashes first, as the previous replace() chain did
         value = value.replace(r"\\", "\\")
-        for i, j in ts3_escape.items():
-            value = value.replace(j, i)
-        return value
+        return ts3_unescape_re.sub(lambda m: ts3_unescape[m.group(1)], value)
 
     def send(self, payload):
-        if self._connected:
-            self._log.debug('Sent: %s' % payload)
-            self._sockfile.write(payload)
+        if not self._connected:
+            raise TeamspeakError('1794')
+        self._log.debug('Sent: %s' % payload)
+        data = payload.encode('utf-8')
+        self.bytesout += len(data)
+        self._sock.sendall(data)
 
 
 class TS3Server(TS3Proto):
@@ -206,7 +257,7 @@ class TS3Server(TS3Proto):
                 self.use(id)
         else:
             self._sock = sock
-            self._sockfile = sock.makefile('r', 0)
+            self._reset_buffer()
             self._connected = True
 
     def login(self, username, password):
@@ -249,6 +300,175 @@ class TS3Server(TS3Proto):
             self.send_command('use', keys={'sid': id})
 
 
+class PooledTS3Server(TS3Server):
+    # Connection lost / not connected
+    reconnect_errors = ('1793', '1794')
+    # Commands which only read, so are safe to send again on a new session. Any other command
+    # may have been carried out before the connection was lost.
+    replayable_commands = ('version', 'whoami', 'serverlist', 'clientlist', 'customsearch', 'servergrouplist',
+                           'servergroupclientlist', 'servergroupsbyclientid')
+
+    def __init__(self, ip, port, username, password, server_id):
+        """
+        Logged in ServerQuery connection which transparently reconnects when the
+        connection to the server is lost
+        @param ip: IP Address
+        @type ip: str
+        @param port: Port Number
+        @type port: int
+        @param username: ServerQuery username
+        @type username: str
+        @param password: ServerQuery password
+        @type password: str
+        @param server_id: Virtual Server ID
+        @type server_id: int
+        """
+        self._address = (ip, port)
+        self._credentials = (username, password)
+        self._server_id = server_id
+        self._reconnecting = False
+        self.last_used = time.time()
+        TS3Server.__init__(self, ip, port)
+        self._login()
+
+    def _login(self):
+        self.login(*self._credentials)
+        self.use(self._server_id)
+
+    def reconnect(self):
+        """
+        Drop the current socket and open a new logged in session
+        """
+        self._log.info('Reconnecting to %s port %s' % self._address)
+        self.close()
+        # a session dropped while logging in again isn't retried
+        self._reconnecting = True
+        try:
+            self.connect(*self._address)
+            self._login()
+        finally:
+            self._reconnecting = False
+
+    def close(self):
+        """
+        Close the socket without waiting for the server to acknowledge
+        """
+        self._connected = False
+        if getattr(self, '_sock', None) is not None:
+            try:
+                self._sock.close()
+            except socket.error:
+                pass
+        self._sock = None
+
+    def keepalive(self):
+        """
+        Ping the server so the session is not dropped for idling
+        """
+        self.send_command('version')
+
+    def send_command(self, command, keys=None, opts=None):
+        """
+        Send a command, reconnecting and sending it once more if the connection was lost and the
+        command is replayable
+        """
+        self.last_used = time.time()
+        try:
+            return TS3Server.send_command(self, command, keys=keys, opts=opts)
+        except TeamspeakError as e:
+            if e.code not in self.reconnect_errors:
+                raise
+            error = e
+        except socket.error:
+            error = TeamspeakError('1793')
+        if self._reconnecting or command not in self.replayable_commands:
+            # the pool drops the closed connection, the caller decides whether to try again
+            self.close()
+            raise error
+        self.reconnect()
+        return TS3Server.send_command(self, command, keys=keys, opts=opts)
+
+
+class TS3ServerPool(object):
+    def __init__(self, ip, port, username, password, server_id, size=1, keepalive=60):
+        """
+        Per process pool of logged in ServerQuery connections
+        @param size: Maximum number of idle connections to keep open
+        @type size: int
+        @param keepalive: Idle seconds after which a connection is pinged before reuse
+        @type keepalive: int
+        """
+        self._args = (ip, port, username, password, server_id)
+        self.size = size
+        self.keepalive = keepalive
+        self._log = logging.getLogger('%s.%s' % (__name__, self.__class__.__name__))
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []
+        self._local = threading.local()
+
+    def _connect(self):
+        return PooledTS3Server(*self._args)
+
+    def acquire(self):
+        """
+        Take an idle connection from the pool or open a new one
+        @return: PooledTS3Server
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked, sockets belong to the parent process
+                self._reset()
+            server = self._idle.pop() if self._idle else None
+        if server is None:
+            self._log.debug('Opening new ServerQuery connection')
+            return self._connect()
+        if time.time() - server.last_used > self.keepalive:
+            server.keepalive()
+        return server
+
+    def release(self, server):
+        """
+        Return a connection to the pool, closing it if the pool is full or it is broken
+        @param server: PooledTS3Server
+        """
+        with self._lock:
+            if server._connected and self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append(server)
+                return
+        server.close()
+
+    def clear(self):
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server in idle:
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager yielding a pooled connection. Nested use on the same thread
+        shares the outer connection so a whole sync runs in one session.
+        """
+        server = getattr(self._local, 'server', None)
+        if server is not None:
+            yield server
+            return
+        server = self.acquire()
+        self._local.server = server
+        try:
+            yield server
+        finally:
+            self._local.server = None
+            self.release(server)
+
+
 class TeamspeakError(Exception):
     def __init__(self, code, msg=None):
         self.code = str(code)
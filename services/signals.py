@@ -9,9 +9,9 @@ from django.db.models.signals import pre_delete
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 
-from alliance_auth.hooks import get_hooks
 from authentication.tasks import disable_member
 from authentication.tasks import set_state
+from services.tasks import schedule_group_sync
 
 logger = logging.getLogger(__name__)
 
@@ -22,14 +22,7 @@ def m2m_changed_user_groups(sender, instance, action, *args, **kwargs):
 
     def trigger_service_group_update():
         logger.debug("Triggering service group update for %s" % instance)
-        # Iterate through Service hooks
-        services = get_hooks('services_hook')
-        for fn in services:
-            svc = fn()
-            try:
-                svc.update_groups(instance)
-            except:
-                logger.exception('Exception running update_groups for services module %s on user %s' % (svc, instance))
+        schedule_group_sync(instance)
 
     if instance.pk and (action == "post_add" or action == "post_remove" or action == "post_clear"):
         logger.debug("Waiting for commit to trigger service group update for %s" % instance)
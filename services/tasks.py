@@ -1,10 +1,15 @@
 from __future__ import unicode_literals
 
 import logging
+from collections import OrderedDict
 
 from celery import task
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
 
-from alliance_auth.hooks import get_hooks
+from alliance_auth.hooks import get_hook_instances
+from alliance_auth.threads import thread_map
 from authentication.states import MEMBER_STATE, BLUE_STATE
 from notifications import notify
 import redis
@@ -13,6 +18,17 @@ REDIS_CLIENT = redis.Redis()
 
 logger = logging.getLogger(__name__)
 
+# seconds group changes to a user are collected for before their services are synced
+GROUP_SYNC_DEBOUNCE = int(getattr(settings, 'SERVICES_GROUP_SYNC_DEBOUNCE', 5))
+
+GROUP_SYNC_PENDING_KEY = 'SERVICES_GROUP_SYNC_PENDING_%s'
+GROUP_SYNC_EVENTS_KEY = 'SERVICES_GROUP_SYNC_EVENTS_%s'
+GROUP_SYNC_STATS_KEY = 'SERVICES_GROUP_SYNC_STATS_%s'
+
+# optional settings for how many services hooks run concurrently, and how long each may take
+HOOK_WORKERS = int(getattr(settings, 'SERVICES_HOOK_WORKERS', 5))
+HOOK_TIMEOUT = float(getattr(settings, 'SERVICES_HOOK_TIMEOUT', 60))
+
 
 # http://loose-bits.com/2010/10/distributed-task-locking-in-celery.html
 def only_one(function=None, key="", timeout=None):
@@ -41,19 +57,48 @@ def only_one(function=None, key="", timeout=None):
     return _dec(function) if function is not None else _dec
 
 
+def run_service_hooks(method, user, *args, **kwargs):
+    """
+    Call a method of every services hook for the user. Hooks run concurrently on a bounded
+    thread pool, each given HOOK_TIMEOUT seconds from when the hooks are started.
+    :param method: name of the ServicesHook method to call
+    :param user: django.contrib.auth.models.User
+    :param args: further arguments to the method
+    :param kwargs: further keyword arguments to the method
+    :return: OrderedDict of service name to a (success, return value or exception) tuple
+    """
+    services = get_hook_instances('services_hook')
+
+    def _call(svc):
+        try:
+            return True, getattr(svc, method)(user, *args, **kwargs)
+        except Exception as e:
+            logger.exception('Exception running %s for services module %s on user %s' % (method, svc, user))
+            return False, e
+
+    def _timed_out(svc, e):
+        logger.error('Timed out after %ss running %s for services module %s on user %s' % (
+            HOOK_TIMEOUT, method, svc, user))
+        return False, e
+
+    results = thread_map(_call, services, HOOK_WORKERS, timeout=HOOK_TIMEOUT, on_timeout=_timed_out)
+    return OrderedDict((svc.name, result) for svc, result in zip(services, results))
+
+
+def _failed(results):
+    return [name for name, (success, result) in results.items() if not success]
+
+
 def deactivate_services(user):
-    change = False
     logger.debug("Deactivating services for user %s" % user)
-    # Iterate through service hooks and disable users
-    for fn in get_hooks('services_hook'):
-        svc = fn()
-        try:
-            if svc.delete_user(user):
-                change = True
-        except:
-            logger.exception('Exception running delete_user for services module %s on user %s' % (svc, user))
-    if change:
-        notify(user, "Services Disabled", message="Your services accounts have been disabled.", level="danger")
+    results = run_service_hooks('delete_user', user)
+    disabled = [name for name, (success, result) in results.items() if success and result]
+    if _failed(results):
+        logger.warn("Failed to deactivate services %s for user %s" % (', '.join(_failed(results)), user))
+    if disabled:
+        notify(user, "Services Disabled", message="Your services accounts have been disabled: %s." %
+               ', '.join(disabled), level="danger")
+    return results
 
 
 @task(bind=True)
@@ -63,13 +108,68 @@ def validate_services(self, user, state):
     elif state == BLUE_STATE:
         setting_string = 'BLUE'
     else:
-        deactivate_services(user)
-        return
+        return deactivate_services(user)
     logger.debug('Ensuring user %s services are available to state %s' % (user, state))
-    # Iterate through services hooks and have them check the validity of the user
-    for fn in get_hooks('services_hook'):
-        svc = fn()
-        try:
-            svc.validate_user(user)
-        except:
-            logger.exception('Exception running validate_user for services module %s on user %s' % (svc, user))
+    results = run_service_hooks('validate_user', user)
+    if _failed(results):
+        logger.warn("Failed to validate services %s for user %s" % (', '.join(_failed(results)), user))
+    return results
+
+
+def _incr(key, delta=1, timeout=None):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # key expired or the cache doesn't store anything
+        return delta
+
+
+def schedule_group_sync(user):
+    """
+    Record a change to the users groups, scheduling a sync of their service groups
+    unless one is already waiting to run
+    :param user: django.contrib.auth.models.User
+    :return: True if a sync was scheduled
+    """
+    # generous expiry so a backed up queue doesn't cause a second sync to be scheduled
+    timeout = GROUP_SYNC_DEBOUNCE + 300
+    _incr(GROUP_SYNC_EVENTS_KEY % user.pk, timeout=timeout)
+    _incr(GROUP_SYNC_STATS_KEY % 'events')
+    if cache.add(GROUP_SYNC_PENDING_KEY % user.pk, True, timeout):
+        logger.debug("Scheduling service group sync for %s in %s seconds" % (user, GROUP_SYNC_DEBOUNCE))
+        sync_user_groups.apply_async(args=[user.pk], countdown=GROUP_SYNC_DEBOUNCE)
+        return True
+    logger.debug("Service group sync for %s already scheduled" % user)
+    return False
+
+
+def group_sync_stats():
+    """
+    Number of group change events received and service group syncs run
+    :return: dict with events, syncs and collapsed counts
+    """
+    stats = cache.get_many([GROUP_SYNC_STATS_KEY % 'events', GROUP_SYNC_STATS_KEY % 'syncs'])
+    events = stats.get(GROUP_SYNC_STATS_KEY % 'events', 0)
+    syncs = stats.get(GROUP_SYNC_STATS_KEY % 'syncs', 0)
+    return {'events': events, 'syncs': syncs, 'collapsed': max(0, events - syncs)}
+
+
+@task
+def sync_user_groups(pk):
+    """
+    Update the users groups on every service, once for all changes collected since it was scheduled
+    :param pk: User primary key
+    """
+    # changes from here on need another sync
+    cache.delete(GROUP_SYNC_PENDING_KEY % pk)
+    events = cache.get(GROUP_SYNC_EVENTS_KEY % pk) or 1
+    cache.delete(GROUP_SYNC_EVENTS_KEY % pk)
+    _incr(GROUP_SYNC_STATS_KEY % 'syncs')
+    try:
+        user = User.objects.get(pk=pk)
+    except User.DoesNotExist:
+        logger.debug("User with pk %s deleted before service group sync" % pk)
+        return
+    logger.debug("Syncing service groups for %s after %s group changes" % (user, events))
+    run_service_hooks('update_groups', user)
@@ -1,18 +1,61 @@
 from __future__ import unicode_literals
 
+import hashlib
+
 from django import template
+from django.conf import settings
+from django.utils import translation
 
-from alliance_auth.hooks import get_hooks
+from alliance_auth.cache import LocalCache
+from alliance_auth.hooks import get_hook_instances
+from authentication.managers import UserState
 
 register = template.Library()
 
+# optional settings for how many rendered menus are kept in each process, and for how many seconds.
+# Set the size to 0 if a menu hook renders differently for users with the same state and permissions.
+MENU_CACHE_SIZE = int(getattr(settings, 'SERVICES_MENU_CACHE_SIZE', 1000))
+MENU_CACHE_DURATION = int(getattr(settings, 'SERVICES_MENU_CACHE_DURATION', 60 * 5))
+
+menu_cache = LocalCache(MENU_CACHE_SIZE, MENU_CACHE_DURATION)
+
+_sorted_hooks = {}  # Dict of Name: (hook instances, instances sorted by order)
+
+
+def get_menu_hooks(name):
+    """
+    Get the menu item hooks for the given hook name in the order they are displayed
+    :param name: str name of the menu hook
+    :return: list of MenuItemHook
+    """
+    instances = get_hook_instances(name)
+    cached = _sorted_hooks.get(name)
+    if cached is None or cached[0] is not instances:
+        cached = _sorted_hooks[name] = (instances, sorted(instances, key=lambda i: i.order))
+    return cached[1]
+
+
+def menu_cache_key(name, request):
+    """
+    Build the key a rendered menu is cached under. Menu items only vary with the language, the active
+    page and what the user is allowed to see.
+    :param name: str name of the menu hook
+    :param request: HttpRequest
+    :return: str
+    """
+    user = request.user
+    match = getattr(request, 'resolver_match', None)
+    perms = hashlib.md5(','.join(sorted(user.get_all_permissions())).encode('utf-8')).hexdigest()
+    return '%s:%s:%s:%s:%s:%s' % (name, translation.get_language(), match.view_name if match else request.path,
+                                  UserState.get_membership_state(request)['STATE'], user.is_superuser, perms)
+
 
-def process_menu_items(hooks, request):
-    _menu_items = list()
-    items = [fn() for fn in hooks]
-    items.sort(key=lambda i: i.order)
-    for item in items:
-        _menu_items.append(item.render(request))
+def process_menu_items(name, request):
+    key = menu_cache_key(name, request)
+    _menu_items = menu_cache.get(key)
+    if _menu_items is None:
+        _menu_items = [item.render(request) for item in get_menu_hooks(name)]
+        menu_cache.set(key, _menu_items)
     return _menu_items
 
 
@@ -21,7 +64,7 @@ def menu_main(context):
     request = context['request']
 
     return {
-        'menu_items': process_menu_items(get_hooks('menu_main_hook'), request),
+        'menu_items': process_menu_items('menu_main_hook', request),
     }
 
 
@@ -30,7 +73,7 @@ def menu_aux(context):
     request = context['request']
 
     return {
-        'menu_items': process_menu_items(get_hooks('menu_aux_hook'), request),
+        'menu_items': process_menu_items('menu_aux_hook', request),
     }
 
 
@@ -39,5 +82,5 @@ def menu_util(context):
     request = context['request']
 
     return {
-        'menu_items': process_menu_items(get_hooks('menu_util_hook'), request),
+        'menu_items': process_menu_items('menu_util_hook', request),
     }
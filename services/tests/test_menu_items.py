@@ -0,0 +1,76 @@
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+from django.contrib.auth.models import Permission
+from django.template.loader import render_to_string
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import resolve
+
+from alliance_auth import hooks
+from alliance_auth.tests.auth_utils import AuthUtils
+
+from services.hooks import MenuItemHook
+from services.templatetags.menu_items import process_menu_items, menu_cache, get_menu_hooks
+
+HOOK_NAME = 'test_menu_hook'
+
+
+class PermissionMenuItem(MenuItemHook):
+    def render(self, request):
+        if request.user.has_perm('auth.jabber_broadcast'):
+            return MenuItemHook.render(self, request)
+        return ''
+
+
+@override_settings(LANGUAGE_CODE='en')
+class MenuItemsTestCase(TestCase):
+    def setUp(self):
+        menu_cache.clear()
+        self.factories = [
+            mock.Mock(side_effect=lambda: MenuItemHook('Second', 'fa', 'auth_help', order=2)),
+            mock.Mock(side_effect=lambda: PermissionMenuItem('First', 'fa', 'auth_groups', order=1)),
+        ]
+        patcher = mock.patch.dict(hooks._hooks, {HOOK_NAME: list(self.factories)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        hooks._hook_instances.pop(HOOK_NAME, None)
+        self.addCleanup(hooks._hook_instances.pop, HOOK_NAME, None)
+        self.member = AuthUtils.create_member('auth_member')
+
+    def request(self, user, path='/en/help/'):
+        request = RequestFactory().get(path)
+        request.user = user
+        request.resolver_match = resolve(path)
+        return request
+
+    def test_hooks_created_once(self):
+        self.assertEqual([item.text for item in get_menu_hooks(HOOK_NAME)], ['First', 'Second'])
+        self.assertIs(get_menu_hooks(HOOK_NAME), get_menu_hooks(HOOK_NAME))
+        for factory in self.factories:
+            self.assertEqual(factory.call_count, 1)
+
+        # registering another hook includes it
+        hooks.register(HOOK_NAME, lambda: MenuItemHook('Third', 'fa', 'auth_help', order=3))
+        self.assertEqual([item.text for item in get_menu_hooks(HOOK_NAME)], ['First', 'Second', 'Third'])
+
+    def test_rendered_menu_cached_per_permissions(self):
+        with mock.patch('services.hooks.render_to_string', wraps=render_to_string) as render:
+            items = process_menu_items(HOOK_NAME, self.request(self.member))
+            self.assertEqual(process_menu_items(HOOK_NAME, self.request(self.member)), items)
+            self.assertEqual(render.call_count, 1)
+
+        self.assertEqual(items[0], '')
+        self.assertIn('active', items[1])
+
+        self.member.user_permissions.add(Permission.objects.get(codename='jabber_broadcast'))
+        self.member = type(self.member).objects.get(pk=self.member.pk)
+        items = process_menu_items(HOOK_NAME, self.request(self.member, '/en/groups/'))
+        self.assertIn('First', items[0])
+        self.assertIn('active', items[0])
+        self.assertNotIn('active', items[1])
@@ -7,12 +7,19 @@ except ImportError:
     # Py2
     import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 
 from authentication.states import MEMBER_STATE, BLUE_STATE, NONE_STATE
+from authentication.tasks import set_state
 from alliance_auth.tests.auth_utils import AuthUtils
+from alliance_auth.tests.cache_utils import LOCMEM_CACHE
 
-from services.tasks import deactivate_services, validate_services
+from services.tasks import deactivate_services, validate_services, schedule_group_sync, sync_user_groups, \
+    group_sync_stats, run_service_hooks
+
+import time
+from multiprocessing import TimeoutError
 
 
 class ServicesTasksTestCase(TestCase):
@@ -20,9 +27,9 @@ class ServicesTasksTestCase(TestCase):
         self.member = AuthUtils.create_member('auth_member')
         self.none_user = AuthUtils.create_user('none_user', disconnect_signals=True)
 
-    @mock.patch('services.tasks.get_hooks')
+    @mock.patch('services.tasks.get_hook_instances')
     @mock.patch('services.tasks.deactivate_services')
-    def test_validate_services_deactivate(self, deactivate_services, get_hooks):
+    def test_validate_services_deactivate(self, deactivate_services, get_hook_instances):
         """
         Test validate services will call deactivate on a None state user
         """
@@ -32,23 +39,24 @@ class ServicesTasksTestCase(TestCase):
         self.assertTrue(deactivate_services.called)
         args, kwargs = deactivate_services.call_args
         self.assertEqual(self.none_user, args[0])  # Assert correct user is passed
-        self.assertFalse(get_hooks.called)
+        self.assertFalse(get_hook_instances.called)
 
-    @mock.patch('services.tasks.get_hooks')
+    @mock.patch('services.tasks.get_hook_instances')
     @mock.patch('services.tasks.deactivate_services')
-    def test_validate_services_valid_member(self, deactivate_services, get_hooks):
+    def test_validate_services_valid_member(self, deactivate_services, get_hook_instances):
         """
         Test that validate_services is called for a valid member
         """
         svc = mock.Mock()
+        svc.name = 'test_service'
         svc.validate_user.return_value = None
 
-        get_hooks.return_value = [lambda: svc]
+        get_hook_instances.return_value = [svc]
 
         validate_services.delay(user=self.member, state=MEMBER_STATE)
 
-        self.assertTrue(get_hooks.called)
-        args, kwargs = get_hooks.call_args
+        self.assertTrue(get_hook_instances.called)
+        args, kwargs = get_hook_instances.call_args
         self.assertEqual('services_hook', args[0])
         self.assertTrue(svc.validate_user.called)
         args, kwargs = svc.validate_user.call_args
@@ -56,20 +64,21 @@ class ServicesTasksTestCase(TestCase):
         self.assertFalse(deactivate_services.called)
 
     @mock.patch('services.tasks.notify')
-    @mock.patch('services.tasks.get_hooks')
-    def test_deactivate_services(self, get_hooks, notify):
+    @mock.patch('services.tasks.get_hook_instances')
+    def test_deactivate_services(self, get_hook_instances, notify):
         """
         Test that hooks delete_user function is called by deactivate_services
         """
         svc = mock.Mock()
+        svc.name = 'test_service'
         svc.delete_user.return_value = True
 
-        get_hooks.return_value = [lambda: svc]
+        get_hook_instances.return_value = [svc]
 
         deactivate_services(self.member)
 
-        self.assertTrue(get_hooks.called)
-        args, kwargs = get_hooks.call_args
+        self.assertTrue(get_hook_instances.called)
+        args, kwargs = get_hook_instances.call_args
         self.assertEqual('services_hook', args[0])
         self.assertTrue(svc.delete_user.called)
         args, kwargs = svc.delete_user.call_args
@@ -79,3 +88,137 @@ class ServicesTasksTestCase(TestCase):
         self.assertEqual(self.member, args[0])  # Assert user is passed to the notification system
         self.assertEqual("Services Disabled", args[1])
         self.assertEqual("danger", kwargs['level'])
+
+
+
+class RunServiceHooksTestCase(TestCase):
+    def setUp(self):
+        self.member = AuthUtils.create_member('auth_member')
+
+    @staticmethod
+    def make_service(name, side_effect=None, return_value=None):
+        svc = mock.Mock()
+        svc.name = name
+        svc.validate_user.side_effect = side_effect
+        svc.validate_user.return_value = return_value
+        return svc
+
+    @mock.patch('alliance_auth.threads.connection')
+    @mock.patch('services.tasks.get_hook_instances')
+    def test_run_service_hooks(self, get_hook_instances, connection):
+        """
+        Test every hook is run concurrently and reports its own result
+        """
+        connection.in_atomic_block = False
+        error = ValueError('broken')
+        get_hook_instances.return_value = [
+            self.make_service('first', return_value=1),
+            self.make_service('broken', side_effect=error),
+            self.make_service('last', return_value=3),
+        ]
+
+        results = run_service_hooks('validate_user', self.member)
+
+        self.assertEqual(list(results.keys()), ['first', 'broken', 'last'])
+        self.assertEqual(results['first'], (True, 1))
+        self.assertEqual(results['broken'], (False, error))
+        self.assertEqual(results['last'], (True, 3))
+        # worker threads close their own connections
+        self.assertEqual(connection.close.call_count, 3)
+
+    @mock.patch('services.tasks.HOOK_TIMEOUT', 0.1)
+    @mock.patch('alliance_auth.threads.connection')
+    @mock.patch('services.tasks.get_hook_instances')
+    def test_run_service_hooks_timeout(self, get_hook_instances, connection):
+        """
+        Test a slow hook times out without holding up the others
+        """
+        connection.in_atomic_block = False
+        get_hook_instances.return_value = [
+            self.make_service('slow', side_effect=lambda user: time.sleep(1)),
+            self.make_service('fast', return_value=True),
+        ]
+
+        start = time.time()
+        results = run_service_hooks('validate_user', self.member)
+
+        self.assertLess(time.time() - start, 1)
+        self.assertFalse(results['slow'][0])
+        self.assertIsInstance(results['slow'][1], TimeoutError)
+        self.assertEqual(results['fast'], (True, True))
+
+    @mock.patch('alliance_auth.threads.ThreadPool')
+    @mock.patch('services.tasks.get_hook_instances')
+    def test_run_service_hooks_in_transaction(self, get_hook_instances, thread_pool):
+        """
+        Test hooks run serially on the current connection inside a transaction
+        """
+        get_hook_instances.return_value = [self.make_service('first'), self.make_service('second')]
+
+        results = run_service_hooks('validate_user', self.member)
+
+        self.assertFalse(thread_pool.called)
+        self.assertEqual(results, {'first': (True, None), 'second': (True, None)})
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class GroupSyncTestCase(TestCase):
+    def setUp(self):
+        self.member = AuthUtils.create_member('auth_member')
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    @mock.patch('services.tasks.get_hook_instances')
+    @mock.patch('services.tasks.sync_user_groups')
+    def test_schedule_group_sync_coalesces(self, sync_user_groups, get_hook_instances):
+        """
+        Test several group changes only schedule a single sync
+        """
+        self.assertTrue(schedule_group_sync(self.member))
+        self.assertFalse(schedule_group_sync(self.member))
+        self.assertFalse(schedule_group_sync(self.member))
+
+        self.assertEqual(sync_user_groups.apply_async.call_count, 1)
+        args, kwargs = sync_user_groups.apply_async.call_args
+        self.assertEqual([self.member.pk], kwargs['args'])
+        self.assertFalse(get_hook_instances.called)
+
+    @mock.patch('services.tasks.get_hook_instances')
+    @mock.patch('services.tasks.sync_user_groups.apply_async')
+    def test_sync_user_groups(self, apply_async, get_hook_instances):
+        """
+        Test the sync updates every service once and allows the next change to be scheduled
+        """
+        svc = mock.Mock()
+        svc.name = 'test_service'
+        get_hook_instances.return_value = [svc]
+        for i in range(4):
+            schedule_group_sync(self.member)
+
+        sync_user_groups(self.member.pk)
+
+        self.assertEqual(svc.update_groups.call_count, 1)
+        args, kwargs = svc.update_groups.call_args
+        self.assertEqual(self.member, args[0])
+        self.assertEqual(group_sync_stats(), {'events': 4, 'syncs': 1, 'collapsed': 3})
+
+        self.assertTrue(schedule_group_sync(self.member))
+        self.assertEqual(apply_async.call_count, 2)
+
+    @mock.patch('services.signals.transaction')
+    @mock.patch('services.tasks.sync_user_groups')
+    def test_state_change_single_sync(self, sync_user_groups, transaction):
+        """
+        Test the group changes made by a state change are collapsed into one sync
+        """
+        transaction.on_commit = lambda fn: fn()
+        user = AuthUtils.create_user('none_user', disconnect_signals=True)
+        AuthUtils.add_main_character(user, 'member', 11, corp_id=1, corp_name='Member Corp')
+
+        with self.settings(STR_CORP_IDS=['1'], STR_ALLIANCE_IDS=[], MEMBER_CORP_GROUPS=True):
+            set_state(user)
+
+        self.assertEqual(sync_user_groups.apply_async.call_count, 1)
+        self.assertGreater(group_sync_stats()['collapsed'], 0)
@@ -1,13 +1,10 @@
 from __future__ import unicode_literals
 
-from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
 
-from alliance_auth.hooks import get_hooks
+from alliance_auth.hooks import get_hook_instances
 from authentication.decorators import members_and_blues
-from authentication.models import AuthServicesInfo
-from eveonline.models import EveCharacter
 from services.forms import FleetFormatterForm
 
 import logging
@@ -49,18 +46,11 @@ def fleet_formatter_view(request):
 @members_and_blues()
 def services_view(request):
     logger.debug("services_view called by user %s" % request.user)
-    auth = AuthServicesInfo.objects.get(user=request.user)
-    char = None
-    if auth.main_char_id:
-        try:
-            char = EveCharacter.objects.get(character_id=auth.main_char_id)
-        except EveCharacter.DoesNotExist:
-            messages.warning(request, "There's a problem with your main character. Please select a new one.")
+    auth = request.auth_info
 
     context = {'service_ctrls': []}
-    for fn in get_hooks('services_hook'):
+    for svc in get_hook_instances('services_hook'):
         # Render hooked services controls
-        svc = fn()
         if svc.show_service_ctrl(request.user, auth.state):
             context['service_ctrls'].append(svc.render_services_ctrl(request))
 
@@ -0,0 +1,42 @@
+from __future__ import unicode_literals
+
+import logging
+
+import requests
+from celery import task
+
+from eveonline.managers import EveManager
+from notifications import notify
+from services.managers.srp_manager import srpManager
+from srp.models import SrpUserRequest
+
+logger = logging.getLogger(__name__)
+
+
+@task(bind=True, max_retries=5)
+def update_srp_request_kill_data(self, pk):
+    """
+    Fill in the ship and loss value of an SRP request from its killboard link
+    :param pk: SrpUserRequest primary key
+    """
+    try:
+        srp_request = SrpUserRequest.objects.select_related('character__user', 'srp_fleet_main').get(pk=pk)
+    except SrpUserRequest.DoesNotExist:
+        return
+    try:
+        ship_type_id, ship_value = srpManager.get_kill_data(srpManager.get_kill_id(srp_request.killboard_link))
+    except ValueError:
+        logger.info("Removing SRP request %s with invalid killmail link %s" % (pk, srp_request.killboard_link))
+        if srp_request.character.user:
+            notify(srp_request.character.user, "SRP request for %s rejected" % srp_request.srp_fleet_main,
+                   message="Your SRP request killmail link %s is invalid. Please make sure you are using "
+                           "zKillboard." % srp_request.killboard_link, level="danger")
+        srp_request.delete()
+        return
+    except requests.RequestException as e:
+        logger.warning("Unable to reach killboard for SRP request %s, retrying: %s" % (pk, e))
+        raise self.retry(exc=e, countdown=60)
+    srp_request.srp_ship_name = EveManager.get_itemtype(ship_type_id).name
+    srp_request.kb_total_loss = ship_value
+    srp_request.save()
+    logger.info("Updated SRP request %s with kill data for a %s" % (pk, srp_request.srp_ship_name))
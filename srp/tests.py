@@ -1 +1,151 @@
-# Create your tests here.
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+try:
+    # Py3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    # Py2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import json
+import threading
+
+import requests
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from alliance_auth.tests.auth_utils import AuthUtils
+from alliance_auth.tests.cache_utils import LOCMEM_CACHE
+
+from eveonline.models import EveCharacter
+from notifications.models import Notification
+from services.managers.srp_manager import srpManager
+
+from .models import SrpFleetMain, SrpUserRequest
+from .tasks import update_srp_request_kill_data
+
+
+KILLS = {
+    '100': [{'victim': {'shipTypeID': 587}, 'zkb': {'totalValue': 1000000.0}}],
+    '101': [{'victim': {'shipTypeID': 24690}, 'zkb': {'totalValue': 250000000.0}}],
+}
+# kill IDs answered with a page which isn't JSON, as during killboard maintenance
+MAINTENANCE = ('500',)
+
+
+class StubKillboardHandler(BaseHTTPRequestHandler):
+    """
+    Serves kills from KILLS at /api/killID/<id>, like zKillboard
+    """
+    def do_GET(self):
+        self.server.requested.append(self.path)
+        kill_id = self.path.rstrip('/').split('/')[-1]
+        if kill_id in MAINTENANCE:
+            body, content_type = b'<html><body>Down for maintenance</body></html>', 'text/html'
+        else:
+            body, content_type = json.dumps(KILLS.get(kill_id, [])).encode('utf-8'), 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(CACHES=LOCMEM_CACHE, LANGUAGE_CODE='en')
+class SrpKillDataTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = HTTPServer(('127.0.0.1', 0), StubKillboardHandler)
+        self.server.requested = []
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        patcher = mock.patch('services.managers.srp_manager.KILLBOARD_URL',
+                             'http://127.0.0.1:%s/api/killID/%%s' % self.server.server_address[1])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = AuthUtils.create_member('member')
+        AuthUtils.add_main_character(self.user, 'Main', 10, corp_id=1, corp_name='Test Corp')
+        self.fleet = SrpFleetMain.objects.create(fleet_name='Test Fleet', fleet_time=timezone.now(),
+                                                 fleet_srp_code='CODE',
+                                                 fleet_commander=EveCharacter.objects.get(character_id=10))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_kill_data_cached(self):
+        self.assertEqual(srpManager.get_kill_data('100'), (587, 1000000.0))
+        self.assertEqual(srpManager.get_kill_data('100'), (587, 1000000.0))
+
+        self.assertEqual(self.server.requested, ['/api/killID/100'])
+
+    def test_get_kill_data_invalid(self):
+        with self.assertRaises(ValueError):
+            srpManager.get_kill_data('999')
+        with self.assertRaises(ValueError):
+            srpManager.get_kill_data('')
+
+    def test_get_kill_data_unreadable(self):
+        with self.assertRaises(requests.RequestException):
+            srpManager.get_kill_data('500')
+
+    def make_request(self, killboard_link):
+        return SrpUserRequest.objects.create(killboard_link=killboard_link, srp_fleet_main=self.fleet,
+                                             character=EveCharacter.objects.get(character_id=10))
+
+    @mock.patch('srp.tasks.EveManager')
+    def test_update_srp_request_kill_data(self, manager):
+        manager.get_itemtype.return_value.name = 'Rifter'
+        srp_request = self.make_request('https://zkillboard.com/kill/100/')
+
+        update_srp_request_kill_data(srp_request.pk)
+
+        srp_request = SrpUserRequest.objects.get(pk=srp_request.pk)
+        self.assertEqual(srp_request.srp_ship_name, 'Rifter')
+        self.assertEqual(srp_request.kb_total_loss, 1000000)
+        manager.get_itemtype.assert_called_once_with(587)
+
+    def test_update_srp_request_kill_data_invalid(self):
+        srp_request = self.make_request('https://zkillboard.com/kill/999/')
+
+        update_srp_request_kill_data(srp_request.pk)
+
+        self.assertFalse(SrpUserRequest.objects.filter(pk=srp_request.pk).exists())
+        self.assertTrue(Notification.objects.filter(user=self.user, level='danger').exists())
+
+    def test_update_srp_request_kill_data_unreadable(self):
+        srp_request = self.make_request('https://zkillboard.com/kill/500/')
+
+        with self.assertRaises(requests.RequestException):
+            update_srp_request_kill_data(srp_request.pk)
+
+        self.assertTrue(SrpUserRequest.objects.filter(pk=srp_request.pk).exists())
+        self.assertFalse(Notification.objects.filter(user=self.user).exists())
+
+    @mock.patch('srp.views.update_srp_request_kill_data')
+    @mock.patch('srp.views.ASYNC_KILL_DATA', True)
+    def test_request_view_async(self, task):
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse('auth_srp_request_view', args=['CODE']),
+                                    {'killboard_link': 'https://zkillboard.com/kill/100/'})
+
+        self.assertEqual(response.status_code, 200)
+        srp_request = SrpUserRequest.objects.get(srp_fleet_main=self.fleet)
+        task.delay.assert_called_once_with(srp_request.pk)
+        self.assertEqual(self.server.requested, [])
@@ -1,4 +1,5 @@
 from __future__ import unicode_literals
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.decorators import permission_required
@@ -12,15 +13,20 @@ from srp.form import SrpFleetUserRequestForm
 from srp.form import SrpFleetUpdateCostForm
 from srp.form import SrpFleetMainUpdateForm
 from services.managers.srp_manager import srpManager
+from srp.tasks import update_srp_request_kill_data
 from notifications import notify
 from django.utils import timezone
 from authentication.decorators import members_and_blues
+import requests
 import uuid
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# optional setting to accept SRP requests straight away and fetch their kill data in the background
+ASYNC_KILL_DATA = getattr(settings, 'SRP_ASYNC_KILL_DATA', False)
+
 
 def random_string(string_length=10):
     """Returns a random string of length string_length."""
@@ -216,26 +222,43 @@ def srp_request_view(request, fleet_srp):
             srp_request.character = character
             srp_request.srp_fleet_main = srp_fleet_main
 
-            try:
-                srp_kill_link = srpManager.get_kill_id(srp_request.killboard_link)
-                (ship_type_id, ship_value) = srpManager.get_kill_data(srp_kill_link)
-            except ValueError:
-                logger.debug("User %s Submitted Invalid Killmail Link %s or server could not be reached" % (
-                    request.user, srp_request.killboard_link))
-                # THIS SHOULD BE IN FORM VALIDATION
+            srp_kill_link = srpManager.get_kill_id(srp_request.killboard_link)
+            if not srp_kill_link:
+                logger.debug("User %s Submitted Invalid Killmail Link %s" % (request.user, srp_request.killboard_link))
                 messages.error(request,
                                "Your SRP request Killmail link is invalid. Please make sure you are using zKillboard.")
                 return redirect("auth_srp_management_view")
-            srp_ship_name = EveManager.get_itemtype(ship_type_id).name
-            srp_request.srp_ship_name = srp_ship_name
-            kb_total_loss = ship_value
-            srp_request.kb_total_loss = kb_total_loss
-            srp_request.post_time = post_time
-            srp_request.save()
-            completed = True
-            logger.info("Created SRP Request on behalf of user %s for fleet name %s" % (
-                request.user, srp_fleet_main.fleet_name))
-            messages.success(request, 'Submitted SRP request for your %s.' % srp_ship_name)
+
+            if ASYNC_KILL_DATA:
+                # don't hold up the request waiting on the killboard
+                srp_request.post_time = post_time
+                srp_request.save()
+                update_srp_request_kill_data.delay(srp_request.pk)
+                completed = True
+                logger.info("Created SRP Request on behalf of user %s for fleet name %s, queued kill data update" % (
+                    request.user, srp_fleet_main.fleet_name))
+                messages.success(request, 'Submitted SRP request. Your loss will be checked shortly.')
+            else:
+                try:
+                    (ship_type_id, ship_value) = srpManager.get_kill_data(srp_kill_link)
+                except (ValueError, requests.RequestException):
+                    logger.debug("User %s Submitted Invalid Killmail Link %s or server could not be reached" % (
+                        request.user, srp_request.killboard_link))
+                    # THIS SHOULD BE IN FORM VALIDATION
+                    messages.error(request,
+                                   "Your SRP request Killmail link is invalid. Please make sure you are using "
+                                   "zKillboard.")
+                    return redirect("auth_srp_management_view")
+                srp_ship_name = EveManager.get_itemtype(ship_type_id).name
+                srp_request.srp_ship_name = srp_ship_name
+                kb_total_loss = ship_value
+                srp_request.kb_total_loss = kb_total_loss
+                srp_request.post_time = post_time
+                srp_request.save()
+                completed = True
+                logger.info("Created SRP Request on behalf of user %s for fleet name %s" % (
+                    request.user, srp_fleet_main.fleet_name))
+                messages.success(request, 'Submitted SRP request for your %s.' % srp_ship_name)
 
     else:
         logger.debug("Returning blank SrpFleetUserRequestForm")
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 from django.contrib import admin
 
-from timerboard.models import Timer
+from timerboard.models import Timer, ArchivedTimer
 
 admin.site.register(Timer)
+admin.site.register(ArchivedTimer)
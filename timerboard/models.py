@@ -8,8 +8,9 @@ from eveonline.models import EveCorporationInfo
 
 
 @python_2_unicode_compatible
-class Timer(models.Model):
+class BaseTimer(models.Model):
     class Meta:
+        abstract = True
         ordering = ['eve_time']
 
     details = models.CharField(max_length=254, default="")
@@ -26,3 +27,15 @@ class Timer(models.Model):
 
     def __str__(self):
         return str(self.system) + ' ' + str(self.objective)
+
+
+class Timer(BaseTimer):
+    class Meta(BaseTimer.Meta):
+        index_together = (('corp_timer', 'eve_corp', 'eve_time'),)
+
+
+class ArchivedTimer(BaseTimer):
+    """
+    Timers long past, moved out of the Timer table by timerboard.tasks.archive_timers
+    """
+    archived = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,43 @@
+from __future__ import unicode_literals
+
+import datetime
+import logging
+
+from celery.task import periodic_task
+from celery.task.schedules import crontab
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from timerboard.models import Timer, ArchivedTimer
+
+logger = logging.getLogger(__name__)
+
+# optional settings for how many days after expiring timers are archived, and how many are moved at a time
+ARCHIVE_AFTER_DAYS = int(getattr(settings, 'TIMERBOARD_ARCHIVE_AFTER_DAYS', 30))
+ARCHIVE_BATCH_SIZE = int(getattr(settings, 'TIMERBOARD_ARCHIVE_BATCH_SIZE', 500))
+
+ARCHIVED_FIELDS = ('details', 'system', 'planet_moon', 'structure', 'objective', 'eve_time', 'important',
+                   'eve_character_id', 'eve_corp_id', 'corp_timer', 'user_id')
+
+
+@periodic_task(run_every=crontab(minute=0, hour=3))
+def archive_timers():
+    """
+    Move timers which expired more than ARCHIVE_AFTER_DAYS ago into the ArchivedTimer table
+    :return: number of timers archived
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            timers = list(Timer.objects.filter(eve_time__lt=cutoff).order_by('eve_time')[:ARCHIVE_BATCH_SIZE])
+            if not timers:
+                break
+            ArchivedTimer.objects.bulk_create([
+                ArchivedTimer(**dict((field, getattr(timer, field)) for field in ARCHIVED_FIELDS)) for timer in timers])
+            Timer.objects.filter(pk__in=[timer.pk for timer in timers]).delete()
+        archived += len(timers)
+    if archived:
+        logger.info("Archived %s timers which expired before %s" % (archived, cutoff))
+    return archived
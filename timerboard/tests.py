@@ -1 +1,79 @@
-# Create your tests here.
+from __future__ import unicode_literals
+
+try:
+    # Py3
+    from unittest import mock
+except ImportError:
+    # Py2
+    import mock
+
+import datetime
+
+from django.contrib.auth.models import Permission
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from alliance_auth.tests.auth_utils import AuthUtils
+
+from eveonline.models import EveCharacter, EveCorporationInfo
+
+from .models import Timer, ArchivedTimer
+from .tasks import archive_timers
+
+
+@override_settings(LANGUAGE_CODE='en')
+class TimerboardTestCase(TestCase):
+    def setUp(self):
+        self.user = AuthUtils.create_member('member')
+        AuthUtils.add_main_character(self.user, 'Main', 10, corp_id=1, corp_name='Test Corp')
+        self.user.user_permissions.add(Permission.objects.get(codename='timer_view'))
+        self.character = EveCharacter.objects.get(character_id=10)
+        self.corp = EveCorporationInfo.objects.create(corporation_id=1, corporation_name='Test Corp',
+                                                      corporation_ticker='TEST', member_count=1)
+
+    def make_timer(self, system, days, corp_timer=False):
+        return Timer.objects.create(system=system, eve_time=timezone.now() + datetime.timedelta(days=days),
+                                    eve_character=self.character, eve_corp=self.corp, user=self.user,
+                                    corp_timer=corp_timer)
+
+    def test_timer_view(self):
+        self.make_timer('Future 2', 2)
+        self.make_timer('Future 1', 1)
+        for i in range(3):
+            self.make_timer('Past %s' % i, -1 - i)
+        self.make_timer('Corp', 1, corp_timer=True)
+        for i in range(3):
+            self.make_timer('Past Corp %s' % i, -1 - i, corp_timer=True)
+        self.client.force_login(self.user)
+
+        with mock.patch('timerboard.views.PAST_TIMERS_PER_PAGE', 2):
+            response = self.client.get(reverse('auth_timer_view'))
+            self.assertEqual(response.context['closest_timer'].system, 'Future 1')
+            self.assertEqual([t.system for t in response.context['future_timers']], ['Future 1', 'Future 2'])
+            self.assertEqual([t.system for t in response.context['past_timers']], ['Past 0', 'Past 1'])
+            self.assertEqual([t.system for t in response.context['corp_timers']],
+                             ['Corp', 'Past Corp 0', 'Past Corp 1'])
+
+            response = self.client.get(reverse('auth_timer_view'), {'page': 2})
+            self.assertEqual([t.system for t in response.context['past_timers']], ['Past 2'])
+            self.assertEqual([t.system for t in response.context['corp_timers']],
+                             ['Corp', 'Past Corp 0', 'Past Corp 1'])
+
+            response = self.client.get(reverse('auth_timer_view'), {'corp_page': 2})
+            self.assertEqual([t.system for t in response.context['past_timers']], ['Past 0', 'Past 1'])
+            self.assertEqual([t.system for t in response.context['corp_timers']], ['Corp', 'Past Corp 2'])
+            self.assertContains(response, 'corp_page=1')
+
+    def test_archive_timers(self):
+        self.make_timer('Future', 1)
+        self.make_timer('Recent', -1)
+        old = self.make_timer('Old', -60)
+
+        self.assertEqual(archive_timers(), 1)
+
+        self.assertEqual(set(Timer.objects.values_list('system', flat=True)), {'Future', 'Recent'})
+        archived = ArchivedTimer.objects.get()
+        self.assertEqual((archived.system, archived.eve_time, archived.eve_corp), ('Old', old.eve_time, self.corp))
+        self.assertIsNotNone(archived.archived)
+        self.assertEqual(archive_timers(), 0)
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 import datetime
 
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.decorators import permission_required
@@ -8,6 +9,7 @@ from django.shortcuts import get_object_or_404
 from authentication.decorators import members_and_blues
 from django.utils import timezone
 from django.contrib import messages
+from alliance_auth.pagination import get_page
 from authentication.states import MEMBER_STATE, BLUE_STATE
 from authentication.models import AuthServicesInfo
 from eveonline.managers import EveManager
@@ -18,6 +20,8 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+PAST_TIMERS_PER_PAGE = int(getattr(settings, 'TIMERBOARD_PAST_TIMERS_PER_PAGE', 20))
+
 
 def timer_util_test(user):
     return AuthServicesInfo.objects.get(user=user).state in [BLUE_STATE, MEMBER_STATE]
@@ -34,23 +38,29 @@ def timer_view(request):
         corp = EveManager.get_corporation_info_by_id(char.corporation_id)
     else:
         corp = None
+    now = timezone.now()
+    timers = Timer.objects.filter(corp_timer=False).select_related('eve_character')
+    future_timers = list(timers.filter(eve_time__gte=now))
+    # future timers are ordered by eve_time so the closest is the first
+    closest_timer = future_timers[0] if future_timers else None
+    logger.debug("Determined closest timer is %s" % closest_timer)
+    # most recent first, a page at a time
+    past_timers = get_page(timers.filter(eve_time__lt=now).order_by('-eve_time'), request.GET.get('page', 1),
+                           PAST_TIMERS_PER_PAGE)
     if corp:
-        corp_timers = Timer.objects.all().filter(corp_timer=True).filter(eve_corp=corp)
+        corp_timers = Timer.objects.filter(corp_timer=True, eve_corp=corp).select_related('eve_character')
+        past_corp_timers = get_page(corp_timers.filter(eve_time__lt=now).order_by('-eve_time'),
+                                    request.GET.get('corp_page', 1), PAST_TIMERS_PER_PAGE)
+        corp_timers = list(corp_timers.filter(eve_time__gte=now)) + list(past_corp_timers)
     else:
         corp_timers = []
-    timer_list = Timer.objects.filter(corp_timer=False)
-    closest_timer = None
-    if timer_list:
-        closest_timer = \
-            sorted(list(Timer.objects.all().filter(corp_timer=False)), key=lambda d: (timezone.now()))[0]
-    logger.debug("Determined closest timer is %s" % closest_timer)
-    render_items = {'timers': Timer.objects.all().filter(corp_timer=False),
+        past_corp_timers = None
+    render_items = {'timers': future_timers + list(past_timers),
                     'corp_timers': corp_timers,
+                    'past_corp_timers': past_corp_timers,
                     'closest_timer': closest_timer,
-                    'future_timers': Timer.objects.all().filter(corp_timer=False).filter(
-                        eve_time__gte=datetime.datetime.now()),
-                    'past_timers': Timer.objects.all().filter(corp_timer=False).filter(
-                        eve_time__lt=datetime.datetime.now())}
+                    'future_timers': future_timers,
+                    'past_timers': past_timers}
 
     return render(request, 'registered/timermanagement.html', context=render_items)
 